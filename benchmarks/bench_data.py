@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+qstock数据层基准测试
+
+所有请求都由本地模拟服务（qstock.data.cassette）返回录制数据，不访问外部网络，
+逐个场景在独立子进程中运行，统计：
+    请求数/秒、单次调用和单个请求的p50/p99延迟、解析CPU时间（进程CPU时间减去
+    发送请求所用的线程CPU时间）、峰值内存（RSS），以及单次调用的内存分配：
+    tracemalloc峰值内存（alloc_peak_mb）和调用返回时新增并仍被引用的内存块数（alloc_blocks，
+    tracemalloc快照对比；CPython没有累计分配次数的计数，临时分配后又释放的块不计入）
+结果保存为JSON，便于对比不同qstock版本。
+请求数/秒和延迟是经过本地模拟服务的端到端数据，包括模拟服务本身的开销，
+报告中的stand_in_server是模拟服务在同样配置下单连接的请求数/秒上限，
+场景数据接近该上限时瓶颈在模拟服务而不在qstock。
+
+用法：
+    # 生成合成数据（规模可调），无需网络
+    python benchmarks/bench_data.py --synthetic
+    # 在能访问网络的机器上录制真实数据
+    python benchmarks/bench_data.py --record benchmarks/data/live.jsonl.gz
+    # 运行基准测试
+    python benchmarks/bench_data.py --cassette benchmarks/data/synthetic.jsonl.gz --latency 0.02 --jitter 0.005
+    # 对比两次结果
+    python benchmarks/bench_data.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+
+import requests
+
+from qstock.data import cassette
+
+DATA_DIR = ROOT / 'data'
+RESULT_DIR = ROOT / 'results'
+SYNTHETIC = DATA_DIR / 'synthetic.jsonl.gz'
+
+START = '20230101'
+END = '20231229'
+REPORT = '2023-09-30'
+
+
+###############################################################################
+# 场景
+def universe(n):
+    '''从沪深A股行情中取前n只股票代码作为测试标的'''
+    from qstock.data.trade import market_realtime
+    return list(market_realtime('沪深A')['代码'])[:n]
+
+
+def scenarios():
+    from qstock.data import trade, money
+    return {
+        'market_realtime': lambda codes: trade.market_realtime('沪深A'),
+        'web_data': lambda codes: trade.web_data(codes[0], start=START, end=END),
+        'get_data_100': lambda codes: trade.get_data(codes[:100], start=START, end=END),
+        'get_data_1000': lambda codes: trade.get_data(codes[:1000], start=START, end=END),
+        'get_data_5000': lambda codes: trade.get_data(codes[:5000], start=START, end=END),
+        'hist_money': lambda codes: money.hist_money(codes[0]),
+        'company_indicator': lambda codes: trade.company_indicator(REPORT),
+        'ths_stock_money': lambda codes: money.ths_stock_money(),
+    }
+
+
+###############################################################################
+# 合成数据：按请求地址伪造与真实接口结构一致的返回
+def synthetic_payload(url, body, n_symbols, n_bars):
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query))
+    host, path = parts.netloc, parts.path
+    rnd = random.Random(url)
+
+    def quote(code, i):
+        return {'f12': code, 'f14': f'股票{code}', 'f3': round(rnd.uniform(-10, 10), 2),
+                'f2': round(rnd.uniform(2, 200), 2), 'f15': 11.2, 'f16': 10.1, 'f17': 10.5,
+                'f8': round(rnd.uniform(0, 20), 2), 'f10': 1.1, 'f9': 25.3,
+                'f5': rnd.randint(1000, 10 ** 7), 'f6': rnd.uniform(1e6, 1e10), 'f18': 10.6,
+                'f20': rnd.uniform(1e9, 1e12), 'f21': rnd.uniform(1e9, 1e12),
+                'f13': 1 if code.startswith('6') else 0, 'f124': 1703836800 + i}
+
+    def bars(fmt):
+        day = datetime(2023, 1, 3)
+        lines = []
+        close = 10.0
+        while len(lines) < n_bars:
+            if day.weekday() < 5:
+                close = round(close * (1 + rnd.uniform(-0.05, 0.05)), 2)
+                lines.append(fmt(day.strftime('%Y-%m-%d'), close))
+            day += timedelta(1)
+        return lines
+
+    if 'searchapi' in host:
+        code = params.get('input', '')
+        return {'QuotationCodeTable': {'Data': [
+            {'Code': code, 'QuoteID': ('1.' if code.startswith('6') else '0.') + code}]}}
+
+    if path == '/api/qt/clist/get':
+        codes = [f'{600000 + i:06d}' if i % 2 else f'{i:06d}' for i in range(1, n_symbols + 1)]
+        return {'data': {'total': len(codes), 'diff': [quote(c, i) for i, c in enumerate(codes)]}}
+
+    if path == '/api/qt/ulist.np/get':
+        secids = params.get('secids', '').split(',')
+        return {'data': {'total': len(secids),
+                         'diff': [dict(quote(s.split('.')[-1], i), f14='上证指数')
+                                  for i, s in enumerate(secids)]}}
+
+    if path == '/api/qt/stock/kline/get':
+        code = params['secid'].split('.')[-1]
+        klines = bars(lambda d, c: f'{d},{c},{c},{round(c * 1.02, 2)},{round(c * 0.98, 2)},'
+                                   f'{rnd.randint(10 ** 4, 10 ** 6)},{rnd.uniform(1e7, 1e9):.2f},'
+                                   f'4.00,{rnd.uniform(-5, 5):.2f},0.10,{rnd.uniform(0, 10):.2f}')
+        return {'data': {'code': code, 'name': f'股票{code}', 'klines': klines}}
+
+    if path == '/api/qt/stock/fflow/daykline/get':
+        code = params['secid'].split('.')[-1]
+        klines = bars(lambda d, c: ','.join([d] + [f'{rnd.uniform(-1e8, 1e8):.1f}' for _ in range(5)]
+                                            + [f'{rnd.uniform(-20, 20):.2f}' for _ in range(5)]
+                                            + [str(c), f'{rnd.uniform(-5, 5):.2f}']))
+        return {'data': {'code': code, 'name': f'股票{code}', 'klines': klines}}
+
+    if 'securities/api/data/get' in path:
+        return {'result': {'pages': 1, 'data': [
+            {'REPORT_DATE': f'{REPORT} 00:00:00', 'DATATYPE': '2023年 三季报'},
+            {'REPORT_DATE': '2023-06-30 00:00:00', 'DATATYPE': '2023年 中报'}]}}
+
+    if path == '/api/data/get':
+        page, size = int(params.get('p', 1)), int(params.get('ps', 500))
+        pages = -(-n_symbols // size)
+        if page > pages:
+            return {'result': None, 'success': False}
+        rows = []
+        for i in range((page - 1) * size, min(page * size, n_symbols)):
+            rows.append({'SECURITY_CODE': f'{i:06d}', 'SECURITY_NAME_ABBR': f'股票{i:06d}',
+                         'NOTICE_DATE': '2023-10-28 00:00:00',
+                         **{k: rnd.uniform(-100, 1e9) for k in (
+                             'TOTAL_OPERATE_INCOME', 'YSTZ', 'YSHZ', 'PARENT_NETPROFIT', 'SJLTZ',
+                             'SJLHZ', 'BASIC_EPS', 'BPS', 'WEIGHTAVG_ROE', 'XSMLL', 'MGJYXJJE')}})
+        return {'result': {'pages': pages, 'data': rows}, 'success': True}
+
+    if '10jqka' in host and '/funds/ggzjl/' in path:
+        pages = -(-n_symbols // 50)
+        head = ''.join(f'<th>{c}</th>' for c in
+                       ['序号', '股票代码', '股票简称', '最新价', '涨跌幅', '换手率',
+                        '流入资金(元)', '流出资金(元)', '净额(元)', '成交额(元)'])
+        body_rows = []
+        for i in range(50):
+            net = rnd.uniform(-5e4, 5e4)
+            net = f'{net / 1e4:.2f}亿' if abs(net) > 1e4 else f'{net:.2f}万'
+            body_rows.append('<tr>' + ''.join(f'<td>{v}</td>' for v in [
+                i + 1, f'{rnd.randint(1, 699999):06d}', f'股票{i}', f'{rnd.uniform(2, 200):.2f}',
+                f'{rnd.uniform(-10, 10):.2f}%', f'{rnd.uniform(0, 20):.2f}%', '1.2亿',
+                '1.1亿', net, '2.3亿']) + '</tr>')
+        return (f'<table class="m-table J-ajax-table"><thead><tr>{head}</tr></thead>'
+                f'<tbody>{"".join(body_rows)}</tbody></table>'
+                f'<div class="m-page J-ajax-page"><span class="page_info">1/{pages}</span></div>')
+
+    return None
+
+
+def build_synthetic(path, n_symbols, n_bars):
+    '''运行所有场景，由合成数据应答并录制成录制文件'''
+
+    def send(original, session, request, **kwargs):
+        payload = synthetic_payload(request.url, request.body, n_symbols, n_bars)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        if payload is None:
+            response.status_code = 404
+            response._content = b''
+            return response
+        response.status_code = 200
+        if isinstance(payload, str):
+            response._content = payload.encode('utf-8')
+            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        else:
+            response._content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        response.encoding = 'utf-8'
+        return response
+
+    with cassette.patch_send(send):
+        with cassette.record(path, mode='w'):
+            codes = universe(5000)
+            for name, fn in scenarios().items():
+                print(f'synthesizing {name}', file=sys.stderr)
+                fn(codes)
+
+
+def record_live(path):
+    '''访问真实接口录制所有场景'''
+    with cassette.record(path, mode='w'):
+        codes = universe(5000)
+        for name, fn in scenarios().items():
+            print(f'recording {name}', file=sys.stderr)
+            fn(codes)
+
+
+###############################################################################
+# 单个场景（在子进程中运行）
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def run_scenario(name, server_url, repeat):
+    fn = scenarios()[name]
+    request_times = []
+    send_cpu = [0.0]
+
+    def send(original, session, request, **kwargs):
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            return original(session, request, **kwargs)
+        finally:
+            request_times.append(time.perf_counter() - t0)
+            send_cpu[0] += time.thread_time() - c0
+
+    with cassette.replay(server_url):
+        codes = universe(5000)
+        with cassette.patch_send(send):
+            calls, cpu, parse_cpu, latencies = [], [], [], []
+            n_requests = 0
+            for _ in range(repeat):
+                request_times.clear()
+                send_cpu[0] = 0.0
+                t0, c0 = time.perf_counter(), time.process_time()
+                fn(codes)
+                calls.append(time.perf_counter() - t0)
+                cpu.append(time.process_time() - c0)
+                parse_cpu.append(cpu[-1] - send_cpu[0])
+                n_requests += len(request_times)
+                latencies.extend(request_times)
+            # 单独一次调用统计内存分配，调用结果在对比快照时仍被引用
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            result = fn(codes)
+            _, alloc_peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            del result
+            own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            diff = after.filter_traces(own).compare_to(before.filter_traces(own), 'filename')
+            alloc_blocks = sum(stat.count_diff for stat in diff if stat.count_diff > 0)
+
+    wall = sum(calls)
+    return {
+        'repeat': repeat,
+        'requests_per_call': n_requests / repeat,
+        'requests_per_sec': round(n_requests / wall, 2) if wall else None,
+        'call_p50_ms': round(percentile(calls, 50) * 1000, 3),
+        'call_p99_ms': round(percentile(calls, 99) * 1000, 3),
+        'request_p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'request_p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'cpu_s': round(sum(cpu) / repeat, 4),
+        'parse_cpu_s': round(sum(parse_cpu) / repeat, 4),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'alloc_peak_mb': round(alloc_peak / 2 ** 20, 2),
+        'alloc_blocks': alloc_blocks,
+    }
+
+
+def server_baseline(server_url, n=200):
+    '''
+    模拟服务的基准：单个keep-alive连接连续请求一个很小的响应，
+    作为场景请求数/秒和请求延迟的参照上限
+    '''
+    session = requests.Session()
+    url = f'{server_url}/http/bench.local/ping'
+    session.get(url)
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        session.get(url)
+        times.append(time.perf_counter() - t0)
+    return {
+        'requests_per_sec': round(n / sum(times), 2),
+        'request_p50_ms': round(percentile(times, 50) * 1000, 3),
+        'request_p99_ms': round(percentile(times, 99) * 1000, 3),
+    }
+
+
+###############################################################################
+# 汇总
+def qstock_version():
+    try:
+        from importlib.metadata import version
+        return version('qstock')
+    except Exception:
+        pass
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def run_all(args):
+    names = args.only or list(scenarios())
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'qstock.data.cassette', str(args.cassette), '--port', str(args.port),
+         '--latency', str(args.latency), '--jitter', str(args.jitter)],
+        cwd=ROOT.parent, stdout=subprocess.PIPE, text=True)
+    # 等待服务启动（录制文件较大时加载需要时间）
+    server_url = server.stdout.readline().split(' on ')[-1].strip()
+    results = {}
+    try:
+        baseline = server_baseline(server_url)
+        for name in names:
+            print(f'running {name} ...', file=sys.stderr)
+            out = subprocess.run(
+                [sys.executable, __file__, '--scenario', name, '--server', server_url,
+                 '--repeat', str(args.repeat)],
+                stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL,
+                text=True)
+            if out.returncode != 0:
+                results[name] = {'error': f'exit code {out.returncode}'}
+                continue
+            results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        server.terminate()
+        server.wait()
+
+    import pandas
+    report = {
+        'qstock': qstock_version(),
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'platform': platform.platform(),
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {'cassette': str(args.cassette), 'latency': args.latency,
+                   'jitter': args.jitter, 'repeat': args.repeat},
+        'stand_in_server': baseline,
+        'results': results,
+    }
+    out = Path(args.out) if args.out else (
+        RESULT_DIR / f"{report['qstock']}-{datetime.now():%Y%m%d%H%M%S}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print_table(results)
+    print(f"stand-in server ceiling: {baseline['requests_per_sec']} req/s, "
+          f"p50 {baseline['request_p50_ms']} ms (figures above are end-to-end through it)")
+    print(f'saved to {out}')
+
+
+def print_table(results, cols=('requests_per_sec', 'call_p50_ms', 'call_p99_ms',
+                               'parse_cpu_s', 'peak_rss_mb', 'alloc_peak_mb', 'alloc_blocks')):
+    print(f"{'scenario':<20}" + ''.join(f'{c:>18}' for c in cols))
+    for name, r in results.items():
+        print(f'{name:<20}' + ''.join(f'{str(r.get(c, "-")):>18}' for c in cols))
+
+
+def compare(old_path, new_path):
+    '''对比两次结果，输出新旧比值（>1表示数值变大）'''
+    old = json.loads(Path(old_path).read_text(encoding='utf-8'))
+    new = json.loads(Path(new_path).read_text(encoding='utf-8'))
+    cols = ('requests_per_sec', 'call_p50_ms', 'call_p99_ms', 'parse_cpu_s',
+            'peak_rss_mb', 'alloc_peak_mb', 'alloc_blocks')
+    print(f"{old['qstock']} -> {new['qstock']}")
+    print(f"{'scenario':<20}" + ''.join(f'{c:>18}' for c in cols))
+    for name, r in new['results'].items():
+        o = old['results'].get(name, {})
+        cells = []
+        for c in cols:
+            a, b = o.get(c), r.get(c)
+            cells.append(f'{b / a:.2f}x' if a and b is not None else '-')
+        print(f'{name:<20}' + ''.join(f'{c:>18}' for c in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='qstock数据层基准测试')
+    parser.add_argument('--cassette', default=str(SYNTHETIC), help='录制文件路径')
+    parser.add_argument('--synthetic', action='store_true', help='生成合成录制数据')
+    parser.add_argument('--symbols', type=int, default=5000, help='合成数据的股票数量')
+    parser.add_argument('--bars', type=int, default=242, help='合成数据每只股票的K线数量')
+    parser.add_argument('--record', metavar='PATH', help='访问真实接口录制数据')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两次结果')
+    parser.add_argument('--only', nargs='+', help='只运行指定场景')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的重复次数')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟服务平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='模拟服务延迟抖动（秒）')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--out', help='结果JSON路径，默认benchmarks/results/')
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--server', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.server, args.repeat)))
+    elif args.compare:
+        compare(*args.compare)
+    elif args.record:
+        record_live(args.record)
+    elif args.synthetic:
+        build_synthetic(args.cassette, args.symbols, args.bars)
+    else:
+        if not Path(args.cassette).exists():
+            parser.error(f'{args.cassette} 不存在，先运行 --synthetic 或 --record')
+        run_all(args)
+
+
+if __name__ == '__main__':
+    main()
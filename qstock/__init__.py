@@ -4,34 +4,73 @@
 @Author  ：Jinyi Zhang 
 @Date    ：2022/9/29 20:20 
 '''
+from qstock.data.util import lazy_exports
+
 #数据模块
 #股票、债券、期货、基金等交易行情数据
 from qstock.data.trade import *
+#原来qs.session是后导入的问财模块中的session，交给延迟导入处理
+del session
 
-#新闻数据
-from qstock.data.news import *
-#股票基本面数据
-from qstock.data.fundamental import *
-##行业、概念板块数据
-from qstock.data.industry import *
-#资金流向数据
-from qstock.data.money import *
-#宏观经济数据
-from qstock.data.macro import *
+#其余模块在第一次访问qs.xxx时才导入（PEP 562），顺序与原来的from ... import *一致
+__getattr__, __dir__ = lazy_exports(__name__, globals(), [
+    #交易日历
+    'qstock.data.trade_calendar',
+    #K线周期转换
+    'qstock.data.resample',
+    #本地复权
+    'qstock.data.adjust',
+    #逐笔成交分析
+    'qstock.data.tick',
+    #五档行情快照轮询
+    'qstock.data.snapshot',
+    #新闻数据
+    'qstock.data.news',
+    #股票基本面数据
+    'qstock.data.fundamental',
+    ('qstock.data.util', ['cn_headers']),
+    ##行业、概念板块数据
+    'qstock.data.industry',
+    #股票-板块成份关系索引
+    'qstock.data.member_index',
+    #资金流向数据
+    'qstock.data.money',
+    #资金流向本地增量存储
+    'qstock.data.money_store',
+    #财务报表本地仓库（point-in-time）
+    'qstock.data.fin_store',
+    #基金重仓股与股票-基金持仓索引
+    'qstock.data.fund_holding',
+    #基金净值本地增量存储
+    'qstock.data.fund_store',
+    #可转债估值监控
+    'qstock.data.cb_monitor',
+    #宏观经济数据
+    'qstock.data.macro',
 
-#问财数据
-from qstock.data.wencai import *
+    #问财数据
+    'qstock.data.wencai',
+    ('qstock.data.wencai', ['session', 'cookies']),
+    #HTTP录制/回放、数据接口运行指标
+    ('qstock.data.cassette', ['record', 'replay', 'serve']),
+    ('qstock.data', ['metrics']),
 
-#可视化模块
-from qstock.plot.data_plot import *
-from qstock.plot.chart_plot import *
+    #可视化模块
+    'qstock.plot.data_plot',
+    'qstock.plot.chart_plot',
 
-#选股模块
-from qstock.stock.stock_pool import *
-from qstock.stock.ths_em_pool import *
+    #选股模块
+    'qstock.stock.stock_pool',
+    'qstock.stock.ths_em_pool',
+    'qstock.stock.board_index',
+    'qstock.stock.money_rank',
+    'qstock.stock.screener',
+    'qstock.stock.ta_pool',
+    'qstock.stock.limit_history',
 
-#回测模块
-from qstock.backtest.vec_backtest import *
-from qstock.backtest.turtle import *
+    #回测模块
+    'qstock.backtest.vec_backtest',
+    'qstock.backtest.turtle',
 
-from .backtest2 import *
\ No newline at end of file
+    'qstock.backtest2',
+])
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+本地复权：保存不复权日K线和除权除息事件，需要时计算前复权/后复权价格
+
+除权除息事件来自东方财富分红送配明细（RPT_SHAREBONUS_DET），全市场保存为一个文件，
+每天只需增量获取最近的除权除息事件；不复权K线用resample.save_bars缓存，只下载新增的K线。
+复权方式为等比复权：除权日复权比例 = (前收盘价 - 每股派息) / (1 + 每股送转) / 前收盘价，
+后复权因子为历次比例倒数的累乘，前复权价格 = 后复权价格 / 最新的后复权因子。
+成交量、成交额不复权。与东方财富直接下载的复权价格相比可能有小数位上的差异，
+且未考虑配股。
+"""
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.util import session, request_header, data_dir
+from qstock.data.resample import save_bars, load_bars
+
+price_cols = ('open', 'high', 'low', 'close', '开盘', '最高', '最低', '收盘')
+event_cols = ['code', 'ex_date', 'cash', 'shares']
+
+
+def fetch_dividend_events(code=None, start=None):
+    '''
+    从东方财富获取已确定除权除息日的分红送配事件
+    code:股票代码，默认全市场；start:只获取该日期之后的除权除息日，如'2023-01-01'
+    返回code、ex_date（除权除息日）、cash（每股派息，税前）、shares（每股送转股）
+    '''
+    url = 'https://datacenter-web.eastmoney.com/api/data/v1/get'
+    filters = ['(EX_DIVIDEND_DATE is not null)']
+    if code is not None:
+        filters.append(f'(SECURITY_CODE="{code}")')
+    if start is not None:
+        filters.append(f"(EX_DIVIDEND_DATE>='{pd.Timestamp(start):%Y-%m-%d}')")
+    params = {
+        'sortColumns': 'EX_DIVIDEND_DATE',
+        'sortTypes': '-1',
+        'pageSize': '500',
+        'pageNumber': '1',
+        'reportName': 'RPT_SHAREBONUS_DET',
+        'columns': 'SECURITY_CODE,EX_DIVIDEND_DATE,PRETAX_BONUS_RMB,BONUS_IT_RATIO',
+        'filter': ''.join(filters),
+        'source': 'WEB',
+    }
+
+    def get_page(page):
+        r = session.get(url, headers=request_header, params=dict(params, pageNumber=page))
+        result = r.json()['result']
+        return result or {'pages': 0, 'data': []}
+
+    first = get_page(1)
+    pages = [first['data']]
+    if first['pages'] > 1:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            pages += [p['data'] for p in executor.map(get_page, range(2, first['pages'] + 1))]
+    rows = [row for page in pages for row in page]
+    if not rows:
+        return pd.DataFrame(columns=event_cols)
+    df = pd.DataFrame(rows)
+    df = pd.DataFrame({
+        'code': df['SECURITY_CODE'],
+        'ex_date': pd.to_datetime(df['EX_DIVIDEND_DATE']).dt.normalize(),
+        # 原始数据为每10股
+        'cash': pd.to_numeric(df['PRETAX_BONUS_RMB'], errors='coerce').fillna(0) / 10,
+        'shares': pd.to_numeric(df['BONUS_IT_RATIO'], errors='coerce').fillna(0) / 10,
+    })
+    return merge_events(df)
+
+
+def merge_events(df):
+    '''同一天的多条记录（如同时派息和送转）合并为一条'''
+    return df.groupby(['code', 'ex_date'], as_index=False)[['cash', 'shares']].sum()[event_cols]
+
+
+def dividend_events(code_list=None, refresh=True):
+    '''
+    本地保存的全市场除权除息事件，首次调用时下载全部历史（约一百多页，并发获取）
+    之后每天第一次调用时只获取最近30天之后的除权除息日（包括已公告、尚未除权的事件）
+    code_list:只返回这些代码的事件；refresh=False时不检查更新
+    '''
+    path = data_dir('adjust') / 'events.pkl'
+    today = datetime.now().strftime('%Y-%m-%d')
+    if path.exists():
+        store = pd.read_pickle(path)
+        if refresh and store['updated'] < today:
+            start = pd.Timestamp(store['updated']) - timedelta(days=30)
+            new = fetch_dividend_events(start=start)
+            events = store['events']
+            events = events[events['ex_date'] < start]
+            store = {'updated': today, 'events': pd.concat([events, new], ignore_index=True)}
+            pd.to_pickle(store, path)
+    else:
+        store = {'updated': today, 'events': fetch_dividend_events()}
+        pd.to_pickle(store, path)
+    events = store['events']
+    if code_list is not None:
+        if isinstance(code_list, str):
+            code_list = [code_list]
+        events = events[events['code'].isin(code_list)]
+    return events.sort_values(['code', 'ex_date'], ignore_index=True)
+
+
+def adj_factor(df, events=None):
+    '''
+    df为不复权的K线面板数据（索引为日期，多只股票以code列区分），返回与df行对应的后复权因子
+    events:除权除息事件，默认使用dividend_events()
+    '''
+    codes = df['code'].to_numpy() if 'code' in df.columns else np.full(len(df), '')
+    if events is None:
+        events = dividend_events(list(pd.unique(codes)))
+    dates = pd.DatetimeIndex(df.index).normalize().to_numpy()
+    close = df['close' if 'close' in df.columns else '收盘'].to_numpy(dtype=float)
+    factor = np.ones(len(df))
+    by_code = dict(tuple(events.groupby('code')))
+    for code, rows in pd.Series(np.arange(len(df))).groupby(codes).indices.items():
+        ev = by_code.get(code)
+        if ev is None or not len(rows):
+            continue
+        rows = rows[np.argsort(dates[rows], kind='stable')]
+        row_dates = dates[rows]
+        ex_dates = ev['ex_date'].to_numpy()
+        # 除权日前一根K线的收盘价
+        prev = np.searchsorted(row_dates, ex_dates, side='left') - 1
+        ok = (prev >= 0) & (ex_dates <= row_dates[-1])
+        if not ok.any():
+            continue
+        pre_close = close[rows[prev[ok]]]
+        ratio = (pre_close - ev['cash'].to_numpy()[ok]) / (1 + ev['shares'].to_numpy()[ok]) / pre_close
+        cum = np.r_[1.0, np.cumprod(1 / ratio)]
+        factor[rows] = cum[np.searchsorted(ex_dates[ok], row_dates, side='right')]
+    return pd.Series(factor, index=df.index, name='factor')
+
+
+def adjust_bars(df, fqt=1, events=None):
+    '''
+    把不复权K线（get_data(..., fqt=0)的结果）转换为复权K线，向量化计算
+    fqt:0不复权，1前复权，2后复权
+    '''
+    if fqt == 0 or df.empty:
+        return df
+    factor = adj_factor(df, events).to_numpy()
+    if fqt == 1:
+        # 除以每只股票最后一根K线的后复权因子
+        codes = df['code'] if 'code' in df.columns else pd.Series('', index=df.index)
+        last = pd.Series(factor, index=df.index).groupby(codes.to_numpy()).transform('last').to_numpy()
+        factor = factor / last
+    df = df.copy()
+    for col in df.columns.intersection(price_cols):
+        df[col] = df[col].to_numpy(dtype=float) * factor
+    return df
+
+
+def adjusted_data(code_list, start='19000101', end=None, fqt=1):
+    '''
+    获取复权日K线：本地缓存不复权日K线（只下载新增部分）和除权除息事件，本地计算复权价格
+    code_list:6位股票代码或其列表；start、end、fqt与get_data相同，fqt:0不复权，1前复权，2后复权
+    '''
+    from qstock.data.trade import get_data
+    from qstock.data.trade_calendar import latest_trade_date, latest_closed_trade_date
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    code_list = [str(c) for c in code_list]
+    end = pd.Timestamp(end or latest_trade_date())
+    cached = load_bars(code_list, 'd', 0)
+    last = {}
+    if not cached.empty:
+        last = pd.Series(pd.DatetimeIndex(cached.index)).groupby(cached['code'].to_numpy()).max().to_dict()
+    # 按最后缓存日期分组下载，没有缓存的股票下载全部历史（后复权需要上市以来的数据）
+    # 缓存的最后一根K线可能是盘中数据，只有已收盘的才跳过
+    closed = pd.Timestamp(latest_closed_trade_date())
+    groups = {}
+    for code in code_list:
+        since = last.get(code)
+        if since is not None and (since > end or since == end <= closed):
+            continue
+        key = '19000101' if since is None else since.strftime('%Y%m%d')
+        groups.setdefault(key, []).append(code)
+    for since, codes in groups.items():
+        save_bars(get_data(codes, start=since, end=end.strftime('%Y%m%d'), freq='d', fqt=0), 'd', 0)
+    df = load_bars(code_list, 'd', 0)
+    if df.empty:
+        return df
+    df = adjust_bars(df, fqt)
+    dates = pd.DatetimeIndex(df.index)
+    return df[(dates >= pd.Timestamp(start)) & (dates <= end)]
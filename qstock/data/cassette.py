@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP录制/回放层
+
+qstock的所有数据接口（包括直接调用requests.get的接口）最终都经过
+requests.Session.send，本模块在这一层拦截请求：
+record(path)：访问网络的同时把请求和响应录制到gzip压缩文件
+replay(path)：从录制文件回放，不访问网络
+serve(path)：启动本地HTTP服务返回录制数据，可设置延迟和抖动，
+             配合replay(server)把所有请求转发到本地服务
+
+用法：
+    with qs.record('market.jsonl.gz'):
+        qs.realtime_data()
+    with qs.replay('market.jsonl.gz'):
+        df = qs.realtime_data()
+    with qs.serve('market.jsonl.gz', latency=0.05, jitter=0.02) as server:
+        with qs.replay(server):
+            df = qs.realtime_data()
+"""
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from http.client import HTTPMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit
+
+import requests
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+
+# 每次请求都会变化、不影响返回内容的参数，生成请求键时忽略
+volatile_params = ('_', 'cb', 'callback', 'lastTime', 'last_time', 'sign')
+# 本地服务重新生成的逐跳响应头，回放时不照搬录制值
+hop_headers = ('content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    '''回放时录制文件中没有对应的请求'''
+
+
+def request_key(method, url, body=None):
+    '''
+    生成请求键：请求方法 + 去掉易变参数并排序后的URL + 请求体
+    '''
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in volatile_params)
+    key = f'{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}'
+    if query:
+        key += '?' + urlencode(query)
+    if body:
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        key += ' ' + body.decode('utf-8', 'replace')
+    return key
+
+
+def load_cassette(path):
+    '''读取录制文件，返回{请求键: [响应记录, ...]}'''
+    entries = {}
+    path = Path(path)
+    if not path.exists():
+        return entries
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                entries.setdefault(item['key'], []).append(item)
+    return entries
+
+
+def save_cassette(path, entries):
+    '''把{请求键: [响应记录, ...]}写入gzip压缩的json lines文件'''
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for items in entries.values():
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def response_headers(response):
+    '''完整的响应头[[名称, 值], ...]，同名响应头（如多个Set-Cookie）分别保留'''
+    raw = getattr(getattr(response, 'raw', None), 'headers', None)
+    if hasattr(raw, 'iteritems'):
+        return [[k, v] for k, v in raw.iteritems()]
+    return [[k, v] for k, v in response.headers.items()]
+
+
+def item_headers(item):
+    '''录制记录的响应头列表，兼容只保存了content_type的旧录制文件'''
+    if 'headers' in item:
+        return item['headers']
+    return [['Content-Type', item['content_type']]] if item.get('content_type') else []
+
+
+def dump_response(key, response):
+    item = {
+        'key': key,
+        'url': response.url,
+        'status': response.status_code,
+        'reason': response.reason,
+        'content_type': response.headers.get('Content-Type', ''),
+        'headers': response_headers(response),
+        'encoding': response.encoding,
+    }
+    # utf-8文本直接保存，压缩率更高；其他编码的内容保存为base64
+    try:
+        item['text'] = response.content.decode('utf-8')
+    except UnicodeDecodeError:
+        item['body'] = base64.b64encode(response.content).decode('ascii')
+    return item
+
+
+def item_content(item):
+    '''录制记录中的响应内容（bytes）'''
+    if 'text' in item:
+        return item['text'].encode('utf-8')
+    return base64.b64decode(item['body'])
+
+
+def build_response(item, request):
+    '''由录制记录构造requests.Response'''
+    response = requests.Response()
+    response.status_code = item['status']
+    response.reason = item.get('reason', '')
+    response._content = item_content(item)
+    response._content_consumed = True
+    # 与requests相同，同名响应头合并为逗号分隔的一项
+    headers = CaseInsensitiveDict()
+    for k, v in item_headers(item):
+        headers[k] = f'{headers[k]}, {v}' if k in headers else v
+    response.headers = headers
+    response.encoding = item.get('encoding')
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class Cassette:
+    '''
+    录制文件的内存表示，同一请求键的多次响应按录制顺序依次返回，
+    取完后重复返回最后一次响应
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = load_cassette(path)
+        self.cursor = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, response):
+        with self.lock:
+            self.entries.setdefault(key, []).append(dump_response(key, response))
+
+    def get(self, key):
+        with self.lock:
+            items = self.entries.get(key)
+            if not items:
+                return None
+            i = self.cursor.get(key, 0)
+            self.cursor[key] = i + 1
+            return items[min(i, len(items) - 1)]
+
+    def save(self):
+        save_cassette(self.path, self.entries)
+
+
+@contextmanager
+def patch_send(send):
+    '''
+    替换requests.Session.send，send(original_send, session, request, **kwargs)
+    退出时恢复，可以嵌套使用
+    '''
+    original = requests.Session.send
+
+    def wrapper(session, request, **kwargs):
+        return send(original, session, request, **kwargs)
+
+    requests.Session.send = wrapper
+    try:
+        yield
+    finally:
+        requests.Session.send = original
+
+
+@contextmanager
+def record(path, mode='a'):
+    '''
+    录制with代码块内发出的所有HTTP请求
+    path：录制文件路径，建议以.jsonl.gz结尾
+    mode：'a'追加到已有录制文件，'w'覆盖
+    '''
+    cassette = Cassette(path)
+    if mode == 'w':
+        cassette.entries = {}
+
+    def send(original, session, request, **kwargs):
+        response = original(session, request, **kwargs)
+        if not kwargs.get('stream'):
+            # 重定向的后续各跳由嵌套的send各自录制，这里只录制第一跳
+            first = response.history[0] if response.history else response
+            cassette.add(request_key(request.method, request.url, request.body), first)
+        return response
+
+    try:
+        with patch_send(send):
+            yield cassette
+    finally:
+        cassette.save()
+
+
+@contextmanager
+def replay(source):
+    '''
+    回放录制数据，with代码块内不访问外部网络
+    source：录制文件路径，或serve()返回的本地服务（或其地址，如'http://127.0.0.1:8000'）
+    '''
+    if isinstance(source, CassetteServer):
+        source = source.url
+    if isinstance(source, str) and source.startswith('http'):
+        base = source.rstrip('/')
+
+        def send(original, session, request, **kwargs):
+            # 本地服务返回的重定向地址已经编码过
+            if request.url.startswith(base + '/'):
+                return original(session, request, **kwargs)
+            # 把原始地址编码进路径：http://127.0.0.1:port/{scheme}/{host}/{path}?{query}
+            request = request.copy()
+            request.url = base + server_path(request.url)
+            request.headers.pop('Host', None)
+            return original(session, request, **kwargs)
+
+        with patch_send(send):
+            yield source
+        return
+
+    cassette = Cassette(source)
+
+    def send(original, session, request, **kwargs):
+        key = request_key(request.method, request.url, request.body)
+        item = cassette.get(key)
+        if item is None:
+            raise CassetteMiss(f'录制文件中没有该请求：{key}', request=request)
+        response = build_response(item, request)
+        replay_cookies(session, request, item)
+        # 与Session.send相同地跟随重定向，每一跳都从录制文件中取
+        if kwargs.pop('allow_redirects', True) and response.is_redirect:
+            history = [response] + list(session.resolve_redirects(response, request, **kwargs))
+            response = history.pop()
+            response.history = history
+        return response
+
+    with patch_send(send):
+        yield cassette
+
+
+def server_path(url):
+    '''原始地址在本地服务上的路径：/{scheme}/{host}/{path}?{query}'''
+    parts = urlsplit(url)
+    path = f'/{parts.scheme}/{parts.netloc}{parts.path}'
+    return path + '?' + parts.query if parts.query else path
+
+
+def replay_cookies(session, request, item):
+    '''把录制的Set-Cookie写入session.cookies'''
+    cookies = [v for k, v in item_headers(item) if k.lower() == 'set-cookie']
+    if not cookies:
+        return
+    msg = HTTPMessage()
+    for v in cookies:
+        msg['Set-Cookie'] = v
+
+    class Raw:
+        _original_response = type('Original', (), {'msg': msg})()
+
+    extract_cookies_to_jar(session.cookies, request, Raw())
+
+
+def encode_content(content, encoding):
+    '''按录制的Content-Encoding重新压缩（requests保存的是解压后的内容），不支持的返回None'''
+    encoding = encoding.lower().strip()
+    if encoding in ('', 'identity'):
+        return content
+    if encoding == 'gzip':
+        return gzip.compress(content)
+    if encoding == 'deflate':
+        return zlib.compress(content)
+    return None
+
+
+class CassetteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写入，keep-alive连接上Nagle算法和延迟确认会使之后的每个请求多等约40ms
+    disable_nagle_algorithm = True
+
+    # 部分接口（如fund_data_single）用GET请求携带表单，GET也需要读取请求体
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.respond()
+
+    def respond(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        # 还原原始地址：/{scheme}/{host}/{path}?{query}
+        scheme, _, rest = self.path.lstrip('/').partition('/')
+        url = f'{scheme}://{rest}'
+        key = request_key(self.command, url, body)
+        item = server.cassette.get(key)
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if item is None:
+            content = f'cassette miss: {key}'.encode('utf-8')
+            self.send_response(599)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        else:
+            content = item_content(item)
+            self.send_response(item['status'], item.get('reason'))
+            headers = [(k, v) for k, v in item_headers(item) if k.lower() not in hop_headers]
+            names = {k.lower() for k, _ in headers}
+            content_type = item.get('content_type', '')
+            if item.get('encoding') and 'charset' not in content_type:
+                content_type = f"{content_type or 'text/plain'}; charset={item['encoding']}"
+            for k, v in headers:
+                name = k.lower()
+                if name == 'content-type':
+                    v = content_type or v
+                elif name == 'location':
+                    # 重定向到原始地址对应的本地路径
+                    v = server_path(urljoin(url, v))
+                elif name == 'content-encoding':
+                    encoded = encode_content(content, v)
+                    if encoded is None:
+                        continue
+                    content = encoded
+                self.send_header(k, v)
+            if content_type and 'content-type' not in names:
+                self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CassetteServer(ThreadingHTTPServer):
+    '''
+    本地模拟服务，按录制文件返回数据
+    latency：每个请求的平均延迟（秒），jitter：延迟随机抖动幅度（秒）
+    '''
+    daemon_threads = True
+
+    def __init__(self, path, host='127.0.0.1', port=0, latency=0, jitter=0):
+        super().__init__((host, port), CassetteHandler)
+        self.cassette = Cassette(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def serve(path, host='127.0.0.1', port=0, latency=0, jitter=0):
+    '''
+    在后台线程启动本地模拟服务并返回，port=0表示随机端口
+    可作为with语句使用，退出时关闭服务
+    '''
+    return CassetteServer(path, host, port, latency, jitter).start()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='qstock录制数据本地模拟服务')
+    parser.add_argument('path', help='录制文件路径')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help='平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0, help='延迟抖动（秒）')
+    args = parser.parse_args()
+    server = CassetteServer(args.path, args.host, args.port, args.latency, args.jitter)
+    print(f'serving {args.path} on {server.url}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
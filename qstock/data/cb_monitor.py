@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+可转债估值监控
+
+不再对每只债券调用bond_info_single、对每只正股单独请求行情：
+条款（转股价、到期日、票面利率等）用bond_info_all一次获取并缓存，
+价格只需两次请求：market_realtime('可转债')获取全部可转债行情，
+stock_realtime一次请求全部正股（多个secid）。
+全部上市可转债的转股价值、转股溢价率、纯债价值、纯债溢价率、双低值、剩余年限等
+在数组上向量化计算。
+    m = qs.CBMonitor()
+    m.table                  # 估值表
+    m.refresh()              # 只重新获取价格并重新计算
+    qs.cb_monitor()          # 使用缓存的CBMonitor
+"""
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# 纯债价值的贴现率（按债券评级），没有评级时使用cb_default_rate
+cb_rating_rates = {'AAA': 0.03, 'AA+': 0.035, 'AA': 0.04, 'AA-': 0.05, 'A+': 0.06}
+cb_default_rate = 0.07
+
+cb_columns = ['债券代码', '债券名称', '现价', '涨幅', '正股代码', '正股名称', '正股价', '正股涨幅',
+              '转股价', '转股价值', '转股溢价率', '纯债价值', '纯债溢价率', '双低', '剩余年限',
+              '强赎触发比', '债券评级', '到期日期', '成交额']
+
+
+def coupon_matrix(explain, years):
+    '''
+    由利率说明（如'第一年0.30%、第二年0.50%……'）解析各年票面利率（%），
+    返回(债券数, max(years))的数组，缺失的年份为0
+    '''
+    width = max(int(np.nanmax(years)), 1) if len(years) else 1
+    rates = np.zeros((len(explain), width))
+    for i, (text, n) in enumerate(zip(explain, years)):
+        values = [float(v) for v in re.findall(r'(\d+(?:\.\d+)?)\s*%', str(text))][:width]
+        rates[i, :len(values)] = values
+    return rates
+
+
+def pure_bond_value(expire, years, coupons, redemption, rate, today=None):
+    '''
+    纯债价值（每100元面值）：剩余各年利息和到期赎回价按rate贴现
+    expire:到期日期数组；years:期限（年）数组；coupons:coupon_matrix的结果（%）；
+    redemption:到期赎回价（含最后一年利息）；rate:贴现率数组或标量
+    付息日按到期日往前整年推算
+    '''
+    today = np.datetime64(pd.Timestamp(today or pd.Timestamp.today()).normalize(), 'D')
+    expire = pd.to_datetime(pd.Series(expire)).to_numpy().astype('datetime64[D]')
+    years = np.asarray(years, dtype=float)
+    n_bond, width = coupons.shape
+    k = np.arange(1, width + 1)[None, :]
+    # 第k年付息日距到期日(years - k)年
+    offset = (years[:, None] - k) * 365.25
+    t = ((expire - today).astype(float)[:, None] - offset) / 365.25
+    cash = np.where(k < years[:, None], coupons, 0.0)
+    cash = np.where(k == years[:, None], np.asarray(redemption, dtype=float).reshape(-1, 1), cash)
+    alive = (t > 0) & (k <= years[:, None])
+    rate = np.asarray(rate, dtype=float).reshape(-1, 1)
+    with np.errstate(invalid='ignore'):
+        pv = np.where(alive, cash / (1 + rate) ** np.where(alive, t, 0), 0.0)
+    value = pv.sum(axis=1)
+    return np.where(np.isnan(years) | np.isnat(expire), np.nan, value)
+
+
+def cb_valuation(terms, bond_quotes, stock_quotes, redemption=None, today=None):
+    '''
+    可转债估值表（向量化计算）
+    terms:bond_info_all(bond_terms_field)的结果；bond_quotes:market_realtime('可转债')；
+    stock_quotes:正股的stock_realtime结果
+    redemption:到期赎回价（标量或{债券代码: 价格}），默认为面值加最后一年利息（偏保守）
+    返回以cb_columns为列、按双低排序的DataFrame
+    '''
+    bonds = bond_quotes[['代码', '名称', '最新', '涨幅', '成交额']].rename(
+        columns={'代码': '债券代码', '名称': '债券名称', '最新': '现价'})
+    bonds['债券代码'] = bonds['债券代码'].astype(str)
+    terms = terms.assign(债券代码=terms['债券代码'].astype(str)).drop(columns=['债券名称'], errors='ignore')
+    df = bonds.merge(terms, on='债券代码', how='inner')
+    stocks = stock_quotes[['代码', '最新', '涨幅']].rename(
+        columns={'代码': '正股代码', '最新': '正股价', '涨幅': '正股涨幅'})
+    df['正股代码'] = df['正股代码'].astype(str)
+    df = df.merge(stocks.assign(正股代码=stocks['正股代码'].astype(str)), on='正股代码', how='left')
+
+    price = pd.to_numeric(df['现价'], errors='coerce').to_numpy(dtype=float)
+    stock_price = pd.to_numeric(df['正股价'], errors='coerce').to_numpy(dtype=float)
+    convert = pd.to_numeric(df['转股价'], errors='coerce').to_numpy(dtype=float)
+    years = pd.to_numeric(df['期限(年)'], errors='coerce').round().to_numpy(dtype=float)
+    expire = pd.to_datetime(df['到期日期'], errors='coerce')
+    coupons = coupon_matrix(df['利率说明'].to_numpy(), np.nan_to_num(years))
+    if redemption is None:
+        last = np.take_along_axis(coupons, np.clip(np.nan_to_num(years).astype(int) - 1, 0, None)[:, None],
+                                  axis=1)[:, 0]
+        redeem = 100 + last
+    elif isinstance(redemption, dict):
+        redeem = df['债券代码'].map(redemption).astype(float).fillna(100).to_numpy()
+    else:
+        redeem = np.full(len(df), float(redemption))
+    rate = df['债券评级'].map(cb_rating_rates).fillna(cb_default_rate).to_numpy(dtype=float)
+    today = pd.Timestamp(today or pd.Timestamp.today()).normalize()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        value = 100 / convert * stock_price
+        premium = (price / value - 1) * 100
+        bond_value = pure_bond_value(expire, years, coupons, redeem, rate, today)
+        bond_premium = (price / bond_value - 1) * 100
+        trigger = pd.to_numeric(df['强赎触发价'], errors='coerce').to_numpy(dtype=float)
+        trigger = np.where(np.isnan(trigger), convert * 1.3, trigger)
+        df['转股价值'] = value
+        df['转股溢价率'] = premium
+        df['纯债价值'] = bond_value
+        df['纯债溢价率'] = bond_premium
+        df['双低'] = price + premium
+        df['剩余年限'] = (expire - today).dt.days.to_numpy() / 365.25
+        df['强赎触发比'] = stock_price / trigger
+    # 停牌、未上市等没有价格的债券
+    df = df[price > 0]
+    return df[cb_columns].sort_values('双低').round(3).reset_index(drop=True)
+
+
+class CBMonitor:
+    '''
+    可转债估值监控：条款只在创建时获取一次，refresh()只重新获取价格（两次请求）
+    redemption:到期赎回价，见cb_valuation
+    '''
+
+    def __init__(self, redemption=None, terms=None):
+        from qstock.data.trade import bond_info_all, bond_terms_field
+        self.redemption = redemption
+        self.terms = bond_info_all(bond_terms_field) if terms is None else terms
+        self.table = None
+        self.updated = None
+        self.bond_quotes = self.stock_quotes = None
+        self.refresh()
+
+    def quotes(self):
+        '''全部可转债行情和正股行情'''
+        from qstock.data.trade import market_realtime, stock_realtime
+        from qstock.data.money_store import stock_code_id
+        bond_quotes = market_realtime('可转债')
+        codes = set(bond_quotes['代码'].astype(str))
+        stocks = self.terms.loc[self.terms['债券代码'].astype(str).isin(codes), '正股代码']
+        secids = sorted({stock_code_id(str(c)) for c in stocks.dropna()})
+        stock_quotes = stock_realtime(secids) if secids else pd.DataFrame(columns=['代码', '最新', '涨幅'])
+        return bond_quotes, stock_quotes
+
+    def refresh(self):
+        '''重新获取价格并重新计算估值表'''
+        self.bond_quotes, self.stock_quotes = self.quotes()
+        self.updated = time.time()
+        return self.revalue()
+
+    def revalue(self):
+        '''不重新获取价格，用上次的行情重新计算估值表（如修改redemption之后）'''
+        self.table = cb_valuation(self.terms, self.bond_quotes, self.stock_quotes, self.redemption)
+        return self.table
+
+    def run(self, interval=10, rounds=None, callback=None, trading_only=True):
+        '''
+        每interval秒刷新一次，rounds为刷新次数（默认一直运行，Ctrl+C结束）
+        callback(monitor):每次刷新后调用；trading_only:非交易时段不请求
+        '''
+        from qstock.data.trade_calendar import is_trading_time
+        n = 0
+        try:
+            while rounds is None or n < rounds:
+                start = time.time()
+                if not trading_only or is_trading_time():
+                    self.refresh()
+                    if callback is not None:
+                        callback(self)
+                n += 1
+                time.sleep(max(0, interval - (time.time() - start)))
+        except KeyboardInterrupt:
+            pass
+        return self
+
+
+cb_monitor_cache = {}
+
+
+def cb_monitor(refresh=True, reload=False, redemption=None):
+    '''
+    全部上市可转债的估值表，第一次调用时获取条款并缓存
+    refresh:重新获取价格；reload:重新获取条款
+    redemption:到期赎回价（见cb_valuation），与缓存的不同时按本次的重新计算
+    '''
+    monitor = cb_monitor_cache.get('default')
+    if monitor is None or reload:
+        monitor = cb_monitor_cache['default'] = CBMonitor(redemption)
+        return monitor.table
+    if redemption != monitor.redemption:
+        monitor.redemption = redemption
+        if not refresh:
+            return monitor.revalue()
+    if refresh:
+        monitor.refresh()
+    return monitor.table
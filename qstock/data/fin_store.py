@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+财务报表、业绩报表等按报告期的本地仓库（point-in-time）
+
+balance_sheet、income_statement、cashflow_statement、stock_yjbb、stock_yjkb、stock_yjyg和
+company_indicator每次都要重新抓取整个报告期的全部股票。历史报告期的数据除更正外不会变化，
+因此每个(报表类型, 报告期)只获取一次，保存为数据目录下的fin/{类型}/YYYYMMDD.pkl，
+只有披露截止日（加refresh_days天）之前的报告期会重新获取。
+每行保留公告日，按公告日过滤即可得到某一天实际可以获得的数据，避免回测中的未来数据：
+    qs.update_fin('财务指标', start='20150331')
+    qs.fin_panel('财务指标', '净资产收益率', code_list)      # 报告期×股票
+    qs.fin_cross_section('财务指标', as_of='2023-05-05')    # 截至某天已公告的最新一期
+    qs.fin_pit_panel('财务指标', '净资产收益率', dates)      # 交易日×股票，每天可获得的最新值
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from tqdm import tqdm
+
+from qstock.data.util import data_dir
+
+# 报表类型 -> 保存的目录名
+fin_kinds = {
+    '业绩报表': 'yjbb', 'yjbb': 'yjbb',
+    '业绩快报': 'yjkb', 'yjkb': 'yjkb',
+    '业绩预告': 'yjyg', 'yjyg': 'yjyg',
+    '资产负债表': 'zcfz', 'zcfz': 'zcfz',
+    '利润表': 'lrb', 'lrb': 'lrb',
+    '现金流量表': 'xjll', 'xjll': 'xjll',
+    '财务指标': 'cwzb', 'cwzb': 'cwzb',
+}
+# 各报表的公告日列名，保存时统一为'公告日'
+fin_notice_cols = {'yjbb': '最新公告日', 'cwzb': '公告日期'}
+# 各报告期的法定披露截止日（月, 日, 是否次年）
+report_deadlines = {3: (4, 30, False), 6: (8, 31, False), 9: (10, 31, False), 12: (4, 30, True)}
+
+
+def fin_kind(kind):
+    if kind not in fin_kinds:
+        raise ValueError(f'kind只能是{list(fin_kinds)}之一')
+    return fin_kinds[kind]
+
+
+def fin_fetcher(kind):
+    from qstock.data import fundamental
+    from qstock.data.trade import company_indicator
+    return {
+        'yjbb': fundamental.stock_yjbb,
+        'yjkb': fundamental.stock_yjkb,
+        'yjyg': fundamental.stock_yjyg,
+        'zcfz': fundamental.balance_sheet,
+        'lrb': fundamental.income_statement,
+        'xjll': fundamental.cashflow_statement,
+        # 没有该报告期的数据时company_indicator默认返回最新一期，这里必须返回空表
+        'cwzb': lambda date: company_indicator(f'{date[:4]}-{date[4:6]}-{date[6:]}', strict=True),
+    }[kind]
+
+
+def fin_path(kind, date):
+    return data_dir('fin', kind) / f'{pd.Timestamp(date):%Y%m%d}.pkl'
+
+
+def fin_report_dates(start='20100331', end=None):
+    '''start到end（默认今天）之间的全部报告期（季末日期），返回DatetimeIndex'''
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.today()
+    periods = pd.period_range(pd.Timestamp(start), end, freq='Q')
+    dates = pd.DatetimeIndex([p.end_time.normalize() for p in periods], name='报告期')
+    return dates[(dates >= pd.Timestamp(start)) & (dates <= end)]
+
+
+def report_deadline(date):
+    '''报告期的法定披露截止日：一季报4月30日，半年报8月31日，三季报10月31日，年报次年4月30日'''
+    date = pd.Timestamp(date)
+    month, day, next_year = report_deadlines[date.month]
+    return pd.Timestamp(date.year + next_year, month, day)
+
+
+def report_closed(date, refresh_days=30, today=None):
+    '''报告期是否已结束披露（截止日之后refresh_days天），结束后不再重新获取'''
+    today = pd.Timestamp(today) if today is not None else pd.Timestamp.today()
+    return today > report_deadline(date) + pd.Timedelta(days=refresh_days)
+
+
+def load_fin(kind, date):
+    '''读取本地保存的一个报告期，没有时返回None'''
+    path = fin_path(fin_kind(kind), date)
+    return pd.read_pickle(path) if path.exists() else None
+
+
+def update_fin_date(kind, date, refresh_days=30, force=False):
+    '''获取并保存一个报告期（已结束披露且已保存的不重新获取），返回是否重新获取'''
+    date = pd.Timestamp(date)
+    path = fin_path(kind, date)
+    if path.exists() and not force and report_closed(date, refresh_days):
+        return False
+    df = fin_fetcher(kind)(f'{date:%Y%m%d}')
+    if df is None:
+        df = pd.DataFrame()
+    df = df.loc[:, [c for c in df.columns if c not in ('序号', '_')]].copy()
+    if '代码' in df.columns:
+        df['代码'] = df['代码'].astype(str).str.zfill(6)
+    notice = fin_notice_cols.get(kind, '公告日')
+    df['公告日'] = pd.to_datetime(df[notice], errors='coerce') if notice in df.columns else pd.NaT
+    if notice != '公告日':
+        df = df.drop(columns=notice, errors='ignore')
+    df.insert(0, '报告期', date)
+    df.to_pickle(path)
+    return True
+
+
+def update_fin(kind='财务指标', start='20100331', end=None, refresh_days=30, force=False, max_workers=4):
+    '''
+    获取start到end之间本地没有或尚未结束披露的报告期并保存
+    kind:'业绩报表'、'业绩快报'、'业绩预告'、'资产负债表'、'利润表'、'现金流量表'、'财务指标'
+         （或yjbb、yjkb、yjyg、zcfz、lrb、xjll、cwzb）
+    refresh_days:披露截止日之后继续重新获取的天数（覆盖更正公告）；force=True时全部重新获取
+    返回{报告期: 是否重新获取}，获取失败的为None
+    '''
+    kind = fin_kind(kind)
+    dates = fin_report_dates(start, end)
+
+    def run(date):
+        try:
+            return update_fin_date(kind, date, refresh_days, force)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        done = list(tqdm(executor.map(run, dates), total=len(dates), leave=False))
+    return {f'{d:%Y-%m-%d}': r for d, r in zip(dates, done)}
+
+
+def fin_history(kind='财务指标', code_list=None, columns=None, start='20100331', end=None,
+                as_of=None, update=False):
+    '''
+    多个报告期合并的长表（报告期、代码、……、公告日），只读取本地数据
+    code_list:股票代码列表，默认全部；columns:需要的列，默认全部
+    as_of:只保留该日（含）之前已公告的数据；update:是否先调用update_fin
+    '''
+    kind = fin_kind(kind)
+    if update:
+        update_fin(kind, start, end)
+    frames = [load_fin(kind, d) for d in fin_report_dates(start, end)]
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    if code_list is not None:
+        if isinstance(code_list, str):
+            code_list = [code_list]
+        df = df[df['代码'].isin([str(c) for c in code_list])]
+    if as_of is not None:
+        df = df[df['公告日'] <= pd.Timestamp(as_of)]
+    if columns is not None:
+        if isinstance(columns, str):
+            columns = [columns]
+        df = df[['报告期', '代码'] + [c for c in columns if c not in ('报告期', '代码', '公告日')] + ['公告日']]
+    return df.reset_index(drop=True)
+
+
+def fin_panel(kind, column, code_list=None, start='20100331', end=None, as_of=None):
+    '''单个指标的报告期×股票代码宽表，如fin_panel('财务指标', '净资产收益率', code_list)'''
+    df = fin_history(kind, code_list, [column], start, end, as_of)
+    if df.empty:
+        return pd.DataFrame()
+    return df.pivot_table(index='报告期', columns='代码', values=column, aggfunc='last')
+
+
+def latest_reports(df):
+    '''
+    每只股票按公告日排序后，只保留报告期不早于之前已公告的最新报告期的记录
+    （旧报告期的更正公告不会覆盖更新一期的数据）
+    '''
+    df = df.dropna(subset=['公告日']).sort_values(['公告日', '报告期'], kind='mergesort')
+    newest = df.groupby('代码')['报告期'].cummax()
+    return df[df['报告期'].to_numpy() >= newest.to_numpy()]
+
+
+def fin_cross_section(kind='财务指标', date=None, as_of=None, columns=None, code_list=None):
+    '''
+    截面数据，以股票代码为索引
+    date:报告期，返回该期数据（提供as_of时只包括当时已公告的股票）；
+    date为None时返回每只股票截至as_of（默认今天）已公告的最新一期（含报告期列）
+    '''
+    if date is not None:
+        df = fin_history(kind, code_list, columns, date, date, as_of)
+    else:
+        df = fin_history(kind, code_list, columns, as_of=as_of)
+        if not df.empty:
+            df = latest_reports(df).drop_duplicates('代码', keep='last')
+    if df.empty:
+        return df
+    return df.set_index('代码')
+
+
+def fin_pit_panel(kind, column, dates, code_list=None, start='20100331'):
+    '''
+    point-in-time面板：dates（如交易日）×股票代码，每天为当时已公告的最新一期报告的值
+    '''
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    df = fin_history(kind, code_list, [column], start, dates.max() if len(dates) else None)
+    if df.empty:
+        return pd.DataFrame(index=dates)
+    df = latest_reports(df)
+    wide = df.pivot_table(index='公告日', columns='代码', values=column, aggfunc='last')
+    # 先对齐到包含dates的并集，向前填充后再取dates
+    union = wide.index.union(dates)
+    values = wide.reindex(union).ffill().reindex(dates)
+    values.index.name = 'date'
+    return values
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+基金重仓股的批量获取与双向索引
+
+fund_position每次只获取一只基金。update_fund_holdings对fund_code(ft)的全部基金并发获取
+最近n个报告期的重仓股，每只基金保存为数据目录下的fund_holding/{基金代码}.pkl，
+已保存的报告期不再请求（报告期的持仓公布后不会变化）。
+FundHoldingIndex把全部(基金, 报告期, 股票, 持仓占比)记录按股票和按基金分别排序，
+查询某只股票被哪些基金持有、某只基金持有哪些股票都只是数组切片，
+并汇总每个报告期每只股票的持有基金数和持仓占比合计及其环比变化：
+    index = qs.build_fund_index(ft=['gp', 'hh'])
+    qs.stock_funds('300750')           # 持有宁德时代的基金
+    qs.stock_fund_changes('300750')    # 与上一报告期相比新进、退出、增持、减持的基金
+    qs.fund_ownership()                # 最新报告期每只股票的基金持有情况
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from jsonpath import jsonpath
+from tqdm import tqdm
+
+from qstock.data.util import session, data_dir, trans_num
+
+fund_holding_cols = ['基金代码', '报告期', '股票代码', '股票简称', '持仓占比', '较上期变化']
+
+
+def fund_holding_path(code):
+    return data_dir('fund_holding') / f'{code}.pkl'
+
+
+def fetch_fund_holdings(code, date=None):
+    '''获取一只基金一个报告期（默认最新）的重仓股，返回列为fund_holding_cols的DataFrame'''
+    from qstock.data.trade import fund_header
+    params = [
+        ('FCODE', code),
+        ('appType', 'ttjj'),
+        ('deviceid', '3EA024C2-7F22-408B-95E4-383D38160FB3'),
+        ('plat', 'Iphone'),
+        ('product', 'EFund'),
+        ('serverVersion', '6.2.8'),
+        ('version', '6.2.8'),
+    ]
+    if date is not None:
+        params.append(('DATE', date))
+    url = 'https://fundmobapi.eastmoney.com/FundMNewApi/FundMNInverstPosition'
+    json_response = session.get(url, headers=fund_header, params=params).json()
+    stocks = jsonpath(json_response, '$..fundStocks[:]')
+    if not stocks:
+        return pd.DataFrame(columns=fund_holding_cols)
+    df = pd.DataFrame(stocks).rename(columns={'GPDM': '股票代码', 'GPJC': '股票简称',
+                                              'JZBL': '持仓占比', 'PCTNVCHG': '较上期变化'})
+    df['基金代码'] = code
+    df['报告期'] = pd.Timestamp(json_response.get('Expansion') or date)
+    df = df.reindex(columns=fund_holding_cols)
+    return trans_num(df, ['基金代码', '报告期', '股票代码', '股票简称'])
+
+
+def load_fund_holdings(code):
+    path = fund_holding_path(code)
+    return pd.read_pickle(path) if path.exists() else None
+
+
+def update_fund(code, n=2):
+    '''增量更新一只基金最近n个报告期的重仓股，返回新获取的报告期数'''
+    from qstock.data.trade import fund_dates
+    old = load_fund_holdings(code)
+    have = set() if old is None else set(old['报告期'])
+    dates = [d for d in fund_dates(code)[:n] if pd.Timestamp(d) not in have]
+    frames = [fetch_fund_holdings(code, date) for date in dates]
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return 0
+    df = pd.concat(([old] if old is not None else []) + frames, ignore_index=True)
+    df = df.drop_duplicates(['报告期', '股票代码'], keep='last').sort_values(['报告期', '持仓占比'])
+    df.reset_index(drop=True).to_pickle(fund_holding_path(code))
+    return len(frames)
+
+
+def fund_list_of(ft):
+    '''fund_code(ft)的基金列表，ft可以是列表；同时保存基金简称供索引使用'''
+    from qstock.data.trade import fund_code
+    if ft is None or isinstance(ft, str):
+        ft = [ft]
+    funds = pd.concat([fund_code(t) for t in ft], ignore_index=True).drop_duplicates('基金代码')
+    path = data_dir('fund_holding') / 'fund_names.pkl'
+    if path.exists():
+        funds = pd.concat([pd.read_pickle(path), funds]).drop_duplicates('基金代码', keep='last')
+    funds.reset_index(drop=True).to_pickle(path)
+    return funds['基金代码'].tolist()
+
+
+def update_fund_holdings(fund_list=None, ft=('gp', 'hh'), n=2, max_workers=16):
+    '''
+    并发获取多只基金最近n个报告期的重仓股并保存到本地
+    fund_list:基金代码列表，默认为fund_code(ft)的全部基金，ft:'gp'股票型、'hh'混合型、'zs'指数型等，可以是列表
+    返回{基金代码: 新获取的报告期数}，获取失败的为None
+    '''
+    if fund_list is None:
+        fund_list = fund_list_of(ft)
+    if isinstance(fund_list, str):
+        fund_list = [fund_list]
+
+    def run(code):
+        try:
+            return update_fund(code, n)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = list(tqdm(executor.map(run, fund_list), total=len(fund_list), leave=False))
+    return dict(zip(fund_list, counts))
+
+
+def fund_holdings(fund_list=None, start=None):
+    '''本地保存的基金重仓股记录合并的长表，fund_list默认全部，start:只保留该报告期之后的记录'''
+    if fund_list is None:
+        paths = [p for p in data_dir('fund_holding').glob('*.pkl') if p.stem.isdigit()]
+    else:
+        paths = [fund_holding_path(c) for c in ([fund_list] if isinstance(fund_list, str) else fund_list)]
+    frames = [pd.read_pickle(p) for p in paths if p.exists()]
+    if not frames:
+        return pd.DataFrame(columns=fund_holding_cols)
+    df = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        df = df[df['报告期'] >= pd.Timestamp(start)]
+    return df.reset_index(drop=True)
+
+
+class FundHoldingIndex:
+    '''
+    基金-股票持仓记录的双向索引
+    facts:fund_holdings()的长表，fund_names:{基金代码: 基金简称}
+    按(股票代码, 报告期)和(基金代码, 报告期)排序后记录每只股票、每只基金的行范围，查询为数组切片
+    '''
+
+    def __init__(self, facts, fund_names=None, updated=None):
+        facts = facts[fund_holding_cols].reset_index(drop=True)
+        self.fund_names = fund_names or {}
+        self.updated = updated
+        self.by_stock = facts.sort_values(['股票代码', '报告期', '持仓占比'],
+                                          ascending=[True, True, False]).reset_index(drop=True)
+        self.by_fund = facts.sort_values(['基金代码', '报告期', '持仓占比'],
+                                         ascending=[True, True, False]).reset_index(drop=True)
+        self.stock_range = self.ranges(self.by_stock['股票代码'].to_numpy())
+        self.fund_range = self.ranges(self.by_fund['基金代码'].to_numpy())
+        # 每只基金已披露（已获取到持仓）的报告期
+        self.filed = self.by_fund[['基金代码', '报告期']].drop_duplicates().reset_index(drop=True)
+        # 股票简称也可以查询
+        names = self.by_stock.drop_duplicates('股票代码', keep='last')
+        for code, name in zip(names['股票代码'], names['股票简称']):
+            self.stock_range.setdefault(name, self.stock_range[code])
+        for code, name in self.fund_names.items():
+            if code in self.fund_range:
+                self.fund_range.setdefault(name, self.fund_range[code])
+        self.ownership_table = None
+
+    @staticmethod
+    def ranges(keys):
+        '''已排序的keys中每个取值的(起点, 终点)'''
+        if not len(keys):
+            return {}
+        starts = np.r_[0, np.flatnonzero(keys[1:] != keys[:-1]) + 1]
+        ends = np.r_[starts[1:], len(keys)]
+        return {keys[s]: (s, e) for s, e in zip(starts, ends)}
+
+    def __len__(self):
+        return len(self.by_stock)
+
+    def __repr__(self):
+        return (f'FundHoldingIndex({self.by_fund["基金代码"].nunique()} funds, '
+                f'{self.by_stock["股票代码"].nunique()} stocks, {len(self)} holdings, updated={self.updated})')
+
+    def report_dates(self):
+        return sorted(self.by_stock['报告期'].unique())
+
+    @staticmethod
+    def at_date(df, date):
+        '''报告期为date（默认其中最新）的行'''
+        if df.empty:
+            return df
+        date = df['报告期'].iloc[-1] if date is None else pd.Timestamp(date)
+        return df[df['报告期'].to_numpy() == np.datetime64(date)]
+
+    def stock_rows(self, code):
+        start, end = self.stock_range.get(str(code), (0, 0))
+        return self.by_stock.iloc[start:end]
+
+    def fund_rows(self, code):
+        start, end = self.fund_range.get(str(code), (0, 0))
+        return self.by_fund.iloc[start:end]
+
+    def stock_funds(self, code, date=None):
+        '''持有某只股票（代码或简称）的基金，date为报告期（默认该股票最新的报告期），按持仓占比排序'''
+        df = self.at_date(self.stock_rows(code), date)
+        df = df[['报告期', '基金代码', '持仓占比', '较上期变化']].copy()
+        df.insert(2, '基金简称', df['基金代码'].map(self.fund_names))
+        return df.reset_index(drop=True)
+
+    def fund_stocks(self, code, date=None):
+        '''某只基金（代码或简称）的重仓股，date为报告期（默认该基金最新的报告期）'''
+        df = self.at_date(self.fund_rows(code), date)
+        return df[['报告期', '股票代码', '股票简称', '持仓占比', '较上期变化']].reset_index(drop=True)
+
+    def stock_fund_changes(self, code, date=None):
+        '''
+        某只股票date报告期（默认最新）与上一报告期相比持有基金的变化，
+        返回基金代码、基金简称、上期占比、本期占比、变动（新进、退出、增持、减持、不变）
+        上期持有、但还没有本期持仓数据的基金标为'未披露'，只有已披露本期持仓的才是退出
+        '''
+        rows = self.stock_rows(code)
+        dates = rows['报告期'].unique()
+        if not len(dates):
+            return pd.DataFrame(columns=['基金代码', '基金简称', '上期占比', '本期占比', '变动'])
+        date = dates[-1] if date is None else np.datetime64(pd.Timestamp(date))
+        earlier = dates[dates < date]
+        now = self.at_date(rows, date).set_index('基金代码')['持仓占比']
+        before = self.at_date(rows, earlier[-1]).set_index('基金代码')['持仓占比'] if len(earlier) \
+            else pd.Series(dtype=float)
+        df = pd.DataFrame({'上期占比': before, '本期占比': now})
+        diff = df['本期占比'] - df['上期占比']
+        filed = self.filed.loc[self.filed['报告期'].to_numpy() == date, '基金代码']
+        gone = df['本期占比'].isna()
+        df['变动'] = np.select([df['上期占比'].isna(), gone & df.index.isin(filed), gone, diff > 0, diff < 0],
+                             ['新进', '退出', '未披露', '增持', '减持'], '不变')
+        df.index.name = '基金代码'
+        df = df.reset_index()
+        df.insert(1, '基金简称', df['基金代码'].map(self.fund_names))
+        return df.sort_values(['变动', '本期占比'], ascending=[True, False]).reset_index(drop=True)
+
+    def ownership(self, date=None):
+        '''
+        每个报告期每只股票的基金持有情况：持有基金数、持仓占比合计（各基金占净值比例之和）、
+        以及与上一报告期相比的变化，date为报告期（默认最新），'all'返回全部报告期
+        变化只比较两个报告期都已披露持仓的基金，还没有本期数据的基金不算作减少
+        '''
+        if self.ownership_table is None:
+            g = self.by_stock.groupby(['报告期', '股票代码'], sort=True)
+            counts = g.size()
+            weights = g['持仓占比'].sum()
+            # 上一报告期的持仓移到本期，只保留本期也已披露的基金
+            dates = np.array(self.report_dates(), dtype='datetime64[ns]')
+            prev = self.by_stock[self.by_stock['报告期'].to_numpy() < dates[-1]] if len(dates) else self.by_stock
+            prev = prev.assign(报告期=dates[np.searchsorted(dates, prev['报告期'].to_numpy()) + 1])
+            prev = prev.merge(self.filed, on=['基金代码', '报告期'])
+            pg = prev.groupby(['报告期', '股票代码'])
+            prev_counts = pg.size().reindex(counts.index, fill_value=0)
+            prev_weights = pg['持仓占比'].sum().reindex(counts.index, fill_value=0)
+            # 第一个报告期没有可比较的数据
+            first = counts.index.get_level_values('报告期') == (dates[0] if len(dates) else None)
+            table = pd.DataFrame({
+                '持有基金数': counts,
+                '持仓占比合计': weights,
+                '基金数变化': (counts - prev_counts).mask(first),
+                '持仓占比合计变化': (weights - prev_weights).mask(first),
+            })
+            names = self.by_stock.drop_duplicates('股票代码', keep='last').set_index('股票代码')['股票简称']
+            table.insert(0, '股票简称', table.index.get_level_values('股票代码').map(names))
+            self.ownership_table = table
+        if date == 'all' or not len(self):
+            return self.ownership_table
+        date = self.report_dates()[-1] if date is None else pd.Timestamp(date)
+        df = self.ownership_table.xs(date, level='报告期')
+        return df.sort_values('持有基金数', ascending=False)
+
+    def save(self, path=None):
+        path = path or data_dir('fund_holding') / 'index.pkl'
+        pd.to_pickle({'facts': self.by_fund, 'fund_names': self.fund_names, 'updated': self.updated}, path)
+
+    @classmethod
+    def load(cls, path=None):
+        data = pd.read_pickle(path or data_dir('fund_holding') / 'index.pkl')
+        return cls(data['facts'], data['fund_names'], data['updated'])
+
+
+fund_index_cache = {}
+
+
+def build_fund_index(fund_list=None, ft=('gp', 'hh'), n=2, update=True, max_workers=16):
+    '''
+    增量获取基金重仓股（update=True时）并建立FundHoldingIndex，保存到本地
+    参数见update_fund_holdings，n至少为2才能比较与上一报告期的变化
+    fund_list为None（全部基金）时才保存并作为stock_funds等函数使用的默认索引
+    '''
+    if update:
+        update_fund_holdings(fund_list, ft, n, max_workers)
+    names_path = data_dir('fund_holding') / 'fund_names.pkl'
+    fund_names = dict(pd.read_pickle(names_path).values) if names_path.exists() else {}
+    index = FundHoldingIndex(fund_holdings(fund_list), fund_names,
+                             pd.Timestamp.today().strftime('%Y-%m-%d'))
+    if fund_list is None:
+        index.save()
+        fund_index_cache['default'] = index
+    return index
+
+
+def fund_holding_index(refresh=False):
+    '''读取本地的基金持仓索引（第一次调用时载入内存），没有时批量获取；refresh=True时增量更新'''
+    index = fund_index_cache.get('default')
+    if index is None and not refresh and (data_dir('fund_holding') / 'index.pkl').exists():
+        index = FundHoldingIndex.load()
+    if index is None or refresh:
+        index = build_fund_index()
+    fund_index_cache['default'] = index
+    return index
+
+
+def stock_funds(code, date=None):
+    '''持有某只股票的基金（见FundHoldingIndex.stock_funds）'''
+    return fund_holding_index().stock_funds(code, date)
+
+
+def fund_stocks(code, date=None):
+    '''某只基金的重仓股（见FundHoldingIndex.fund_stocks）'''
+    return fund_holding_index().fund_stocks(code, date)
+
+
+def stock_fund_changes(code, date=None):
+    '''某只股票持有基金与上一报告期相比的变化（见FundHoldingIndex.stock_fund_changes）'''
+    return fund_holding_index().stock_fund_changes(code, date)
+
+
+def fund_ownership(date=None):
+    '''每只股票的基金持有情况（见FundHoldingIndex.ownership），date='all'返回全部报告期'''
+    return fund_holding_index().ownership(date)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+基金净值的本地增量存储与对齐面板
+
+每只基金的历史净值保存为数据目录下的fund_nav/{code}.pkl，之后按本地交易日历只请求
+上次保存之后的记录（fund_data_single的pz参数），不再每次下载全部历史。
+fund_nav_panel把几千只基金一次对齐为日期×基金的float32矩阵（先求全部日期的并集，
+一次分配内存后按位置填入，不逐列对齐），在此基础上向量化计算阶段收益、回撤和相关系数：
+    nav = qs.fund_nav_panel(code_list, update=True)
+    qs.fund_period_returns(nav)
+    qs.fund_drawdown(nav)
+    qs.fund_corr(nav, window=250)
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from qstock.data.util import data_dir
+from qstock.data.trade_calendar import latest_trade_date, trade_days_between
+
+
+def fund_nav_path(code):
+    return data_dir('fund_nav') / f'{code}.pkl'
+
+
+def load_fund_nav(code):
+    '''读取本地保存的单只基金净值（单位净值、累计净值、涨跌幅），以日期为索引，没有时返回None'''
+    path = fund_nav_path(code)
+    return pd.read_pickle(path) if path.exists() else None
+
+
+def update_fund_nav(code):
+    '''增量更新单只基金的净值，返回新增的记录数'''
+    from qstock.data.trade import fund_data_single
+    old = load_fund_nav(code)
+    latest = pd.Timestamp(latest_trade_date())
+    if old is None or old.empty:
+        old = None
+        pz = 50000
+    else:
+        last = old.index[-1]
+        if last >= latest:
+            return 0
+        # 包括已保存的最后一天，用于检查衔接
+        pz = len(trade_days_between(last, latest))
+    df = fund_data_single(code, pz)
+    if df.empty:
+        return 0
+    if old is not None and last not in df.index:
+        # QDII等基金在A股休市日也公布净值，按A股交易日数取的记录不能覆盖到已保存的最后一天，
+        # 重新获取全部历史，避免中间缺失
+        df = fund_data_single(code, 50000)
+    if old is not None:
+        df = pd.concat([old, df])
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+    df.to_pickle(fund_nav_path(code))
+    return len(df) if old is None else len(df) - len(old)
+
+
+def update_fund_navs(code_list, max_workers=16):
+    '''增量更新多只基金的净值，返回{基金代码: 新增记录数}，获取失败的为None'''
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    code_list = [str(c) for c in code_list]
+
+    def run(code):
+        try:
+            return update_fund_nav(code)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = list(tqdm(executor.map(run, code_list), total=len(code_list), leave=False))
+    return dict(zip(code_list, counts))
+
+
+def fund_nav_panel(code_list=None, col='累计净值', start=None, end=None, update=False, dtype=np.float32):
+    '''
+    多只基金净值的日期×基金代码矩阵，缺失为nan
+    code_list:基金代码列表，默认本地保存的全部基金；col:'累计净值'、'单位净值'或'涨跌幅'
+    update:是否先增量更新；dtype:矩阵的数据类型，默认float32
+    '''
+    if code_list is None:
+        code_list = sorted(p.stem for p in data_dir('fund_nav').glob('*.pkl'))
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    code_list = [str(c) for c in code_list]
+    if update:
+        update_fund_navs(code_list)
+    series = {}
+    for code in code_list:
+        df = load_fund_nav(code)
+        if df is not None and not df.empty:
+            s = df[col].loc[start:end]
+            series[code] = (s.index.to_numpy(dtype='datetime64[ns]'), s.to_numpy(dtype=dtype))
+    if not series:
+        return pd.DataFrame(dtype=dtype)
+    dates = np.unique(np.concatenate([d for d, _ in series.values()]))
+    values = np.full((len(dates), len(series)), np.nan, dtype=dtype)
+    for j, (d, v) in enumerate(series.values()):
+        values[np.searchsorted(dates, d), j] = v
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'), columns=list(series))
+
+
+def fill_nav(nav):
+    '''净值矩阵向前填充（非交易日、未公布净值的日期沿用上一个净值），成立之前仍为nan'''
+    return nav.ffill()
+
+
+def fund_period_returns(nav, windows=(5, 20, 60, 120, 250), date=None):
+    '''
+    截至date（默认最后一天）的阶段收益率（%），返回以基金代码为索引的DataFrame，列为'n日收益'
+    按行数（交易日）计算，历史不足n日时为nan
+    '''
+    nav = fill_nav(nav if date is None else nav.loc[:pd.Timestamp(date)])
+    values = nav.to_numpy(dtype=np.float64)
+    if not len(values):
+        return pd.DataFrame(index=nav.columns)
+    last = values[-1]
+    out = {}
+    for w in windows:
+        out[f'{w}日收益'] = (last / values[-w - 1] - 1) * 100 if len(values) > w \
+            else np.full(values.shape[1], np.nan)
+    df = pd.DataFrame(out, index=nav.columns)
+    df.index.name = '基金代码'
+    return df
+
+
+def fund_rolling_returns(nav, window=20):
+    '''滚动window个交易日的收益率（%）矩阵'''
+    nav = fill_nav(nav)
+    return (nav / nav.shift(window) - 1) * 100
+
+
+def fund_drawdown(nav, start=None):
+    '''
+    回撤：返回(日期×基金的回撤矩阵（%，非正数）, 以基金代码为索引的汇总)，
+    汇总为最大回撤、最大回撤日期、当前回撤、年化波动率（%）
+    '''
+    nav = fill_nav(nav.loc[start:] if start is not None else nav)
+    values = nav.to_numpy(dtype=np.float64)
+    peak = np.fmax.accumulate(values, axis=0)
+    dd = (values / peak - 1) * 100
+    filled = np.where(np.isnan(dd), np.inf, dd)
+    worst = filled.argmin(axis=0) if len(dd) else np.array([], dtype=int)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret = values[1:] / values[:-1] - 1
+    summary = pd.DataFrame({
+        '最大回撤': np.nanmin(dd, axis=0) if len(dd) else np.nan,
+        '最大回撤日期': nav.index[worst] if len(dd) else pd.NaT,
+        '当前回撤': dd[-1] if len(dd) else np.nan,
+        '年化波动率': np.nanstd(ret, axis=0, ddof=1) * np.sqrt(250) * 100 if len(ret) > 1 else np.nan,
+    }, index=nav.columns)
+    summary.index.name = '基金代码'
+    return pd.DataFrame(dd, index=nav.index, columns=nav.columns), summary
+
+
+def fund_corr(nav, window=None, min_periods=20):
+    '''
+    基金日收益率的相关系数矩阵（基金×基金），window:只用最近window个交易日
+    两只基金只用共同有净值的日期计算（矩阵乘法一次算出全部成对统计量），共同日期少于min_periods时为nan
+    '''
+    if window is not None:
+        nav = nav.iloc[-window - 1:]
+    values = nav.to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret = values[1:] / values[:-1] - 1
+    valid = np.isfinite(ret)
+    x = np.where(valid, ret, 0.0)
+    m = valid.astype(np.float64)
+    n = m.T @ m
+    sx = x.T @ m          # sx[i, j]: i在共同日期上的收益之和
+    sxx = (x * x).T @ m
+    sxy = x.T @ x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spread = n * sxx - sx * sx
+        corr = (n * sxy - sx * sx.T) / np.sqrt(spread * spread.T)
+    corr[n < min_periods] = np.nan
+    return pd.DataFrame(corr, index=nav.columns, columns=nav.columns)
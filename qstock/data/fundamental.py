@@ -7,13 +7,15 @@ Created on Fri Sep 30 13:53:48 2022
 import pandas as pd
 import requests
 import calendar
+from io import StringIO
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from jsonpath import jsonpath
 from tqdm import tqdm
 from bs4 import BeautifulSoup
 
 from qstock.data.trade import latest_report_date,market_realtime
-from qstock.data.util import (trans_num,cn_headers,get_code_id,request_header, session,)
+from qstock.data.util import (trans_num,cn_header,get_code_id,request_header, session, data_dir,)
 
 #########################################################################
 # 股东变动情况
@@ -46,53 +48,115 @@ def stock_holder(holder=None,date=None, code=None, n=2):
 
 
 # 获取沪深市场某股票前十大股东信息
+holder_top10_fields = {
+    'GuDongDaiMa': '股东代码',
+    'GuDongMingCheng': '股东名称',
+    'ChiGuShu': '持股数(亿)',
+    'ChiGuBiLi': '持股比例(%)',
+    'ZengJian': '增减',
+    'BianDongBiLi': '变动率(%)'}
+
+def holder_number(s):
+    """
+    把'1.23亿'、'4567.89万'、'12.34%'等字符串整列转换为数值（万转换为亿），无法转换的为0
+    """
+    s = s.astype(str).str.strip().str.replace(',', '')
+    scale = s.str.endswith('万').map({True: 1e-4, False: 1.0})
+    num = pd.to_numeric(s.str.rstrip('亿万%'), errors='coerce')
+    return (num * scale).fillna(0)
+
+def holder_fc(code):
+    """股票代码转换为股本股东接口的参数，返回(fc, 6位代码)"""
+    from qstock.data.money_store import stock_code_id
+    code_id = stock_code_id(str(code))
+    mk, stock_code = code_id.split('.')
+    return (f'{stock_code}02' if mk == '0' else f'{stock_code}01'), stock_code
+
+def holder_report_dates(fc):
+    """前十大流通股东公开信息的报告期列表（由新到旧）"""
+    url0 = 'https://emh5.eastmoney.com/api/GuBenGuDong/GetFirstRequest2Data'
+    res = session.post(url0, json={"fc": fc}).json()
+    return jsonpath(res, '$..BaoGaoQi') or []
+
+def fetch_holder_top10(fc, stock_code, date):
+    """一个报告期的前十大流通股东，已结束披露的报告期保存到本地（数据目录下的holder_top10）"""
+    from qstock.data.fin_store import report_closed
+    path = data_dir('holder_top10', stock_code) / f"{''.join(str(date)[:10].split('-'))}.pkl"
+    if path.exists():
+        return pd.read_pickle(path)
+    url = 'https://emh5.eastmoney.com/api/GuBenGuDong/GetShiDaLiuTongGuDong'
+    response = session.post(url, json={"fc": fc, "BaoGaoQi": date})
+    response.encoding = 'utf-8'
+    items = jsonpath(response.json(), '$..ShiDaLiuTongGuDongList[:]')
+    if not items:
+        return pd.DataFrame()
+    df = pd.DataFrame(items).rename(columns=holder_top10_fields)
+    df.insert(0, '代码', stock_code)
+    df.insert(1, '日期', date)
+    df = df.drop(columns=['IsLink', '股东代码'], errors='ignore')
+    # 将object类型转为float
+    for col in ['持股数(亿)', '持股比例(%)', '变动率(%)']:
+        df[col] = holder_number(df[col])
+    if report_closed(date):
+        df.to_pickle(path)
+    return df
+
 def stock_holder_top10(code, n=2):
     """
     获取沪深市场指定股票前十大股东信息
     code : 股票代码
     n :最新 n个季度前10大流通股东公开信息
     """
-    fields = {
-        'GuDongDaiMa': '股东代码',
-        'GuDongMingCheng': '股东名称',
-        'ChiGuShu': '持股数(亿)',
-        'ChiGuBiLi': '持股比例(%)',
-        'ZengJian': '增减',
-        'BianDongBiLi': '变动率(%)'}
-
-    code_id = get_code_id(code)
-    mk = code_id.split('.')[0]
-    stock_code = code_id.split('.')[1]
-    fc = f'{stock_code}02' if mk == '0' else f'{stock_code}01'
-    data0 = {"fc": fc}
-    url0 = 'https://emh5.eastmoney.com/api/GuBenGuDong/GetFirstRequest2Data'
-    res = requests.post(url0, json=data0).json()
-    dates = jsonpath(res, '$..BaoGaoQi')
-    df_list = []
-
-    for date in dates[:n]:
-        data = {"fc": fc, "BaoGaoQi": date}
-        url = 'https://emh5.eastmoney.com/api/GuBenGuDong/GetShiDaLiuTongGuDong'
-        response = requests.post(url, json=data)
-        response.encoding = 'utf-8'
-        items = jsonpath(
-            response.json(), '$..ShiDaLiuTongGuDongList[:]')
-        if not items:
-            continue
-        df = pd.DataFrame(items)
-        df.rename(columns=fields, inplace=True)
-        df.insert(0, '代码', [stock_code for _ in range(len(df))])
-        df.insert(1, '日期', [date for _ in range(len(df))])
-        del df['IsLink']
-        del df['股东代码']
-        df_list.append(df)
-
-    dff = pd.concat(df_list, axis=0, ignore_index=True)
-    # 将object类型转为float
-    trans_cols = ['持股数(亿)', '持股比例(%)', '变动率(%)']
-    for col in trans_cols:
-        dff[col] = dff[col].apply(lambda x: float(x[:-1]) if x[-1] in ['亿', '%'] else 0)
-    return dff
+    fc, stock_code = holder_fc(code)
+    dates = holder_report_dates(fc)[:n]
+    with ThreadPoolExecutor(max_workers=max(min(len(dates), 8), 1)) as executor:
+        df_list = list(executor.map(lambda date: fetch_holder_top10(fc, stock_code, date), dates))
+    df_list = [df for df in df_list if not df.empty]
+    if not df_list:
+        return pd.DataFrame()
+    return pd.concat(df_list, axis=0, ignore_index=True)
+
+def holder_top10_history(code_list, n=8, max_workers=16):
+    """
+    多只股票最新n个报告期的前十大流通股东，返回合并的长表（列与stock_holder_top10相同）
+    先并发获取各股票的报告期列表，再并发获取全部(股票, 报告期)，已结束披露的报告期使用本地缓存
+    获取失败的股票或报告期不在结果中
+    """
+    if isinstance(code_list, str):
+        code_list = [code_list]
+
+    def dates_of(code):
+        try:
+            fc, stock_code = holder_fc(code)
+            return [(fc, stock_code, date) for date in holder_report_dates(fc)[:n]]
+        except Exception:
+            return []
+
+    def run(task):
+        try:
+            return fetch_holder_top10(*task)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tasks = [t for ts in executor.map(dates_of, code_list) for t in ts]
+        frames = list(tqdm(executor.map(run, tasks), total=len(tasks), leave=False))
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def holder_concentration(hist):
+    """
+    前十大流通股东集中度面板：hist为holder_top10_history的结果
+    返回{'前十大流通股东持股比例': 报告期×股票代码, '环比变化': 与上一报告期的差（百分点）,
+         '新进股东数': 报告期×股票代码}
+    """
+    df = hist.assign(日期=pd.to_datetime(hist['日期']), 新进=(hist['增减'] == '新进').astype(int))
+    share = df.pivot_table(index='日期', columns='代码', values='持股比例(%)', aggfunc='sum').sort_index()
+    new = df.pivot_table(index='日期', columns='代码', values='新进', aggfunc='sum').reindex_like(share)
+    share.index.name = new.index.name = '报告期'
+    return {'前十大流通股东持股比例': share, '环比变化': share.diff(), '新进股东数': new}
 
 
 # 获取沪深A股最新公开的股东数量
@@ -180,7 +244,7 @@ def stock_holder_con():
     url = "http://webapi.cninfo.com.cn/api/sysapi/p_sysapi1033"
     
     params = {"ctype": "",}
-    r = requests.post(url, headers=cn_headers, params=params)
+    r = requests.post(url, headers=cn_header(), params=params)
     data_json = r.json()
     df = pd.DataFrame(data_json["records"])
     old_cols=["控股比例","控股数量","简称","实控人",
@@ -681,77 +745,115 @@ def stock_yjbb(date= "20200331"):
 ###############################################################################
 #个股股票基本面数据
 #个股财务指标数据
-def stock_indicator(code):
+sina_indicator_url = 'https://money.finance.sina.com.cn/corp/go.php/vFD_FinancialGuideLine/stockid/{code}/ctrl/{year}/displaytype/4.phtml'
+sina_indicator_groups = ["每股指标", "盈利能力", "成长能力", "营运能力", "偿债及资本结构", "现金流量", "其他指标"]
+sina_indicator_fields = ['摊薄每股收益(元)','每股净资产_调整后(元)','每股经营性现金流(元)',
+        '每股资本公积金(元)','每股未分配利润(元)','总资产(元)','扣除非经常性损益后的净利润(元)',
+        '主营业务利润率(%)','总资产净利润率(%)','销售净利率(%)','净资产报酬率(%)','资产报酬率(%)',
+        '净资产收益率(%)','加权净资产收益率(%)','成本费用利润率(%)','主营业务成本率(%)',
+        '应收账款周转率(次)','存货周转率(次)','固定资产周转率(次)','总资产周转率(次)',
+        '流动资产周转率(次)','流动比率','速动比率','现金比率(%)','产权比率(%)','资产负债率(%)',
+        '经营现金净流量对销售收入比率(%)','经营现金净流量与净利润的比率(%)','经营现金净流量对负债比率(%)',
+        '主营业务收入增长率(%)','净利润增长率(%)','净资产增长率(%)','总资产增长率(%)']
+sina_indicator_names = ['每股收益','调整每股净资产','每股现金流','每股公积金','每股未分配利润','总资产','扣非净利润',
+      '主营利润率','总资产净利率','销售净利率','净资产报酬率','资产报酬率','净资产收益率','加权净资产收益率',
+      '成本费用利润率','主营业务成本率','应收账款周转率','存货周转率','固定资产周转率','总资产周转率',
+      '流动资产周转率','流动比率','速动比率','现金比率','产权比率','资产负债率','现金流销售比',
+      '现金流净利润比','现金流负债比','主营收入增长率','净利润增长率','净资产增长率','总资产增长率']
+
+def parse_sina_indicator(html):
+    """
+    解析新浪财务指标页面（一年），返回以报告日期为行、指标为列的DataFrame
+    表格第一列为指标名称，分类标题行（每股指标、盈利能力等）去掉后整体转置
+    """
+    table = pd.read_html(StringIO(html))[12].iloc[:, :-1]
+    table.columns = table.iloc[0, :]
+    table = table.iloc[1:, :].set_index(table.columns[0])
+    table = table[~table.index.astype(str).str.strip().isin(sina_indicator_groups)]
+    df = table.T
+    df = df.loc[:, ~df.columns.duplicated()]
+    df = df.reindex(columns=sina_indicator_fields)
+    df.columns = sina_indicator_names
+    df.index.name = '日期'
+    return df.reset_index()
+
+def sina_indicator_years(code):
+    """新浪财务指标页面中可选的年份列表，同时返回页面内容（2020年的数据）"""
+    r = session.get(sina_indicator_url.format(code=code, year=2020))
+    soup = BeautifulSoup(r.text, "lxml")
+    year_context = soup.find(attrs={"id": "con02-1"}).find("table").find_all("a")
+    return [item.text for item in year_context], r.text
+
+def sina_indicator_year(code, year, html=None):
+    """
+    一只股票一年的财务指标，年报披露结束的年份保存到本地（数据目录下的sina_indicator），之后不再请求
+    html:已获取的页面内容
+    """
+    from qstock.data.fin_store import report_closed
+    path = data_dir('sina_indicator', code) / f'{year}.pkl'
+    if path.exists():
+        return pd.read_pickle(path)
+    if html is None:
+        html = session.get(sina_indicator_url.format(code=code, year=year)).text
+    df = parse_sina_indicator(html)
+    if report_closed(f'{year}-12-31'):
+        df.to_pickle(path)
+    return df
+
+def stock_name_code(code):
+    """股票简称转换为代码，代码原样返回"""
+    code = str(code)
+    return code if code.isdigit() else stock_code_dict()[code]
+
+def stock_indicator(code, max_workers=8):
     """
     获取个股历史报告期所有财务分析指标
     https://money.finance.sina.com.cn/corp/go.php/vFD_FinancialGuideLine/stockid/600004/ctrl/2019/displaytype/4.phtml
     code: 股票代码或简称
+    各年份并发获取，已结束披露的年份使用本地缓存
     """
-    if not code.isdigit():
-        code=stock_code_dict()[code]
-    
-    url = f"https://money.finance.sina.com.cn/corp/go.php/vFD_FinancialGuideLine/stockid/{code}/ctrl/2020/displaytype/4.phtml"
-    r = requests.get(url)
-    soup = BeautifulSoup(r.text, "lxml")
-    year_context = soup.find(attrs={"id": "con02-1"}).find("table").find_all("a")
-    year_list = [item.text for item in year_context]
-    df = pd.DataFrame()
-    for year in tqdm(year_list, leave=False):
-        url = f"https://money.finance.sina.com.cn/corp/go.php/vFD_FinancialGuideLine/stockid/{code}/ctrl/{year}/displaytype/4.phtml"
-        r = requests.get(url)
-        temp_df = pd.read_html(r.text)[12].iloc[:, :-1]
-        temp_df.columns = temp_df.iloc[0, :]
-        temp_df = temp_df.iloc[1:, :]
-        df0 = pd.DataFrame()
-        indicator_list = ["每股指标", "盈利能力", "成长能力", "营运能力", "偿债及资本结构", "现金流量", "其他指标"]
-        for i in range(len(indicator_list)):
-            if i == 6:
-                inner_df = temp_df[
-                    temp_df.loc[
-                        temp_df.iloc[:, 0].str.find(indicator_list[i]) == 0, :
-                    ].index[0] :
-                ].T
-            else:
-                inner_df = temp_df[
-                    temp_df.loc[temp_df.iloc[:, 0].str.find(indicator_list[i]) == 0, :]
-                    .index[0] : temp_df.loc[
-                        temp_df.iloc[:, 0].str.find(indicator_list[i + 1]) == 0, :
-                    ]
-                    .index[0]
-                    - 1
-                ].T
-            inner_df = inner_df.reset_index(drop=True)
-            df0 = pd.concat([df0, inner_df], axis=1)
-        df0.columns = df0.iloc[0, :].tolist()
-        df0 = df0.iloc[1:, :]
-        df0.index = temp_df.columns.tolist()[1:]
-        df = pd.concat([df, df0])
-
-    df.dropna(inplace=True)
-    df.reset_index(inplace=True)
-    df.rename(columns={'index': '日期'}, inplace=True)
-    fields=['日期','摊薄每股收益(元)','每股净资产_调整后(元)','每股经营性现金流(元)',
-            '每股资本公积金(元)','每股未分配利润(元)','总资产(元)','扣除非经常性损益后的净利润(元)',
-            '主营业务利润率(%)','总资产净利润率(%)','销售净利率(%)','净资产报酬率(%)','资产报酬率(%)',
-            '净资产收益率(%)','加权净资产收益率(%)','成本费用利润率(%)','主营业务成本率(%)',
-            '应收账款周转率(次)','存货周转率(次)','固定资产周转率(次)','总资产周转率(次)',
-            '流动资产周转率(次)','流动比率','速动比率','现金比率(%)','产权比率(%)','资产负债率(%)',
-            '经营现金净流量对销售收入比率(%)','经营现金净流量与净利润的比率(%)','经营现金净流量对负债比率(%)',
-            '主营业务收入增长率(%)','净利润增长率(%)','净资产增长率(%)','总资产增长率(%)']
-
-    new_names=['日期','每股收益','调整每股净资产','每股现金流','每股公积金','每股未分配利润','总资产','扣非净利润',
-          '主营利润率','总资产净利率','销售净利率','净资产报酬率','资产报酬率','净资产收益率','加权净资产收益率',
-          '成本费用利润率','主营业务成本率','应收账款周转率','存货周转率','固定资产周转率','总资产周转率',
-          '流动资产周转率','流动比率','速动比率','现金比率','产权比率','资产负债率','现金流销售比',
-          '现金流净利润比','现金流负债比','主营收入增长率','净利润增长率','净资产增长率','总资产增长率']
-    
-    result=df[fields].rename(columns=dict(zip(fields,new_names)))
-    return result
+    code = stock_name_code(code)
+    year_list, html = sina_indicator_years(code)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(
+            lambda year: sina_indicator_year(code, year, html if year == '2020' else None), year_list))
+    if not frames:
+        return pd.DataFrame(columns=['日期'] + sina_indicator_names)
+    result = pd.concat(frames, ignore_index=True).dropna()
+    return trans_num(result, ['日期']).reset_index(drop=True)
+
+def stock_indicators(code_list, max_workers=8):
+    """
+    多只股票的历史财务分析指标，返回合并的长表（代码、日期、各指标）
+    code_list: 股票代码或简称列表；获取失败的股票不在结果中
+    """
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    code_list = [stock_name_code(c) for c in code_list]
+
+    def run(code):
+        try:
+            df = stock_indicator(code, max_workers=4)
+        except Exception:
+            return None
+        df.insert(0, '代码', code)
+        return df
 
-def stock_code_dict():
-    df=market_realtime()
-    name_code=dict(df[['名称','代码']].values)
-    return name_code
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(tqdm(executor.map(run, code_list), total=len(code_list), leave=False))
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+code_name_cache = {}
+
+def stock_code_dict(refresh=False):
+    """股票简称到代码的字典，第一次调用时获取，之后复用（refresh=True时重新获取）"""
+    if refresh or 'name_code' not in code_name_cache:
+        df=market_realtime()
+        code_name_cache['name_code'] = dict(df[['名称','代码']].values)
+    return code_name_cache['name_code']
 
 ###机构评级和每股收益预测
 def eps_forecast():
@@ -5,20 +5,22 @@ Created on Fri Sep 30 13:38:58 2022
 @author: Jinyi Zhang
 """
 
+import os
+import re
+import json
+import threading
+import warnings
 import requests
 import pandas as pd
-import signal
 from tqdm import tqdm
-from func_timeout import func_set_timeout
-import multitasking
 from bs4 import BeautifulSoup
 from datetime import datetime
 from functools import lru_cache
-from qstock.data.util import ths_code_name,trans_num
+from concurrent.futures import ThreadPoolExecutor
+from qstock.data.util import ths_code_name,trans_num,data_dir
 from qstock.data.trade import latest_trade_date
 from qstock.data import demjson
 from qstock.stock.ths_em_pool import ths_header
-signal.signal(signal.SIGINT, multitasking.killall)
 
 
 #同花顺概念板块
@@ -48,29 +50,28 @@ def ths_index_member(code=None):
 
 
 #多线程获取同花顺指数数据
-def ths_index_price(flag='概念'):
-    df_list=[]
+def ths_index_price(flag='概念', max_workers=8):
+    '''
+    获取全部同花顺概念或行业板块指数的收盘价，列为板块
+    各年K线由ths_kline_executor统一并发获取，单个请求超时ths_kline_timeout秒，
+    获取失败的板块给出警告后跳过
+    '''
     codes=ths_index_name(flag)
-    pbar = tqdm(total=len(codes))
-    
-    @multitasking.task
-    @func_set_timeout(5)
+
     def run(code):
-        try: 
-            temp=ths_index_data(code)
-            temp[code]=temp.close
-            df_list.append(temp[code])
-            pbar.update()
-        except:
-            pass
-    
-    
-    for code in codes:
         try:
-            run(code)
-        except:
-            continue
-    multitasking.wait_for_tasks()
+            return ths_index_data(code).close.rename(code)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results=list(tqdm(executor.map(run, codes), total=len(codes), leave=False))
+    df_list=[s for s in results if s is not None]
+    failed=[code for code, s in zip(codes, results) if s is None]
+    if failed:
+        warnings.warn(f'{len(failed)}个板块指数获取失败：{failed[:10]}')
+    if not df_list:
+        return pd.DataFrame()
     # 转换为dataframe
     df = pd.concat(df_list, axis=1)
     return df.dropna(axis=1)
@@ -151,41 +152,83 @@ def ths_industry_data(code= "半导体及元件",start= "20200101",end= None) :
         symbol=code
     else:
         symbol=ths_name_code(code)
-    df = pd.DataFrame()
-    current_year = datetime.now().year
-    for year in range(2000, current_year + 1):
-        url = f"http://d.10jqka.com.cn/v4/line/bk_{symbol}/01/{year}.js"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.90 Safari/537.36",
-            "Referer": "http://q.10jqka.com.cn",
-            "Host": "d.10jqka.com.cn",
-        }
-        res = requests.get(url, headers=headers)
-        data_text = res.text
-        try:
-            demjson.decode(data_text[data_text.find("{") : -1])
-        except:
-            continue
-        temp_df = demjson.decode(data_text[data_text.find("{") : -1])
-        temp_df = pd.DataFrame(temp_df["data"].split(";"))
-        temp_df = temp_df.iloc[:, 0].str.split(",", expand=True)
-        df = pd.concat([df, temp_df], ignore_index=True)
+    start_year = max(2000, pd.to_datetime(start).year)
+    df = ths_bk_kline(symbol, start_year)
+    if df.empty:
+        return df
+    c1 = df.index >= pd.to_datetime(start).date()
+    c2 = df.index <= pd.to_datetime(end).date()
+    return df[c1 & c2]
+
+#同花顺板块指数年度K线
+#全部板块的年度K线共用一个线程池，限制总并发数（ths_index_price等批量获取时不会为每个板块各开线程池）
+ths_kline_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ths_kline')
+ths_kline_timeout = 5
+
+ths_kline_headers = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.90 Safari/537.36",
+    "Referer": "http://q.10jqka.com.cn",
+    "Host": "d.10jqka.com.cn",
+}
 
-    if len(df.columns) == 11:
-        df.columns = ["日期","开盘价","最高价","最低价","收盘价","成交量",
-            "成交额","_","_","_","_",]
+def ths_kline_decode(text):
+    """
+    解析同花顺v4/line年度K线的JSONP数据，返回data字段字符串
+    先用标准库json解析，失败时用正则提取data字段，最后才退回demjson
+    解析失败返回None
+    """
+    body = text[text.find("{") : text.rfind("}") + 1]
+    if not body:
+        return None
+    try:
+        return json.loads(body).get("data")
+    except ValueError:
+        pass
+    m = re.search(r'"?data"?\s*:\s*"([^"]*)"', body)
+    if m is not None:
+        return m.group(1)
+    try:
+        return demjson.decode(body).get("data")
+    except Exception:
+        return None
+
+def ths_kline_year(symbol, year):
+    """
+    获取同花顺板块指数某一年的K线数据字符串
+    已结束年份的数据不会再变化，缓存到本地后不再请求
+    symbol:同花顺板块指数代码，如'881121'
+    year:年份
+    """
+    file = data_dir('ths_kline') / f"{symbol}_{year}.txt"
+    closed = year < datetime.now().year
+    if closed and file.exists():
+        return file.read_text(encoding='utf-8')
+    url = f"http://d.10jqka.com.cn/v4/line/bk_{symbol}/01/{year}.js"
+    res = requests.get(url, headers=ths_kline_headers, timeout=ths_kline_timeout)
+    if res.status_code == 404:
+        data = ''
     else:
-        df.columns = ["日期","开盘价","最高价","最低价","收盘价","成交量",
-            "成交额","_", "_","_","_","_",]
-    
-    df["日期"] = pd.to_datetime(df["日期"]).dt.date
-    c1 = pd.to_datetime(start) < df["日期"]
-    c2 = pd.to_datetime(end) > df["日期"]
-    df = df[c1 & c2]
-    cols1 = ["日期","开盘价","最高价","最低价","收盘价","成交量"]
-    cols2 = ['date', 'open', 'high', 'low', 'close', 'volume']
-    df = df.rename(columns=dict(zip(cols1,cols2)))[cols2]
-    df.set_index('date',inplace=True)
+        data = ths_kline_decode(res.text)
+        if data is None:
+            return ''
+    if closed:
+        file.write_text(data, encoding='utf-8')
+    return data
+
+def ths_bk_kline(symbol, start_year=2000):
+    """
+    并发获取同花顺板块指数从start_year至今的日K线（使用共用的ths_kline_executor）
+    返回以date为索引的open、high、low、close、volume数据
+    """
+    cols = ['date', 'open', 'high', 'low', 'close', 'volume']
+    years = range(int(start_year), datetime.now().year + 1)
+    texts = list(ths_kline_executor.map(lambda y: ths_kline_year(symbol, y), years))
+    rows = [r.split(',')[:6] for t in texts if t for r in t.split(';') if r]
+    if not rows:
+        return pd.DataFrame(columns=cols[1:]).rename_axis('date')
+    df = pd.DataFrame(rows, columns=cols)
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    df = df.drop_duplicates('date').set_index('date')
     ignore_cols = ['date']
     df = trans_num(df, ignore_cols)
     return df
@@ -308,14 +351,22 @@ def ths_concept_member(code= "阿里巴巴概念"):
     df = trans_num(df, ignore_cols)
     return df.drop_duplicates()
 
-def ths_concept_data(code='白酒概念',start= "2020"):
+#同花顺概念板块代码与指数代码对应关系，不会变化，缓存到本地
+#ths_index_price的多个线程会同时读写缓存文件，读写都在锁内，写入先写临时文件再替换
+concept_symbol_lock = threading.Lock()
+
+
+def ths_concept_symbol(code):
     """
-    同花顺-板块-概念板块-指数数据
-    http://q.10jqka.com.cn/gn/detail/code/301558/
-    start: 开始年份; e.g., 2019
+    获取同花顺概念板块对应的指数代码
+    code:概念板块代码
     """
-    code_map = ths_concept_code()
-    symbol_url = f"http://q.10jqka.com.cn/gn/detail/code/{code_map[code]}/"
+    file = data_dir('ths_kline') / 'concept_symbol.json'
+    with concept_symbol_lock:
+        symbols = json.loads(file.read_text()) if file.exists() else {}
+    if code in symbols:
+        return symbols[code]
+    symbol_url = f"http://q.10jqka.com.cn/gn/detail/code/{code}/"
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.90 Safari/537.36",
     }
@@ -324,36 +375,20 @@ def ths_concept_data(code='白酒概念',start= "2020"):
     symbol_code = (
         soup.find("div", attrs={"class": "board-hq"}).find("span").text
     )
-    df = pd.DataFrame()
-    current_year = datetime.now().year
-    for year in range(int(start), current_year + 1):
-        url = f"http://d.10jqka.com.cn/v4/line/bk_{symbol_code}/01/{year}.js"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.90 Safari/537.36",
-            "Referer": "http://q.10jqka.com.cn",
-            "Host": "d.10jqka.com.cn",
-        }
-        r = requests.get(url, headers=headers)
-        data_text = r.text
-        try:
-            demjson.decode(data_text[data_text.find("{") : -1])
-        except:
-            continue
-        temp_df = demjson.decode(data_text[data_text.find("{") : -1])
-        temp_df = pd.DataFrame(temp_df["data"].split(";"))
-        temp_df = temp_df.iloc[:, 0].str.split(",", expand=True)
-        df = pd.concat([df, temp_df], ignore_index=True)
-    if df.columns.shape[0] == 12:
-        df.columns = ["日期","开盘价","最高价","最低价","收盘价","成交量",
-            "成交额","_","_","_","_","_",]
-    else:
-        df.columns = ["日期","开盘价","最高价","最低价","收盘价", "成交量",
-            "成交额","_","_","_","_",]
-    df = df[["日期","开盘价","最高价","最低价","收盘价","成交量","成交额",]]
-    cols1 = ["日期","开盘价","最高价","最低价","收盘价","成交量"]
-    cols2 = ['date', 'open', 'high', 'low', 'close', 'volume']
-    df = df.rename(columns=dict(zip(cols1,cols2)))[cols2]
-    df.set_index('date',inplace=True)
-    ignore_cols = ['date']
-    df = trans_num(df, ignore_cols)
-    return df
\ No newline at end of file
+    with concept_symbol_lock:
+        symbols = json.loads(file.read_text()) if file.exists() else {}
+        symbols[code] = symbol_code
+        tmp = file.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(symbols))
+        tmp.replace(file)
+    return symbol_code
+
+def ths_concept_data(code='白酒概念',start= "2020"):
+    """
+    同花顺-板块-概念板块-指数数据
+    http://q.10jqka.com.cn/gn/detail/code/301558/
+    start: 开始年份; e.g., 2019
+    """
+    code_map = ths_concept_code()
+    symbol_code = ths_concept_symbol(code_map[code])
+    return ths_bk_kline(symbol_code, str(start)[:4])
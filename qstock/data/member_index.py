@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+股票与板块（行业、概念、地域）的成份关系索引
+
+一次性批量获取全部板块的成份股（东方财富BK板块、同花顺行业和概念板块），
+以CSR格式保存在本地数据目录（members/{source}.npz和{source}.json）：
+板块->股票、股票->板块两个方向各一组(ptr, idx)数组，查询时不访问网络。
+每天第一次使用时增量刷新：先获取板块列表和成份股数量（东方财富1个请求），
+只重新获取新增板块和成份股数量有变化的板块，成份股的调入调出记录在
+members/{source}_changes.csv中。成份股数量不变的调整（同时调入、调出）
+需要build_member_index(source, full=True)全部重新获取才能发现。
+
+用法：
+    idx = qs.member_index('em')
+    idx.stock_boards('600519')            # 某只股票所属的全部板块
+    idx.board_stocks('白酒')              # 板块成份股代码
+    idx.stocks_boards(code_list)          # 多只股票的所属板块（长表）
+    idx.boards_stocks(['白酒', '半导体'])  # 多个板块的成份股（长表）
+"""
+import json
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from tqdm import tqdm
+
+from qstock.data.util import session, request_header, data_dir, ths_code_name, ths_header
+
+# 东方财富板块类型
+em_board_fs = {
+    '行业': 'm:90 t:2 f:!50',
+    '概念': 'm:90 t:3 f:!50',
+    '地域': 'm:90 t:1 f:!50',
+}
+# 同花顺成份股分页地址
+ths_member_url = {
+    '行业': 'http://q.10jqka.com.cn/thshy/detail/field/199112/order/desc/page/{page}/ajax/1/code/{code}',
+    '概念': 'http://q.10jqka.com.cn/gn/detail/field/264648/order/desc/page/{page}/ajax/1/code/{code}',
+}
+member_sources = ('em', 'ths')
+member_board_cols = ['code', 'name', 'type', 'count']
+
+
+def em_clist(fs, fields):
+    params = (
+        ('pn', '1'),
+        ('pz', '1000000'),
+        ('po', '1'),
+        ('np', '1'),
+        ('fltt', '2'),
+        ('invt', '2'),
+        ('fid', 'f12'),
+        ('fs', fs),
+        ('fields', fields),
+    )
+    url = 'http://push2.eastmoney.com/api/qt/clist/get'
+    data = session.get(url, headers=request_header, params=params).json()['data']
+    return data['diff'] if data else []
+
+
+def em_boards():
+    '''东方财富全部行业、概念、地域板块，count为成份股数量（上涨+下跌+平盘家数）'''
+    data_list = []
+    for kind, fs in em_board_fs.items():
+        rows = em_clist(fs, 'f12,f14,f104,f105,f106')
+        df = pd.DataFrame(rows, columns=['f12', 'f14', 'f104', 'f105', 'f106'])
+        count = df[['f104', 'f105', 'f106']].apply(pd.to_numeric, errors='coerce').sum(axis=1, min_count=1)
+        data_list.append(pd.DataFrame({'code': df['f12'], 'name': df['f14'], 'type': kind, 'count': count}))
+    return pd.concat(data_list, ignore_index=True)
+
+
+def em_board_members(code, kind=None):
+    '''东方财富板块成份股，返回{股票代码: 名称}'''
+    return {row['f12']: row['f14'] for row in em_clist(f'b:{code} f:!50', 'f12,f14')}
+
+
+def ths_boards():
+    '''同花顺全部行业、概念板块，行业板块没有成份股数量（每次刷新都重新获取）'''
+    from qstock.data.industry import ths_concept_name_code
+    industry = pd.DataFrame({'code': list(ths_code_name), 'name': list(ths_code_name.values()),
+                             'type': '行业', 'count': np.nan})
+    df = ths_concept_name_code()
+    concept = pd.DataFrame({'code': df['代码'].astype(str), 'name': df['概念名称'],
+                            'type': '概念', 'count': pd.to_numeric(df['成分股数量'], errors='coerce')})
+    return pd.concat([industry, concept], ignore_index=True)
+
+
+def ths_board_members(code, kind='概念'):
+    '''同花顺板块成份股（逐页获取），返回{股票代码: 名称}'''
+    from bs4 import BeautifulSoup
+    headers = ths_header()
+    url = ths_member_url[kind]
+    members = {}
+    page, page_num = 1, 1
+    while page <= page_num:
+        res = requests.get(url.format(page=page, code=code), headers=headers)
+        if page == 1:
+            soup = BeautifulSoup(res.text, 'lxml')
+            pages = soup.find_all('a', attrs={'class': 'changePage'})
+            page_num = int(pages[-1]['page']) if pages else 1
+        try:
+            df = pd.read_html(res.text)[0]
+        except ValueError:
+            break
+        members.update(zip(df['代码'].astype(str).str.zfill(6), df['名称']))
+        page += 1
+    return members
+
+
+member_fetchers = {
+    'em': (em_boards, em_board_members),
+    'ths': (ths_boards, ths_board_members),
+}
+
+
+class MemberIndex:
+    '''
+    股票-板块二部图的CSR索引
+    boards:板块列表（code、name、type、count），stocks:股票代码数组，names:股票名称数组
+    board_ptr/board_idx:第i个板块的成份股为stocks[board_idx[board_ptr[i]:board_ptr[i+1]]]
+    stock_ptr/stock_idx:第j只股票所属板块为boards.iloc[stock_idx[stock_ptr[j]:stock_ptr[j+1]]]
+    '''
+
+    def __init__(self, boards, stocks, names, board_ptr, board_idx, updated=None):
+        self.boards = boards.reset_index(drop=True)
+        self.stocks = np.asarray(stocks, dtype=str)
+        self.names = np.asarray(names, dtype=str)
+        self.board_ptr = np.asarray(board_ptr, dtype=np.int64)
+        self.board_idx = np.asarray(board_idx, dtype=np.int32)
+        self.updated = updated
+        # 反向索引：按股票排序的边
+        rows = np.repeat(np.arange(len(self.boards), dtype=np.int32), np.diff(self.board_ptr))
+        order = np.argsort(self.board_idx, kind='stable')
+        self.stock_idx = rows[order]
+        self.stock_ptr = np.r_[0, np.cumsum(np.bincount(self.board_idx, minlength=len(self.stocks)))]
+        self.stock_pos = {code: i for i, code in enumerate(self.stocks)}
+        self.board_pos = {code: i for i, code in enumerate(self.boards['code'])}
+        # 板块名称也可以查询，重名时以先出现的为准
+        for i, name in enumerate(self.boards['name']):
+            self.board_pos.setdefault(name, i)
+
+    @classmethod
+    def from_members(cls, boards, members, updated=None):
+        '''由板块列表和{板块代码: {股票代码: 名称}}构造'''
+        names = {}
+        for m in members.values():
+            names.update(m)
+        stocks = np.array(sorted(names), dtype=str)
+        pos = {code: i for i, code in enumerate(stocks)}
+        boards = boards.reset_index(drop=True)
+        idx_list = [np.sort(np.fromiter((pos[c] for c in members.get(code, ())), dtype=np.int32))
+                    for code in boards['code']]
+        ptr = np.r_[0, np.cumsum([len(i) for i in idx_list])]
+        idx = np.concatenate(idx_list) if idx_list else np.array([], dtype=np.int32)
+        return cls(boards, stocks, [names[c] for c in stocks], ptr, idx, updated)
+
+    def __len__(self):
+        return len(self.board_idx)
+
+    def __repr__(self):
+        return (f'MemberIndex({len(self.boards)} boards, {len(self.stocks)} stocks, '
+                f'{len(self)} members, updated={self.updated})')
+
+    def board_members(self, i):
+        return self.board_idx[self.board_ptr[i]:self.board_ptr[i + 1]]
+
+    def stock_members(self, j):
+        return self.stock_idx[self.stock_ptr[j]:self.stock_ptr[j + 1]]
+
+    def members(self):
+        '''{板块代码: {股票代码: 名称}}'''
+        return {code: dict(zip(self.stocks[m], self.names[m]))
+                for code, m in ((code, self.board_members(i)) for i, code in enumerate(self.boards['code']))}
+
+    def stock_boards(self, code, kind=None):
+        '''
+        股票所属的全部板块，返回code、name、type
+        kind:只返回某类板块，'行业'、'概念'或'地域'
+        '''
+        j = self.stock_pos.get(str(code))
+        if j is None:
+            return self.boards.iloc[:0][['code', 'name', 'type']]
+        df = self.boards.iloc[self.stock_members(j)][['code', 'name', 'type']]
+        if kind is not None:
+            df = df[df['type'] == kind]
+        return df.reset_index(drop=True)
+
+    def board_stocks(self, board):
+        '''板块成份股代码列表，board为板块代码或名称'''
+        i = self.board_pos.get(str(board))
+        if i is None:
+            raise KeyError(f'没有找到板块：{board}')
+        return list(self.stocks[self.board_members(i)])
+
+    def stocks_boards(self, code_list=None, kind=None):
+        '''
+        多只股票所属板块的长表：股票代码、股票名称、板块代码、板块名称、板块类型
+        code_list:默认全部股票
+        '''
+        if code_list is None:
+            cols = np.arange(len(self.stocks))
+        else:
+            if isinstance(code_list, str):
+                code_list = [code_list]
+            cols = np.array([self.stock_pos[c] for c in map(str, code_list) if c in self.stock_pos], dtype=np.int64)
+        counts = self.stock_ptr[cols + 1] - self.stock_ptr[cols]
+        starts = np.repeat(self.stock_ptr[cols] - np.r_[0, np.cumsum(counts)[:-1]], counts)
+        edges = self.stock_idx[starts + np.arange(counts.sum())]
+        stock = np.repeat(cols, counts)
+        df = self.edge_frame(stock, edges)
+        if kind is not None:
+            df = df[df['板块类型'] == kind].reset_index(drop=True)
+        return df
+
+    def boards_stocks(self, board_list=None):
+        '''多个板块成份股的长表，board_list为板块代码或名称列表，默认全部板块'''
+        if board_list is None:
+            rows = np.arange(len(self.boards))
+        else:
+            if isinstance(board_list, str):
+                board_list = [board_list]
+            missing = [b for b in map(str, board_list) if b not in self.board_pos]
+            if missing:
+                raise KeyError(f'没有找到板块：{missing}')
+            rows = np.array([self.board_pos[b] for b in map(str, board_list)], dtype=np.int64)
+        counts = self.board_ptr[rows + 1] - self.board_ptr[rows]
+        starts = np.repeat(self.board_ptr[rows] - np.r_[0, np.cumsum(counts)[:-1]], counts)
+        stock = self.board_idx[starts + np.arange(counts.sum())]
+        return self.edge_frame(stock, np.repeat(rows, counts))
+
+    def edge_frame(self, stock, board):
+        boards = self.boards
+        return pd.DataFrame({
+            '代码': self.stocks[stock],
+            '名称': self.names[stock],
+            '板块代码': boards['code'].to_numpy()[board],
+            '板块名称': boards['name'].to_numpy()[board],
+            '板块类型': boards['type'].to_numpy()[board],
+        })
+
+    def matrix(self, dense=False):
+        '''
+        板块×股票的0/1成份矩阵，行为boards，列为stocks
+        安装了scipy时返回scipy.sparse.csr_matrix，否则（或dense=True时）返回numpy数组
+        '''
+        shape = (len(self.boards), len(self.stocks))
+        if not dense:
+            try:
+                from scipy import sparse
+                return sparse.csr_matrix((np.ones(len(self), dtype=np.float64), self.board_idx, self.board_ptr),
+                                         shape=shape)
+            except ImportError:
+                pass
+        m = np.zeros(shape)
+        m[np.repeat(np.arange(shape[0]), np.diff(self.board_ptr)), self.board_idx] = 1
+        return m
+
+    def save(self, path):
+        '''保存到path.npz（CSR数组）和path.json（板块、股票名称）'''
+        path = data_dir('members') / path if isinstance(path, str) else path
+        np.savez_compressed(path.with_suffix('.tmp.npz'), board_ptr=self.board_ptr, board_idx=self.board_idx)
+        path.with_suffix('.tmp.npz').replace(path.with_suffix('.npz'))
+        meta = {
+            'updated': self.updated,
+            'boards': self.boards[member_board_cols].astype(object).where(self.boards[member_board_cols].notna(), None)
+                          .values.tolist(),
+            'stocks': self.stocks.tolist(),
+            'names': self.names.tolist(),
+        }
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        tmp.replace(path.with_suffix('.json'))
+
+    @classmethod
+    def load(cls, path):
+        path = data_dir('members') / path if isinstance(path, str) else path
+        meta = json.loads(path.with_suffix('.json').read_text(encoding='utf-8'))
+        arrays = np.load(path.with_suffix('.npz'))
+        boards = pd.DataFrame(meta['boards'], columns=member_board_cols)
+        boards['count'] = pd.to_numeric(boards['count'])
+        return cls(boards, meta['stocks'], meta['names'], arrays['board_ptr'], arrays['board_idx'], meta['updated'])
+
+
+def fetch_members(source, boards, max_workers=16):
+    '''并发获取boards中各板块的成份股，返回{板块代码: {股票代码: 名称}}，获取失败的板块不在结果中'''
+    get_members = member_fetchers[source][1]
+    result = {}
+
+    def run(row):
+        try:
+            return row.code, get_members(row.code, row.type)
+        except Exception:
+            return row.code, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for code, members in tqdm(executor.map(run, boards.itertuples(index=False)),
+                                  total=len(boards), leave=False):
+            if members is not None:
+                result[code] = members
+    return result
+
+
+def log_changes(source, boards, old, new, date):
+    '''把成份股的调入调出追加到members/{source}_changes.csv，返回变化记录'''
+    names = dict(zip(boards['code'], boards['name']))
+    rows = []
+    for code in sorted(set(old) | set(new)):
+        before, after = old.get(code, {}), new.get(code, {})
+        # 新增的板块不记录调入
+        if code not in old:
+            continue
+        rows += [(date, code, names.get(code, ''), s, after.get(s, before.get(s)), '调入')
+                 for s in sorted(set(after) - set(before))]
+        rows += [(date, code, names.get(code, ''), s, before.get(s), '调出')
+                 for s in sorted(set(before) - set(after))]
+    df = pd.DataFrame(rows, columns=['日期', '板块代码', '板块名称', '代码', '名称', '变动'])
+    if len(df):
+        path = data_dir('members') / f'{source}_changes.csv'
+        df.to_csv(path, mode='a', header=not path.exists(), index=False, encoding='utf-8')
+    return df
+
+
+def build_member_index(source='em', full=False, max_workers=16):
+    '''
+    获取全部板块的成份股，建立并保存成份关系索引
+    source:'em'东方财富行业/概念/地域板块，'ths'同花顺行业/概念板块
+    full:False时只重新获取新增板块和成份股数量有变化的板块，True时全部重新获取
+    '''
+    if source not in member_sources:
+        raise ValueError(f'source只能是{member_sources}')
+    today = datetime.now().strftime('%Y-%m-%d')
+    boards = member_fetchers[source][0]().drop_duplicates('code').reset_index(drop=True)
+    path = data_dir('members') / source
+    old = {}
+    if path.with_suffix('.json').exists():
+        previous = MemberIndex.load(path)
+        old = previous.members()
+        old_count = dict(zip(previous.boards['code'], previous.boards['count']))
+    if full or not old:
+        todo = boards
+    else:
+        # 成份股数量没有变化的板块沿用本地数据（数量未知的板块都重新获取）
+        same = np.array([code in old and pd.notna(count) and old_count.get(code) == count
+                         for code, count in zip(boards['code'], boards['count'])], dtype=bool)
+        todo = boards[~same]
+    fetched = fetch_members(source, todo, max_workers)
+    members = {code: fetched.get(code, old.get(code, {})) for code in boards['code']}
+    # 获取失败的板块保存原来的成份股数量（新板块为nan），下次增量更新时重新获取
+    failed = boards['code'].isin(todo['code']) & ~boards['code'].isin(list(fetched))
+    if failed.any():
+        previous_count = boards['code'].map(old_count if old else {})
+        boards = boards.assign(count=boards['count'].where(~failed, previous_count))
+    if old:
+        log_changes(source, boards, {c: old[c] for c in fetched if c in old}, fetched, today)
+    index = MemberIndex.from_members(boards, members, today)
+    index.save(path)
+    return index
+
+
+member_cache = {}
+
+
+def member_index(source='em', refresh=True):
+    '''
+    读取本地的股票-板块成份关系索引（MemberIndex），没有时批量获取全部板块
+    refresh:本地索引不是今天建立的时增量刷新
+    '''
+    index = member_cache.get(source)
+    if index is None and (data_dir('members') / f'{source}.json').exists():
+        index = MemberIndex.load(data_dir('members') / source)
+    today = datetime.now().strftime('%Y-%m-%d')
+    if index is None or (refresh and index.updated < today):
+        index = build_member_index(source)
+    member_cache[source] = index
+    return index
+
+
+def member_changes(source='em', start=None):
+    '''成份股调入调出记录，start:只返回该日期之后的记录，如'2023-05-01' '''
+    path = data_dir('members') / f'{source}_changes.csv'
+    if not path.exists():
+        return pd.DataFrame(columns=['日期', '板块代码', '板块名称', '代码', '名称', '变动'])
+    df = pd.read_csv(path, dtype=str, encoding='utf-8')
+    if start is not None:
+        df = df[df['日期'] >= str(pd.Timestamp(start).date())]
+    return df.reset_index(drop=True)
+
+
+def stock_boards(code, source='em', kind=None):
+    '''股票所属的全部板块（本地索引，不逐只请求），kind:'行业'、'概念'或'地域' '''
+    return member_index(source).stock_boards(code, kind)
+
+
+def board_stocks(board, source='em'):
+    '''板块成份股代码列表（本地索引），board为板块代码或名称'''
+    return member_index(source).board_stocks(board)
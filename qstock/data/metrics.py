@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+"""
+数据接口运行指标（需手动开启）
+
+enable()后qstock的数据接口函数（trade、money、fundamental、industry、macro、
+news、wencai模块中的公开函数）都会被包装，记录：
+1.每个host/接口路径的请求数、响应字节数、重试数、失败数和请求延迟分布
+2.每次函数调用的耗时，并分解为网络(network)、JSON解析(decode)、
+  DataFrame构建(build，即总耗时减去前两者)三个阶段
+
+用法：
+    from qstock import metrics
+    metrics.enable()
+    df = qs.get_data(code_list)
+    print(metrics.summary())
+    print(metrics.prometheus_text())
+    with metrics.trace() as t:
+        qs.realtime_data()
+    print(t.to_frame())
+
+说明：各阶段耗时按调用所在线程统计；get_data等多线程接口中，
+工作线程内的web_data等调用会作为单独的调用记录
+"""
+import bisect
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+
+from qstock.data import demjson
+from qstock.data.cassette import request_key
+
+# 需要包装的数据接口模块
+fetcher_modules = ('trade', 'trade_calendar', 'money', 'fundamental', 'industry', 'macro', 'news', 'wencai')
+
+# 延迟分布的分桶上界（秒）
+request_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+call_buckets = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+phases = ('total', 'network', 'decode', 'build')
+
+
+class Histogram:
+    '''Prometheus风格的累计分桶直方图'''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''返回[(上界, 累计次数), ...]，最后一项上界为+Inf'''
+        result, total = [], 0
+        for le, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            result.append((le, total))
+        return result
+
+    def quantile(self, q):
+        '''按分桶线性插值估计分位数'''
+        if not self.count:
+            return float('nan')
+        rank, lower, seen = q * self.count, 0.0, 0
+        for le, n in zip(self.buckets, self.counts):
+            if seen + n >= rank and n:
+                return lower + (le - lower) * (rank - seen) / n
+            seen += n
+            lower = le
+        return self.buckets[-1]
+
+
+class Registry:
+    '''全部指标的存储，线程安全'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (host, endpoint) -> 计数
+            self.requests = defaultdict(int)
+            self.bytes = defaultdict(int)
+            self.retries = defaultdict(int)
+            self.failures = defaultdict(int)
+            self.request_seconds = defaultdict(lambda: Histogram(request_buckets))
+            # function -> 计数；(function, phase) -> 直方图
+            self.calls = defaultdict(int)
+            self.call_errors = defaultdict(int)
+            self.call_seconds = defaultdict(lambda: Histogram(call_buckets))
+
+    def observe_request(self, host, endpoint, seconds, size, failed, retried):
+        key = (host, endpoint)
+        with self.lock:
+            self.requests[key] += 1
+            self.bytes[key] += size
+            self.failures[key] += failed
+            self.retries[key] += retried
+            self.request_seconds[key].observe(seconds)
+
+    def observe_call(self, call):
+        with self.lock:
+            self.calls[call.function] += 1
+            self.call_errors[call.function] += call.error is not None
+            for phase in phases:
+                self.call_seconds[(call.function, phase)].observe(getattr(call, phase))
+
+
+registry = Registry()
+
+
+class Call:
+    '''一次数据接口调用的记录'''
+
+    def __init__(self, function, depth):
+        self.function = function
+        self.depth = depth
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.total = self.network = self.decode = self.build = 0.0
+        self.requests = self.bytes = self.failures = self.retries = 0
+        self.error = None
+
+    def as_dict(self):
+        return {'function': self.function, 'thread': self.thread, 'depth': self.depth,
+                'start': pd.Timestamp(self.start, unit='s'), 'total': self.total,
+                'network': self.network, 'decode': self.decode, 'build': self.build,
+                'requests': self.requests, 'bytes': self.bytes,
+                'failures': self.failures, 'retries': self.retries, 'error': self.error}
+
+
+class Trace:
+    '''trace()返回的调用记录集合'''
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def add(self, call):
+        with self.lock:
+            self.calls.append(call)
+
+    def to_frame(self):
+        columns = ['function', 'thread', 'depth', 'start', 'total', 'network', 'decode',
+                   'build', 'requests', 'bytes', 'failures', 'retries', 'error']
+        return pd.DataFrame([c.as_dict() for c in self.calls], columns=columns)
+
+
+state = threading.local()
+traces = []
+installed = {'stack': None, 'patched': [], 'send': None}
+
+
+def call_stack():
+    if not hasattr(state, 'stack'):
+        state.stack = []
+        state.decoding = 0
+        state.failed_key = None
+    return state.stack
+
+
+def metered_send(original, session, request, **kwargs):
+    stack = call_stack()
+    parts = urlsplit(request.url)
+    # 同一线程内紧接着失败请求的相同请求视为重试
+    retried = state.failed_key is not None and \
+        state.failed_key == request_key(request.method, request.url, request.body)
+    t0 = time.perf_counter()
+    failed, size = True, 0
+    try:
+        response = original(session, request, **kwargs)
+        failed = response.status_code >= 400
+        if not kwargs.get('stream'):
+            size = len(response.content)
+        return response
+    finally:
+        seconds = time.perf_counter() - t0
+        state.failed_key = request_key(request.method, request.url, request.body) if failed else None
+        registry.observe_request(parts.netloc, parts.path or '/', seconds, size, failed, retried)
+        for call in stack:
+            call.network += seconds
+            call.requests += 1
+            call.bytes += size
+            call.failures += failed
+            call.retries += retried
+
+
+def metered_decode(func):
+    '''包装JSON解析函数，耗时计入当前调用的decode阶段，嵌套解析只计一次'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = call_stack()
+        if state.decoding or not stack:
+            return func(*args, **kwargs)
+        state.decoding += 1
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            state.decoding -= 1
+            seconds = time.perf_counter() - t0
+            for call in stack:
+                call.decode += seconds
+    return wrapper
+
+
+def metered(func, name):
+    '''包装数据接口函数'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = call_stack()
+        call = Call(name, len(stack))
+        stack.append(call)
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            call.error = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            call.total = time.perf_counter() - t0
+            call.build = max(call.total - call.network - call.decode, 0.0)
+            registry.observe_call(call)
+            for t in list(traces):
+                t.add(call)
+    wrapper._qstock_metered = True
+    return wrapper
+
+
+def fetchers():
+    '''返回{原函数: 函数名}，函数名形如trade.get_data'''
+    result = {}
+    for name in fetcher_modules:
+        module = importlib.import_module(f'qstock.data.{name}')
+        for attr, obj in vars(module).items():
+            if attr.startswith('_') or not callable(obj) or isinstance(obj, type):
+                continue
+            if getattr(obj, '__module__', None) == module.__name__:
+                result[obj] = f'{name}.{attr}'
+    return result
+
+
+def setattr_patch(target, attr, value):
+    installed['patched'].append((target, attr, getattr(target, attr)))
+    setattr(target, attr, value)
+
+
+def restore_send(send, original):
+    '''只有requests.Session.send仍是指标的包装时才恢复，之后叠加的补丁退出时会自己恢复'''
+    installed['send'] = None
+    if requests.Session.send is send:
+        requests.Session.send = original
+
+
+def unwrap_modules():
+    '''
+    开启期间通过延迟导入或from ... import缓存在qstock各模块中的包装函数换回原函数
+    （如第一次访问qs.hist_money时缓存在qstock命名空间中的包装函数）
+    '''
+    for module_name, module in list(sys.modules.items()):
+        if module is None or not (module_name == 'qstock' or module_name.startswith('qstock.')):
+            continue
+        for attr, obj in list(vars(module).items()):
+            if getattr(obj, '_qstock_metered', False):
+                setattr(module, attr, obj.__wrapped__)
+
+
+def enabled():
+    return installed['stack'] is not None
+
+
+def enable():
+    '''开启指标记录，重复调用无影响'''
+    if enabled():
+        return
+    stack = ExitStack()
+    original = requests.Session.send
+
+    def send(session, request, **kwargs):
+        # disable()之后如果还被其他补丁（如cassette.replay）引用，直接调用原函数
+        if installed['send'] is not send:
+            return original(session, request, **kwargs)
+        return metered_send(original, session, request, **kwargs)
+
+    requests.Session.send = send
+    installed['send'] = send
+    stack.callback(restore_send, send, original)
+    installed['stack'] = stack
+    setattr_patch(requests.models.Response, 'json', metered_decode(requests.models.Response.json))
+    setattr_patch(json, 'loads', metered_decode(json.loads))
+    setattr_patch(demjson, 'decode', metered_decode(demjson.decode))
+    # 已经通过from ... import引用了数据接口的qstock模块（包括qstock本身）也要替换
+    wrappers = {id(f): metered(f, name) for f, name in fetchers().items()}
+    for module_name, module in list(sys.modules.items()):
+        if module is None or not (module_name == 'qstock' or module_name.startswith('qstock.')):
+            continue
+        for attr, obj in list(vars(module).items()):
+            wrapper = wrappers.get(id(obj))
+            if wrapper is not None:
+                setattr_patch(module, attr, wrapper)
+
+
+def disable():
+    '''关闭指标记录，恢复原函数，已记录的指标保留'''
+    if not enabled():
+        return
+    while installed['patched']:
+        target, attr, value = installed['patched'].pop()
+        setattr(target, attr, value)
+    unwrap_modules()
+    installed['stack'].close()
+    installed['stack'] = None
+
+
+def reset():
+    '''清空已记录的指标'''
+    registry.reset()
+
+
+@contextmanager
+def trace():
+    '''
+    记录with代码块内每次数据接口调用的耗时分解，未开启指标时临时开启
+    返回Trace对象，t.to_frame()得到每次调用的明细
+    '''
+    started = not enabled()
+    if started:
+        enable()
+    t = Trace()
+    traces.append(t)
+    try:
+        yield t
+    finally:
+        traces.remove(t)
+        if started:
+            disable()
+
+
+def summary():
+    '''按host/接口路径汇总请求指标'''
+    with registry.lock:
+        rows = [{'host': host, 'endpoint': endpoint,
+                 'requests': n,
+                 'bytes': registry.bytes[(host, endpoint)],
+                 'retries': registry.retries[(host, endpoint)],
+                 'failures': registry.failures[(host, endpoint)],
+                 'seconds': registry.request_seconds[(host, endpoint)].sum,
+                 'p50': registry.request_seconds[(host, endpoint)].quantile(0.5),
+                 'p99': registry.request_seconds[(host, endpoint)].quantile(0.99)}
+                for (host, endpoint), n in registry.requests.items()]
+    columns = ['host', 'endpoint', 'requests', 'bytes', 'retries', 'failures', 'seconds', 'p50', 'p99']
+    return pd.DataFrame(rows, columns=columns).sort_values('seconds', ascending=False, ignore_index=True)
+
+
+def call_summary():
+    '''按函数汇总调用次数和各阶段总耗时'''
+    with registry.lock:
+        rows = [dict({'function': f, 'calls': n, 'errors': registry.call_errors[f]},
+                     **{p: registry.call_seconds[(f, p)].sum for p in phases})
+                for f, n in registry.calls.items()]
+    columns = ['function', 'calls', 'errors'] + list(phases)
+    return pd.DataFrame(rows, columns=columns).sort_values('total', ascending=False, ignore_index=True)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**kw):
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in kw.items()) + '}'
+
+
+def format_le(le):
+    return '+Inf' if le == float('inf') else repr(float(le))
+
+
+def prometheus_text(openmetrics=False):
+    '''
+    返回Prometheus文本格式的指标
+    openmetrics=True时返回OpenMetrics格式（计数器TYPE行不带_total，结尾# EOF）
+    '''
+    lines = []
+
+    def counter(name, help, values, label_names):
+        lines.append(f'# HELP {name}_total {help}' if not openmetrics else f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name}_total counter' if not openmetrics else f'# TYPE {name} counter')
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f'{name}_total{labels(**dict(zip(label_names, key)))} {value}')
+
+    def histogram(name, help, values, label_names):
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, h in values.items():
+            kw = dict(zip(label_names, key))
+            for le, n in h.cumulative():
+                lines.append(f'{name}_bucket{labels(**kw, le=format_le(le))} {n}')
+            lines.append(f'{name}_sum{labels(**kw)} {h.sum}')
+            lines.append(f'{name}_count{labels(**kw)} {h.count}')
+
+    with registry.lock:
+        endpoint = ('host', 'endpoint')
+        counter('qstock_http_requests', 'HTTP requests sent', registry.requests, endpoint)
+        counter('qstock_http_response_bytes', 'HTTP response body bytes', registry.bytes, endpoint)
+        counter('qstock_http_retries', 'HTTP requests repeated after a failure', registry.retries, endpoint)
+        counter('qstock_http_failures', 'HTTP requests failed or status >= 400', registry.failures, endpoint)
+        histogram('qstock_http_request_duration_seconds', 'HTTP request latency',
+                  registry.request_seconds, endpoint)
+        counter('qstock_calls', 'qstock fetcher calls', registry.calls, ('function',))
+        counter('qstock_call_errors', 'qstock fetcher calls raising an exception',
+                registry.call_errors, ('function',))
+        histogram('qstock_call_duration_seconds', 'qstock fetcher call time by phase',
+                  registry.call_seconds, ('function', 'phase'))
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path, openmetrics=False):
+    '''
+    把指标写入文件，可配合node_exporter的textfile collector使用
+    先写临时文件再改名，避免采集到写了一半的文件
+    '''
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(openmetrics))
+    os.replace(tmp, path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+        content = prometheus_text(openmetrics).encode('utf-8')
+        self.send_response(200)
+        if openmetrics:
+            self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        else:
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=9108, host='0.0.0.0'):
+    '''
+    在后台线程启动HTTP服务供Prometheus抓取，返回服务对象，server.shutdown()关闭
+    请求头Accept包含application/openmetrics-text时返回OpenMetrics格式
+    '''
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
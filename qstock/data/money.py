@@ -10,7 +10,6 @@ import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 from pathlib import Path
-from py_mini_racer import py_mini_racer
 from tqdm import tqdm
 from jsonpath import jsonpath
 
@@ -54,10 +53,11 @@ def intraday_money(code):
     return df
 
 # 个股或债券或期货历史资金流向数据
-def hist_money(code):
+def hist_money(code, lmt=100000):
     """
     获取单支股票、债券的历史单子流入流出数据
     code : 股票、债券代码
+    lmt : 只获取最近lmt个交易日，默认全部
     """
     history_money_dict = {
         'f51': '日期',
@@ -79,7 +79,7 @@ def hist_money(code):
     fields2 = ",".join(fields)
     code_id = get_code_id(code)
     params = (
-        ('lmt', '100000'),
+        ('lmt', str(lmt)),
         ('klt', '101'),
         ('secid', code_id),
         ('fields1', 'f1,f2,f3,f7'),
@@ -316,6 +316,7 @@ def ths_header():
     file= Path(__file__).parent/"ths.js"
     with open(file) as f:
         js_data = f.read()
+    from py_mini_racer import py_mini_racer
     js_code = py_mini_racer.MiniRacer()
     js_code.eval(js_data)
     v_code = js_code.call("v")
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+个股历史资金流向（fflow/daykline）的本地增量存储
+
+每只股票的日资金流向保存为数据目录下的money/{code}.pkl，只追加新的交易日：
+按本地交易日历计算缺少的交易日数n，请求最近n个交易日（lmt=n，包括已保存的最后一天，
+以便覆盖盘中保存的数据），不再每晚下载全部历史。东方财富只提供最近约半年的数据，
+本地存储可以保留更长的历史。
+money_panel把多只股票对齐为时间×股票代码的矩阵，供向量化的多周期滚动计算使用。
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from tqdm import tqdm
+
+from qstock.data.util import data_dir, get_code_id
+from qstock.data.money import hist_money
+from qstock.data.trade_calendar import latest_trade_date, latest_closed_trade_date, trade_days_between
+
+# 资金净流入列（元）
+flow_cols = ['主力净流入', '超大单净流入', '大单净流入', '中单净流入', '小单净流入']
+
+
+def money_path(code):
+    return data_dir('money') / f'{code}.pkl'
+
+
+# A股代码前缀 -> 行情ID的市场编号：沪市主板、科创板为1，深市主板、创业板和北交所为0
+a_share_markets = {'60': '1', '68': '1', '00': '0', '30': '0', '920': '0', '8': '0', '4': '0'}
+
+
+def stock_code_id(code):
+    '''
+    沪深京A股6位代码直接生成行情ID，省去每只股票一次代码查询请求，
+    其他代码（ETF、可转债、B股等）仍用get_code_id查询
+    '''
+    code = str(code)
+    if len(code) == 6 and code.isdigit():
+        for prefix in (code[:3], code[:2], code[:1]):
+            if prefix in a_share_markets:
+                return f'{a_share_markets[prefix]}.{code}'
+    return get_code_id(code)
+
+
+def load_money(code):
+    '''读取本地保存的单只股票资金流向，以日期为索引，没有时返回None'''
+    path = money_path(code)
+    return pd.read_pickle(path) if path.exists() else None
+
+
+def update_stock_money(code):
+    '''增量更新单只股票的资金流向，返回新获取的行数'''
+    old = load_money(code)
+    latest = pd.Timestamp(latest_trade_date())
+    if old is None or old.empty:
+        lmt = 100000
+    else:
+        last = old.index[-1]
+        if last > latest or (last == latest and latest <= pd.Timestamp(latest_closed_trade_date())):
+            return 0
+        lmt = len(trade_days_between(last, latest))
+    df = hist_money(stock_code_id(code), lmt)
+    if df.empty:
+        return 0
+    df.index = pd.DatetimeIndex(pd.to_datetime(df['日期']), name='date')
+    df = df.drop(columns='日期')
+    if old is not None:
+        df = pd.concat([old, df])
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+    df.to_pickle(money_path(code))
+    return len(df) if old is None else len(df) - len(old)
+
+
+def update_money(code_list=None, max_workers=16):
+    '''
+    增量更新多只股票的资金流向，code_list默认为沪深A股全部股票
+    返回{股票代码: 新增行数}，获取失败的股票为None
+    '''
+    if code_list is None:
+        from qstock.data.trade import get_code
+        code_list = get_code('沪深A')
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    code_list = [str(c) for c in code_list]
+
+    def run(code):
+        try:
+            return update_stock_money(code)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = list(tqdm(executor.map(run, code_list), total=len(code_list), leave=False))
+    return dict(zip(code_list, counts))
+
+
+def money_panel(code_list=None, columns=flow_cols, start=None, end=None, update=False):
+    '''
+    多只股票资金流向的面板数据：返回{列名: 时间×股票代码的DataFrame}，日期对齐，缺失为nan
+    code_list:股票代码列表，默认本地保存的全部股票
+    columns:需要的列，默认主力、超大单、大单、中单、小单净流入，也可以包括
+    '主力净流入占比'、'收盘价'、'涨跌幅'等hist_money的其他列
+    update:是否先调用update_money增量更新
+    '''
+    if code_list is None:
+        code_list = sorted(p.stem for p in data_dir('money').glob('*.pkl'))
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    code_list = [str(c) for c in code_list]
+    if isinstance(columns, str):
+        columns = [columns]
+    if update:
+        update_money(code_list)
+    frames = {}
+    for code in code_list:
+        df = load_money(code)
+        if df is not None:
+            frames[code] = df.loc[start:end, columns]
+    if not frames:
+        return {col: pd.DataFrame() for col in columns}
+    df = pd.concat(frames, axis=1)
+    df.index.name = 'date'
+    # 列为(股票代码, 列名)，按列名拆分为各自的宽表
+    df = df.swaplevel(axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+    return {col: df[col][list(frames)] for col in columns}
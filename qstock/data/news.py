@@ -9,14 +9,13 @@ import pandas as pd
 import json
 import requests
 import time
-import signal
 import hashlib
 from datetime import datetime,timedelta
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 import multitasking
 from func_timeout import func_set_timeout
-signal.signal(signal.SIGINT, multitasking.killall)
+from qstock.data.util import killall_on_sigint
 
 ######新闻资讯数据
 def news_data(news_type=None,start=None,end=None,code=None):
@@ -216,6 +215,8 @@ def news_cctv(start=None,end=None):
     '''
     dates=get_dates(start,end)
     data_list=[]
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(date):
@@ -240,6 +241,8 @@ def news_js(start,end):
     '''
     dates=get_dates(start,end)
     data_list=[]
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(date):
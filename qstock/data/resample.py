@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+K线周期转换：由1分钟/5分钟K线合成5、15、30、60分钟K线，由日K线合成周、月K线
+
+按A股交易时段（9:30-11:30，13:00-15:00）切分，与东方财富一致：
+K线以结束时间标记，9:30的集合竞价K线并入第一根K线，午休不跨K线，
+60分钟K线为10:30、11:30、14:00、15:00；周、月K线以该周期最后一个交易日标记。
+对get_data返回的多只证券面板数据（以code列区分）一次性向量化计算。
+"""
+import numpy as np
+import pandas as pd
+
+from qstock.data.util import data_dir
+
+# 按求和合并的列，其余非价格列取最后一个值
+sum_cols = ('volume', 'vol', 'turnover', 'turnover_rate', '成交量', '成交额', '换手率')
+price_rules = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last',
+               '开盘': 'first', '最高': 'max', '最低': 'min', '收盘': 'last'}
+
+# 周期名称，与web_data的freq参数一致
+period_freq = {'w': 'W-SUN', 102: 'W-SUN', 'm': 'M', 103: 'M', 'q': 'Q', 104: 'Q', 'y': 'Y', 106: 'Y'}
+
+morning_open = 9 * 60 + 30
+afternoon_open = 13 * 60
+session_minutes = 240
+
+
+def agg_rules(columns):
+    return {c: price_rules.get(c, 'sum' if c in sum_cols else 'last') for c in columns}
+
+
+def aggregate(df, labels, index=None):
+    '''
+    按(代码, K线标记)分组合并，返回以index（默认为K线标记）为索引的数据
+    同一证券的数据按时间排列时（get_data的结果即是如此），每根K线的数据是相邻的，
+    直接用numpy的reduceat按段计算，否则先排序
+    '''
+    codes = pd.factorize(df['code'])[0] if 'code' in df.columns else np.zeros(len(df), dtype=int)
+    keys = np.asarray(labels)
+    times = pd.DatetimeIndex(df.index).asi8
+    if np.any((codes[1:] < codes[:-1]) | ((codes[1:] == codes[:-1]) & (times[1:] < times[:-1]))):
+        order = np.lexsort((times, codes))
+        df, codes, keys = df.iloc[order], codes[order], keys[order]
+        index = None if index is None else np.asarray(index)[order]
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (keys[1:] != keys[:-1])])
+    ends = np.r_[starts[1:], len(df)] - 1
+    out = {}
+    for col, rule in agg_rules(df.columns).items():
+        values = df[col].to_numpy()
+        if rule == 'first':
+            out[col] = values[starts]
+        elif rule == 'last':
+            out[col] = values[ends]
+        elif rule == 'max':
+            out[col] = np.fmax.reduceat(values, starts)
+        elif rule == 'min':
+            out[col] = np.fmin.reduceat(values, starts)
+        elif values.dtype.kind in 'iub':
+            out[col] = np.add.reduceat(values, starts)
+        else:
+            out[col] = np.add.reduceat(np.nan_to_num(values.astype(float)), starts)
+    index = keys[ends] if index is None else np.asarray(index)[ends]
+    return pd.DataFrame(out, index=pd.DatetimeIndex(index, name='date'))
+
+
+def intraday_labels(index, freq):
+    '''
+    每根分钟K线所属的freq分钟K线的结束时间（int64纳秒）
+    index为分钟K线的结束时间，交易时段外的K线返回-1
+    '''
+    ns = pd.DatetimeIndex(index).asi8
+    day = 86400 * 10 ** 9
+    minute = 60 * 10 ** 9
+    dates = ns - ns % day
+    minutes = (ns - dates) // minute
+    # 距开盘的交易分钟数：9:30为0（集合竞价），11:30为120，13:01为121，15:00为240
+    m = np.where(minutes <= 11 * 60 + 30, minutes - morning_open, minutes - afternoon_open + 120)
+    end = np.maximum(-(-m // freq), 1) * freq
+    label = np.where(end <= 120, morning_open + end, afternoon_open + end - 120)
+    return np.where((m >= 0) & (m <= session_minutes), dates + label * minute, -1)
+
+
+def resample_bars(df, freq):
+    '''
+    把K线数据合成为更长周期的K线
+    df:web_data/get_data/get_1min_data返回的数据，索引为K线时间，多只证券以code列区分
+    freq:分钟数5、15、30、60、120（df为1分钟或5分钟K线），
+    或'w'/102周、'm'/103月、'q'季、'y'年（df为日K线）
+    价格按开高低收合并，成交量、成交额、换手率求和，其他列取最后一个值
+    注意：由前复权日K线合成的周、月K线与直接下载的复权周、月K线可能略有差异
+    '''
+    if df.empty:
+        return df
+    if isinstance(freq, str):
+        freq = freq.lower()
+    if freq in period_freq:
+        index = pd.DatetimeIndex(df.index)
+        periods = index.to_period(period_freq[freq]).asi8
+        # 以周期内最后一个交易日标记
+        return aggregate(df, periods, index)
+    freq = int(freq)
+    if freq <= 0 or 120 % freq:
+        raise ValueError('分钟周期需能整除120（上午、下午各120分钟），如5、15、30、60、120')
+    labels = intraday_labels(df.index, freq)
+    keep = labels >= 0
+    if not keep.all():
+        df, labels = df[keep], labels[keep]
+    return aggregate(df, labels)
+
+
+def bars_path(code, freq, fqt):
+    return data_dir('bars', f'{freq}_{fqt}') / f'{code}.pkl'
+
+
+def save_bars(df, freq, fqt=1, partial_first=False):
+    '''
+    把K线数据按代码缓存到本地（数据目录下的bars/{freq}_{fqt}/{code}.pkl），与已有缓存合并，
+    相同时间的K线以新数据为准
+    partial_first:新数据的第一根K线是否可能只包含部分数据（如由周中开始的日K线合成的周K线），
+    为True且缓存中已有该K线时保留缓存中的
+    '''
+    codes = df['code'] if 'code' in df.columns else pd.Series('', index=df.index)
+    for code, g in df.groupby(codes.to_numpy(), sort=False):
+        path = bars_path(code, freq, fqt)
+        if path.exists():
+            old = pd.read_pickle(path)
+            if partial_first and len(g) and g.index[0] in old.index:
+                g = g.iloc[1:]
+            g = pd.concat([old, g])
+            g = g[~g.index.duplicated(keep='last')].sort_index()
+        g.to_pickle(path)
+
+
+def load_bars(code_list, freq, fqt=1, start=None, end=None):
+    '''
+    读取save_bars缓存的K线数据，返回与get_data相同格式的面板数据
+    code_list:代码或代码列表（6位代码，与数据中的code列一致）
+    '''
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    data_list = []
+    for code in code_list:
+        path = bars_path(code, freq, fqt)
+        if path.exists():
+            data_list.append(pd.read_pickle(path).loc[start:end])
+    if not data_list:
+        return pd.DataFrame()
+    return pd.concat(data_list, axis=0)
+
+
+def multi_freq_data(code_list, freqs=(5, 15, 30, 60), start='19000101', end=None, fqt=1, cache=False):
+    '''
+    只下载一次基础周期K线，本地合成多个周期，返回{freq: 面板数据}
+    freqs:分钟周期（1、5、15、30、60）或'd'、'w'、'm'、'q'、'y'，可以混合
+    分钟周期都是5的倍数时以5分钟K线为基础，否则以1分钟K线为基础（只有最近5个交易日）
+    cache:是否把基础周期和合成的K线用save_bars缓存到本地
+    '''
+    from qstock.data.trade import get_data
+    freqs = [f.lower() if isinstance(f, str) else f for f in freqs]
+    minute = [f for f in freqs if not isinstance(f, str) and f not in period_freq and f != 101]
+    daily = [f for f in freqs if f not in minute]
+    result = {}
+    groups = []
+    if minute:
+        groups.append((5 if all(f % 5 == 0 for f in minute) else 1, minute))
+    if daily:
+        groups.append(('d', daily))
+    for base, targets in groups:
+        df = get_data(code_list, start=start, end=end, freq=base, fqt=fqt)
+        if cache:
+            save_bars(df, base, fqt)
+        for f in targets:
+            result[f] = df if f in (base, 101) else resample_bars(df, f)
+            if cache and f not in (base, 101):
+                save_bars(result[f], f, fqt, partial_first=True)
+    return result
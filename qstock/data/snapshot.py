@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+批量五档行情快照轮询
+
+stock_snapshot每次只请求一只股票，且每次新建连接。SnapshotPoller在一个连接池足够大的
+Session上并发请求几百只股票的快照（保持长连接），解析为紧凑的numpy结构化数组
+（买卖五档价格和数量），记录每只股票最后一次数据变化的时间，
+并向量化计算买卖价差、中间价、微观价格（microprice）和多档挂单不平衡度。
+
+用法：
+    poller = qs.SnapshotPoller(code_list)
+    poller.poll()                  # 并发获取一次，返回结构化数组
+    poller.metrics()               # 价差、中间价、微观价格、挂单不平衡度
+    poller.run(interval=3, callback=lambda p: print(p.metrics().head()))
+"""
+import json
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from qstock.data.util import request_header
+
+snapshot_url = 'https://hsmarketwg.eastmoney.com/api/SHSZQuoteSnapshot'
+book_levels = 5
+
+# 一只股票的快照
+book_dtype = np.dtype([
+    ('bid_px', 'f8', (book_levels,)),
+    ('bid_sz', 'f8', (book_levels,)),
+    ('ask_px', 'f8', (book_levels,)),
+    ('ask_sz', 'f8', (book_levels,)),
+    ('last', 'f8'),
+    ('pre_close', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('volume', 'f8'),
+    ('amount', 'f8'),
+    ('time', 'U8'),
+    ('updated', 'f8'),
+])
+
+quote_fields = {'last': 'currentPrice', 'pre_close': 'yesClosePrice', 'high': 'high', 'low': 'low',
+                'volume': 'volume', 'amount': 'amount'}
+
+
+@lru_cache()
+def snapshot_session(pool_size=32):
+    '''连接池大小为pool_size的Session，并发请求时复用长连接'''
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.headers.update(request_header)
+    return s
+
+
+def quote_float(value):
+    ''''12.5'、'3.2%'、'-'等转换为浮点数，无法转换时为nan'''
+    try:
+        return float(str(value).rstrip('%'))
+    except ValueError:
+        return np.nan
+
+
+def fetch_snapshot(code, session=None):
+    '''获取一只股票的快照原始数据（dict），没有数据时返回None'''
+    session = session or snapshot_session()
+    text = session.get(snapshot_url, params={'id': code}, timeout=5).text
+    if not text.startswith('{'):
+        # JSONP格式
+        text = text[text.find('{'):text.rfind('}') + 1]
+    data = json.loads(text)
+    return data if data.get('fivequote') else None
+
+
+def parse_snapshot(data, row):
+    '''把快照原始数据写入结构化数组的一行，返回数据是否有变化'''
+    five = data['fivequote']
+    quote = data.get('realtimequote') or {}
+    bid_px = [quote_float(five.get(f'buy{i}')) for i in range(1, book_levels + 1)]
+    bid_sz = [quote_float(five.get(f'buy{i}_count')) for i in range(1, book_levels + 1)]
+    ask_px = [quote_float(five.get(f'sale{i}')) for i in range(1, book_levels + 1)]
+    ask_sz = [quote_float(five.get(f'sale{i}_count')) for i in range(1, book_levels + 1)]
+    values = {key: quote_float(quote.get(field)) for key, field in quote_fields.items()}
+    stamp = str(quote.get('time', ''))[:8]
+    # 涨跌停时一侧没有挂单为nan，比较时nan视为相等
+    changed = stamp != row['time'] or not all(
+        np.array_equal(new, row[name], equal_nan=True)
+        for name, new in (('bid_px', bid_px), ('ask_px', ask_px), ('bid_sz', bid_sz), ('ask_sz', ask_sz)))
+    row['bid_px'], row['bid_sz'], row['ask_px'], row['ask_sz'] = bid_px, bid_sz, ask_px, ask_sz
+    for key, value in values.items():
+        row[key] = value
+    row['time'] = stamp
+    return changed
+
+
+class SnapshotPoller:
+    '''
+    多只股票五档行情的并发轮询
+    code_list:6位股票代码列表；max_workers:并发请求数（也是连接池大小）
+    book:结构化数组，每只股票一行，字段见book_dtype，updated为本地最后一次数据变化的时间戳
+    '''
+
+    def __init__(self, code_list, max_workers=32):
+        if isinstance(code_list, str):
+            code_list = [code_list]
+        self.codes = [str(c) for c in code_list]
+        self.max_workers = max_workers
+        self.session = snapshot_session(max_workers)
+        self.book = np.zeros(len(self.codes), dtype=book_dtype)
+        for name in ('bid_px', 'bid_sz', 'ask_px', 'ask_sz', 'last', 'pre_close', 'high', 'low', 'volume',
+                     'amount', 'updated'):
+            self.book[name] = np.nan
+        self.names = [''] * len(self.codes)
+        self.errors = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def fetch(self, i):
+        try:
+            return i, fetch_snapshot(self.codes[i], self.session)
+        except Exception as e:
+            self.errors[self.codes[i]] = e
+            return i, None
+
+    def poll(self):
+        '''并发获取一次全部股票的快照，更新并返回book'''
+        self.errors = {}
+        now = time.time()
+        for i, data in self.executor.map(self.fetch, range(len(self.codes))):
+            if data is None:
+                continue
+            self.names[i] = data.get('name', self.names[i])
+            if parse_snapshot(data, self.book[i]):
+                self.book['updated'][i] = now
+        return self.book
+
+    def metrics(self, depth=book_levels):
+        '''
+        向量化计算全部股票的盘口指标，返回以代码为索引的DataFrame：
+        买一、卖一、价差、价差(bp)、中间价、微观价格、depth档挂单不平衡度（-1到1，正数为买盘多）、
+        距最后一次数据变化的秒数
+        '''
+        b = self.book
+        bid, ask = b['bid_px'][:, 0], b['ask_px'][:, 0]
+        bid_sz, ask_sz = b['bid_sz'][:, 0], b['ask_sz'][:, 0]
+        # 涨跌停时一侧没有挂单（价格为0或nan）
+        valid = (bid > 0) & (ask > 0)
+        spread = np.where(valid, ask - bid, np.nan)
+        mid = np.where(valid, (ask + bid) / 2, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            micro = np.where(valid, (ask * bid_sz + bid * ask_sz) / (bid_sz + ask_sz), np.nan)
+            bid_depth = np.nansum(b['bid_sz'][:, :depth], axis=1)
+            ask_depth = np.nansum(b['ask_sz'][:, :depth], axis=1)
+            imbalance = (bid_depth - ask_depth) / (bid_depth + ask_depth)
+            spread_bp = spread / mid * 1e4
+        return pd.DataFrame({
+            '名称': self.names,
+            '最新价': b['last'],
+            '买1价': bid,
+            '卖1价': ask,
+            '价差': spread,
+            '价差(bp)': spread_bp,
+            '中间价': mid,
+            '微观价格': micro,
+            '挂单不平衡度': imbalance,
+            '时间': b['time'],
+            '更新间隔(秒)': time.time() - b['updated'],
+        }, index=pd.Index(self.codes, name='代码'))
+
+    def to_frame(self):
+        '''五档行情宽表，列名与stock_snapshot一致'''
+        b = self.book
+        data = {'名称': self.names, '时间': b['time'], '最新价': b['last'], '昨收': b['pre_close'],
+                '最高': b['high'], '最低': b['low'], '成交量': b['volume'], '成交额': b['amount']}
+        for i in range(book_levels):
+            data[f'卖{i + 1}价'] = b['ask_px'][:, i]
+        for i in range(book_levels):
+            data[f'买{i + 1}价'] = b['bid_px'][:, i]
+        for i in range(book_levels):
+            data[f'卖{i + 1}数量'] = b['ask_sz'][:, i]
+        for i in range(book_levels):
+            data[f'买{i + 1}数量'] = b['bid_sz'][:, i]
+        return pd.DataFrame(data, index=pd.Index(self.codes, name='代码'))
+
+    def run(self, interval=3, rounds=None, callback=None, trading_only=True):
+        '''
+        每interval秒轮询一次，rounds为轮询次数（默认一直运行，Ctrl+C结束）
+        callback(poller):每次轮询后调用；trading_only:非交易时段不请求
+        '''
+        from qstock.data.trade_calendar import is_trading_time
+        n = 0
+        try:
+            while rounds is None or n < rounds:
+                start = time.time()
+                if not trading_only or is_trading_time():
+                    self.poll()
+                    if callback is not None:
+                        callback(self)
+                n += 1
+                time.sleep(max(0, interval - (time.time() - start)))
+        except KeyboardInterrupt:
+            pass
+        return self
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
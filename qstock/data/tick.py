@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+个股日内逐笔成交分析：VWAP、价格成交量分布、按单笔金额分档、累计净流入
+
+逐笔数据来自东方财富stock/details接口（与intraday_data相同），多取一列成交方向
+（2为主动买入，1为主动卖出，其他为中性），全部计算对单只证券向量化完成，
+多只证券用进程池并行（tick_analytics）。
+按单笔平均成交金额分为小单、中单、大单、超大单（与东方财富口径一致：4万、20万、100万元），
+按分钟汇总的累计净流入可以与服务器端的intraday_money对照（compare_money）。
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.util import session, request_header, get_code_id
+
+# 单笔平均成交金额分档（元）
+size_bins = (0, 4e4, 2e5, 1e6, np.inf)
+size_labels = ('小单', '中单', '大单', '超大单')
+
+
+def fetch_ticks(code):
+    '''
+    获取单只证券最新交易日的逐笔成交（与intraday_data相同的接口，只请求一次）
+    返回时间、成交价、成交量（手）、单数、方向（1买入，-1卖出，0中性），属性attrs中有昨收
+    '''
+    code_id = get_code_id(code)
+    params = (
+        ('secid', code_id),
+        ('fields1', 'f1,f2,f3,f4,f5'),
+        ('fields2', 'f51,f52,f53,f54,f55'),
+        ('pos', '-10000000'),
+    )
+    url = 'https://push2.eastmoney.com/api/qt/stock/details/get'
+    data = session.get(url, headers=request_header, params=params).json()['data'] or {}
+    return parse_ticks(data.get('details') or [], data.get('prePrice'), code_id.split('.')[-1])
+
+
+def parse_ticks(details, pre_close=None, code=None):
+    '''把'09:30:03,10.52,120,8,2'格式的逐笔数据解析为DataFrame'''
+    n = len(details)
+    if n:
+        fields = np.array([d.split(',')[:5] for d in details], dtype=object)
+        if fields.shape[1] < 5:
+            fields = np.c_[fields, np.zeros((n, 5 - fields.shape[1]), dtype=object)]
+    else:
+        fields = np.empty((0, 5), dtype=object)
+    side = fields[:, 4].astype(int) if n else np.array([], dtype=int)
+    df = pd.DataFrame({
+        '时间': fields[:, 0].astype(str),
+        '成交价': fields[:, 1].astype(float),
+        '成交量': fields[:, 2].astype(np.int64),
+        '单数': fields[:, 3].astype(np.int64),
+        '方向': np.select([side == 2, side == 1], [1, -1], 0),
+    })
+    df.attrs['代码'] = code
+    df.attrs['昨收'] = pre_close
+    return df
+
+
+def tick_amount(df, lot=100):
+    '''每笔成交金额（元），成交量单位为手，lot为每手股数'''
+    return df['成交价'].to_numpy() * df['成交量'].to_numpy() * lot
+
+
+def tick_vwap(df, lot=100):
+    '''逐笔累计成交均价（VWAP）序列'''
+    volume = np.cumsum(df['成交量'].to_numpy() * lot)
+    amount = np.cumsum(tick_amount(df, lot))
+    vwap = np.divide(amount, volume, out=np.full(len(df), np.nan), where=volume > 0)
+    return pd.Series(vwap, index=df.index, name='VWAP')
+
+
+def volume_profile(df, lot=100):
+    '''
+    价格成交量分布：每个成交价的成交量（手）、成交额、主动买入量、主动卖出量，按价格排序
+    '''
+    price = df['成交价'].to_numpy()
+    levels, inverse = np.unique(price, return_inverse=True)
+    volume = df['成交量'].to_numpy()
+    side = df['方向'].to_numpy()
+    n = len(levels)
+    result = pd.DataFrame({
+        '成交价': levels,
+        '成交量': np.bincount(inverse, volume, n),
+        '成交额': np.bincount(inverse, tick_amount(df, lot), n),
+        '买入量': np.bincount(inverse, volume * (side > 0), n),
+        '卖出量': np.bincount(inverse, volume * (side < 0), n),
+    })
+    result['占比%'] = result['成交量'] / max(volume.sum(), 1) * 100
+    return result
+
+
+def order_size(df, lot=100):
+    '''按单笔平均成交金额（成交额/单数）给每笔成交分档，返回0-3（小单、中单、大单、超大单）'''
+    orders = np.maximum(df['单数'].to_numpy(), 1)
+    return np.searchsorted(size_bins[1:-1], tick_amount(df, lot) / orders, side='right')
+
+
+def tick_minutes(times):
+    '''
+    逐笔成交所属的分钟K线（以结束时间标记，与intraday_money一致）：
+    集合竞价并入9:31，11:30:xx并入11:30，15:00之后并入15:00
+    '''
+    t = pd.to_timedelta(pd.Series(times)).to_numpy().astype('timedelta64[s]').astype(np.int64)
+    label = t // 60 + 1
+    label = np.maximum(label, 9 * 60 + 31)
+    label = np.where((label > 11 * 60 + 30) & (label <= 13 * 60), 11 * 60 + 30, label)
+    return np.minimum(label, 15 * 60)
+
+
+def tick_flow(df, lot=100, freq=1):
+    '''
+    按分钟汇总的分档净流入（元，主动买入为正，主动卖出为负）及其日内累计
+    返回以分钟为索引的DataFrame：主力（大单+超大单）、小单、中单、大单、超大单净流入的累计值，
+    列名与intraday_money一致
+    freq:分钟数，如5表示5分钟汇总
+    '''
+    minutes = tick_minutes(df['时间'])
+    if freq > 1:
+        from qstock.data.resample import intraday_labels
+        minute = 60 * 10 ** 9
+        minutes = intraday_labels(minutes * minute, freq) // minute
+    keys, inverse = np.unique(minutes, return_inverse=True)
+    signed = tick_amount(df, lot) * df['方向'].to_numpy()
+    size = order_size(df, lot)
+    out = {}
+    for i, label in enumerate(size_labels):
+        out[label + '净流入'] = np.cumsum(np.bincount(inverse, signed * (size == i), len(keys)))
+    out['主力净流入'] = out['大单净流入'] + out['超大单净流入']
+    index = pd.Index([f'{m // 60:02d}:{m % 60:02d}' for m in keys], name='时间')
+    cols = ['主力净流入', '小单净流入', '中单净流入', '大单净流入', '超大单净流入']
+    return pd.DataFrame(out, index=index)[cols]
+
+
+def tick_summary(df, lot=100):
+    '''单只证券的逐笔成交汇总：VWAP、成交额、各档成交额和净流入、主动买卖比例'''
+    amount = tick_amount(df, lot)
+    side = df['方向'].to_numpy()
+    size = order_size(df, lot)
+    volume = df['成交量'].sum() * lot
+    result = {
+        '代码': df.attrs.get('代码'),
+        '昨收': df.attrs.get('昨收'),
+        '最新': df['成交价'].iloc[-1] if len(df) else np.nan,
+        'VWAP': amount.sum() / volume if volume else np.nan,
+        '成交额': amount.sum(),
+        '笔数': len(df),
+        '买入占比%': amount[side > 0].sum() / amount.sum() * 100 if amount.sum() else np.nan,
+    }
+    for i, label in enumerate(size_labels):
+        result[label + '成交额'] = amount[size == i].sum()
+        result[label + '净流入'] = (amount * side)[size == i].sum()
+    result['主力净流入'] = result['大单净流入'] + result['超大单净流入']
+    return result
+
+
+def analyze_ticks(code, lot=100):
+    '''获取并汇总单只证券的逐笔成交（供进程池调用）'''
+    return tick_summary(fetch_ticks(code), lot)
+
+
+def tick_analytics(code_list, processes=None, lot=100):
+    '''
+    多只证券的逐笔成交汇总，返回以代码为索引的DataFrame
+    code_list:代码列表，或{代码: fetch_ticks的结果}（已下载的数据只做计算）
+    processes:进程数，默认为CPU核数；为0时在当前进程中用线程下载、计算
+    获取失败的证券不在结果中
+    '''
+    if isinstance(code_list, str):
+        code_list = [code_list]
+    if isinstance(code_list, dict):
+        func, items = tick_summary, list(code_list.values())
+    else:
+        func, items = analyze_ticks, list(code_list)
+    if processes == 0:
+        executor = ThreadPoolExecutor(max_workers=8)
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes)
+    rows = []
+    with executor:
+        futures = [executor.submit(func, item, lot) for item in items]
+        for future in futures:
+            try:
+                rows.append(future.result())
+            except Exception:
+                continue
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).set_index('代码')
+
+
+def compare_money(code, lot=100):
+    '''
+    逐笔成交计算的分钟累计净流入与服务器端intraday_money的对照
+    返回以分钟为索引的DataFrame，列为(来源, 资金类别)，来源为'逐笔'和'服务器'，以及两者的相关系数
+    注意：服务器端按委托单（而非成交笔）分档，两者只能大致对照
+    '''
+    from qstock.data.money import intraday_money
+    local = tick_flow(fetch_ticks(code), lot)
+    server = intraday_money(code)
+    server.index = pd.Index(pd.to_datetime(server['时间']).dt.strftime('%H:%M'), name='时间')
+    server = server[local.columns]
+    both = pd.concat({'逐笔': local, '服务器': server}, axis=1).ffill()
+    corr = {col: both[('逐笔', col)].corr(both[('服务器', col)]) for col in local.columns}
+    return both, pd.Series(corr, name='相关系数')
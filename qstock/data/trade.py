@@ -7,7 +7,6 @@
 
 import json
 import re
-import signal
 import requests
 from retry import retry
 import pandas as pd
@@ -19,9 +18,10 @@ from jsonpath import jsonpath
 from datetime import datetime, timedelta
 
 from qstock.data.util import (request_header, session, market_num_dict,
-                  get_code_id, trans_num, trade_detail_dict, )
+                  get_code_id, quote_id_names, trans_num, trade_detail_dict, killall_on_sigint, )
+#最近交易日由本地交易日历计算，不再每次请求上证指数行情
+from qstock.data.trade_calendar import latest_trade_date
 
-signal.signal(signal.SIGINT, multitasking.killall)
 
 #获取某市场所有股票/债券/基金代码
 def get_code(market='沪深A'):
@@ -253,14 +253,14 @@ def intraday_data(code):
         'https://push2.eastmoney.com/api/qt/stock/details/get', params=params)
 
     res = response.json()
-    texts = res['data']['details']
-    rows = [txt.split(',')[:4] for txt in texts]
-    df = pd.DataFrame(columns=columns, index=range(len(rows)))
-    df.loc[:, '代码'] = code_id.split('.')[1]
-    df.loc[:, '名称'] = stock_info(code)['名称']
-    detail_df = pd.DataFrame(rows, columns=['时间', '成交价', '成交量', '单数'])
-    detail_df.insert(1, '昨收', res['data']['prePrice'])
-    df.loc[:, detail_df.columns] = detail_df.values
+    data = res['data']
+    rows = [txt.split(',')[:4] for txt in data['details']]
+    df = pd.DataFrame(rows, columns=['时间', '成交价', '成交量', '单数'])
+    df.insert(0, '昨收', data['prePrice'])
+    df.insert(0, '代码', code_id.split('.')[1])
+    # 成交明细接口不返回名称，使用get_code_id查询代码时得到的名称，没有时才请求stock_info
+    df.insert(0, '名称', quote_id_names.get(code_id) or stock_info(code)['名称'])
+    df = df[columns]
     # 将object类型转为数值型
     ignore_cols = ['名称', '代码', '时间']
     df = trans_num(df, ignore_cols)
@@ -317,7 +317,7 @@ def stock_snapshot(code):
         'buy4_count': '买4数量',
         'buy5_count': '买5数量',
     }
-    response = requests.get(
+    response = session.get(
         'https://hsmarketwg.eastmoney.com/api/SHSZQuoteSnapshot', params=params)
     start_index = response.text.find('{')
     end_index = response.text.rfind('}')
@@ -565,9 +565,6 @@ def web_data(code, start='19000101', end=None, freq='d', fqt=1):
     df = trans_num(df, ignore_cols)
     return df
 
-def latest_trade_date():
-    date=stock_realtime('上证指数')['时间'].values[0][:10]
-    return date
 
 
 # 获取单只或多只证券（股票、基金、债券、期货)的收盘价格dataframe
@@ -581,6 +578,8 @@ def get_price(code_list, start='19000101', end=None, freq='d', fqt=1):
     if end is None:
         end=latest_trade_date()
 
+    killall_on_sigint()
+
     @multitasking.task
     #@retry(tries=3, delay=1)
     @func_set_timeout(10)
@@ -619,6 +618,8 @@ def get_data(code_list, start='19000101', end=None, freq='d', fqt=1):
     data_list = []
     pbar = tqdm(total=len(code_list))
 
+    killall_on_sigint()
+
     @multitasking.task
     #@retry(tries=3, delay=1)
     @func_set_timeout(10)
@@ -650,6 +651,8 @@ def get_index_data(code_list, start='19000101', end=None, freq='d'):
     data_list = []
     pbar = tqdm(total=len(code_list))
 
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(code):
@@ -678,6 +681,8 @@ def get_index_price(code_list, start='19000101', end=None, freq='d'):
     if end is None:
         end=latest_trade_date()
 
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(code):
@@ -833,19 +838,14 @@ def index_member(code):
 
 
 # 获取沪深市场股票某一季度的表现情况
-def company_indicator(date=None):
+def company_indicator(date=None, strict=False):
     """
     获取沪深市场股票某一季度的表财务指标
     date报告发布日期，默认最新，如‘2022-09-30’
     一季度：‘2021-03-31’；二季度：'2021-06-30'
     三季度：'2021-09-30'；四季度：'2021-12-31'
+    strict:为True时date还没有数据（如刚结束的季度）返回空表，不用最新报告期代替
     """
-    if date is not None and '-' not in date:
-        date_trans = lambda s: '-'.join([s[:4], s[4:6], s[6:]])
-        date = date_trans(date)
-    if date not in report_date()['报告日期'].to_list():
-        date = latest_report_date()
-
     fields = {
         'SECURITY_CODE': '代码',
         'SECURITY_NAME_ABBR': '简称',
@@ -863,6 +863,14 @@ def company_indicator(date=None):
         'MGJYXJJE': '每股经营现金流'
     }
 
+    if date is not None and '-' not in date:
+        date_trans = lambda s: '-'.join([s[:4], s[4:6], s[6:]])
+        date = date_trans(date)
+    if date not in report_date()['报告日期'].to_list():
+        if strict:
+            return pd.DataFrame(columns=fields.values())
+        date = latest_report_date()
+
     date = f"(REPORTDATE=\'{date}\')"
     page = 1
     dfs = []
@@ -1063,13 +1071,12 @@ fund_header = {
 
 
 # 获取基金单位净值（当前净资产大小）和累计净值（自成立以来的整体收益情况）
-def fund_data_single(code):
+def fund_data_single(code, pz=50000):
     """
     根据基金代码和要获取的页码抓取基金净值信息
     code : 6 位基金代码
+    pz : 获取最近的记录数，默认全部历史
     """
-    # 页码
-    pz = 50000
     data = {
         'FCODE': f'{code}',
         'IsShareNet': 'true',
@@ -1099,19 +1106,11 @@ def fund_data_single(code):
     datas = json_response['Datas']
     if len(datas) == 0:
         return pd.DataFrame(rows, columns=columns)
-    rows = []
-    for stock in datas:
-        date = stock['FSRQ']
-        rows.append({
-            '日期': date,
-            '单位净值': stock['DWJZ'],
-            '累计净值': stock['LJJZ'],
-            '涨跌幅': stock['JZZZL']
-        })
-    df = pd.DataFrame(rows)
+    df = pd.DataFrame(datas)[['FSRQ', 'DWJZ', 'LJJZ', 'JZZZL']]
+    df.columns = columns
     df.index = pd.to_datetime(df['日期'])
-    df['涨跌幅'] = df['涨跌幅'].apply(lambda x: 0 if x == '--' else float(x))
-    df = df.iloc[:, 1:].astype('float').sort_index()
+    df = df.iloc[:, 1:].apply(pd.to_numeric, errors='coerce').sort_index()
+    df['涨跌幅'] = df['涨跌幅'].fillna(0)
     return df
 
 
@@ -1121,6 +1120,8 @@ def fund_price(code_list):
     如code_list=['180003','340006','159901']
     '''
 
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(code):
@@ -1128,12 +1129,14 @@ def fund_price(code_list):
         data[code] = temp['累计净值']
         pbar.update()
     pbar = tqdm(total=len(code_list))
-    data = pd.DataFrame()
+    # 各线程只写入字典，全部完成后一次对齐
+    data = {}
     for code in code_list:
         run(code)
     multitasking.wait_for_tasks()
-
-    return data
+    if not data:
+        return pd.DataFrame()
+    return pd.concat(data, axis=1)[[c for c in code_list if c in data]]
 
 
 # 获取单只或多只基金的历史净值数据
@@ -1147,6 +1150,8 @@ def fund_data(code_list):
     data_list = []
     pbar = tqdm(total=len(code_list))
 
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(code):
@@ -1161,18 +1166,22 @@ def fund_data(code_list):
     df = pd.concat(data_list, axis=0)
     return df
 
-def fund_code(ft=None):
-    """
-    获取天天基金网公开的全部公墓基金名单
-    ft : 'zq': 债券类型基金
-        'gp': 股票类型基金
-        'etf': ETF 基金
-        'hh': 混合型基金
-        'zs': 指数型基金
-        'fof': FOF 基金
-        'qdii': QDII 型基金
-        `None` : 全部
-    """
+fund_rank_header = {
+    'Connection': 'keep-alive',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.141 Safari/537.36 Edg/87.0.664.75',
+    'Accept': '*/*',
+    'Referer': 'http://fund.eastmoney.com/data/fundranking.html',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
+}
+
+# rankhandler每条记录逗号分隔的字段，'_'为不需要的字段
+fund_rank_fields = ['基金代码', '基金简称', '_', '日期', '单位净值', '累计净值', '日增长率',
+                    '近一周', '近一月', '近三月', '近六月', '近一年', '近两年', '近三年',
+                    '今年以来', '成立以来', '成立日期', '_', '自定义', '_', '手续费']
+
+
+def fund_rank_text(ft=None):
+    """天天基金网开放式基金排行（一次返回全部基金）的原始内容"""
     params = [
         ('op', 'dy'),
         ('dt', 'kf'),
@@ -1185,29 +1194,60 @@ def fund_code(ft=None):
         ('pi', '1'),
         ('pn', '50000'),
         ('dx', '0')]
-
-    headers = {
-        'Connection': 'keep-alive',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.141 Safari/537.36 Edg/87.0.664.75',
-        'Accept': '*/*',
-        'Referer': 'http://fund.eastmoney.com/data/fundranking.html',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8,en-GB;q=0.7,en-US;q=0.6',
-    }
     if ft is not None:
         params.append(('ft', ft))
-
     url = 'http://fund.eastmoney.com/data/rankhandler.aspx'
-    response = requests.get(
+    response = session.get(
         url,
-        headers=headers,
+        headers=fund_rank_header,
         params=params)
+    return response.text
+
 
+def fund_code(ft=None):
+    """
+    获取天天基金网公开的全部公墓基金名单
+    ft : 'zq': 债券类型基金
+        'gp': 股票类型基金
+        'etf': ETF 基金
+        'hh': 混合型基金
+        'zs': 指数型基金
+        'fof': FOF 基金
+        'qdii': QDII 型基金
+        `None` : 全部
+    """
     columns = ['基金代码', '基金简称']
-    results = re.findall('"(\d{6}),(.*?),', response.text)
+    results = re.findall('"(\d{6}),(.*?),', fund_rank_text(ft))
     df = pd.DataFrame(results, columns=columns)
     return df
 
 
+def fund_rank(ft=None):
+    """
+    一次请求获取全部开放式基金的最新净值和阶段收益率（与fund_code同一个接口），
+    代替对每只基金调用fund_info、fund_perfmance
+    ft : 基金类型，同fund_code
+    返回基金代码、基金简称、日期、单位净值、累计净值、日增长率、近一周……成立以来（%）、
+    成立日期、手续费（%）
+    """
+    text = fund_rank_text(ft)
+    match = re.search(r'datas:(\[.*?\])', text, re.S)
+    records = json.loads(match.group(1)) if match else []
+    cols = [c for c in fund_rank_fields if c != '_']
+    if not records:
+        return pd.DataFrame(columns=cols)
+    df = pd.Series(records).str.split(',', expand=True)
+    df = df.reindex(columns=range(len(fund_rank_fields)))
+    df.columns = fund_rank_fields
+    df = df[cols].copy()
+    df['手续费'] = df['手续费'].str.rstrip('%')
+    num_cols = [c for c in cols if c not in ('基金代码', '基金简称', '日期', '成立日期')]
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce')
+    for col in ('日期', '成立日期'):
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
 def fund_position(code, n=1):
     '''code:基金代码，n:获取最近n期数据，n默认为1表示最近一期数据
     '''
@@ -1376,6 +1416,8 @@ def fund_info(code_list=None, ft='gp'):
         code_list = [code_list]
     ss = []
 
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def start(code):
@@ -1435,13 +1477,24 @@ def bond_info_single(code):
     return s
 
 
-def bond_info_all():
+# 可转债估值需要的条款（在基本信息之外）
+bond_terms_field = {
+    **bond_info_field,
+    'VALUE_DATE': '起息日期',
+    'TRANSFER_START_DATE': '转股开始日',
+    'TRANSFER_PRICE': '转股价',
+    'REDEEM_TRIG_PRICE': '强赎触发价',
+    'RESALE_TRIG_PRICE': '回售触发价'}
+
+
+def bond_info_all(fields=None):
     """
     获取全部债券基本信息列表
+    fields : {接口字段: 列名}，默认bond_info_field，bond_terms_field包括转股价等条款
     """
     page = 1
     dfs = []
-    columns = bond_info_field
+    columns = fields or bond_info_field
     while 1:
         params = (
             ('sortColumns', 'PUBLIC_START_DATE'),
@@ -1462,7 +1515,7 @@ def bond_info_all():
             break
         data = json_response['result']['data']
         df = pd.DataFrame(data).rename(
-            columns=columns)[columns.values()]
+            columns=columns).reindex(columns=list(columns.values()))
         dfs.append(df)
         page += 1
 
@@ -1481,6 +1534,8 @@ def bond_info(code_list=None):
         code_list = [code_list]
     ss = []
 
+    killall_on_sigint()
+
     @multitasking.task
     @func_set_timeout(5)
     def run(code):
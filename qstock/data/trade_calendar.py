@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+A股交易日历
+
+以上证指数日K线的日期作为交易日（已包含沪深交易所的节假日休市），
+缓存在本地数据目录，查询全部在内存中完成，不访问网络。
+本地日历过期时（出现了新的交易日）在后台线程中刷新一次，刷新完成前，
+日历之后的日期按周一至周五为交易日估计。
+交易时段（北京时间）：9:30-11:30，13:00-15:00
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from datetime import time as dtime
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.util import session, request_header, data_dir
+
+china_tz = timezone(timedelta(hours=8))
+# 交易时段
+trade_sessions = ((dtime(9, 30), dtime(11, 30)), (dtime(13, 0), dtime(15, 0)))
+# 此时间之后日K线中一定有当日数据，此后刷新的日历对当日也是准确的
+kline_ready = dtime(9, 35)
+# 后台刷新失败后，至少间隔多少秒再重试
+retry_interval = 600
+
+calendar = {'dates': None, 'valid_until': None, 'checked': 0.0}
+lock = threading.Lock()
+refreshing = threading.Lock()
+
+
+def china_now():
+    '''当前北京时间（不带时区信息）'''
+    return datetime.now(china_tz).replace(tzinfo=None)
+
+
+def to_date(date=None):
+    '''把'20230101'、'2023-01-01'、datetime等转换为datetime.date，None为今天'''
+    if date is None:
+        return china_now().date()
+    return pd.Timestamp(date).date()
+
+
+def fetch_trade_dates():
+    '''从上证指数日K线获取全部交易日，返回['1990-12-19', ...]'''
+    url = 'https://push2his.eastmoney.com/api/qt/stock/kline/get'
+    params = (
+        ('fields1', 'f1,f2,f3'),
+        ('fields2', 'f51'),
+        ('beg', '19900101'),
+        ('end', '20500101'),
+        ('rtntype', '6'),
+        ('secid', '1.000001'),
+        ('klt', '101'),
+        ('fqt', '0'),
+    )
+    json_response = session.get(url, headers=request_header, params=params, timeout=10).json()
+    return [k.split(',')[0] for k in json_response['data']['klines']]
+
+
+def expected_valid_until(now=None):
+    '''当前时刻刷新日历后，日历可以确定到哪一天'''
+    now = now or china_now()
+    if now.time() >= kline_ready:
+        return now.date()
+    return now.date() - timedelta(days=1)
+
+
+def set_calendar(dates, valid_until):
+    calendar['dates'] = np.array(dates, dtype='datetime64[D]')
+    calendar['valid_until'] = valid_until
+
+
+def refresh_calendar():
+    '''
+    从网络刷新交易日历并保存到本地，返回交易日数量
+    一般不需要手动调用，日历过期时会在后台自动刷新
+    '''
+    dates = fetch_trade_dates()
+    valid_until = expected_valid_until()
+    if dates and to_date(dates[-1]) > valid_until:
+        valid_until = to_date(dates[-1])
+    with lock:
+        set_calendar(dates, valid_until)
+        calendar['checked'] = time.time()
+    path = data_dir() / 'trade_calendar.json'
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'valid_until': str(valid_until), 'dates': dates}), encoding='utf-8')
+    tmp.replace(path)
+    return len(dates)
+
+
+def is_stale():
+    '''本地日历之后是否可能出现了新的交易日（周一至周五）'''
+    valid_until = calendar['valid_until']
+    if valid_until is None:
+        return True
+    target = expected_valid_until()
+    return valid_until < target and \
+        np.busday_count(valid_until + timedelta(days=1), target + timedelta(days=1)) > 0
+
+
+def background_refresh():
+    if not refreshing.acquire(blocking=False):
+        return
+    try:
+        refresh_calendar()
+    except Exception:
+        calendar['checked'] = time.time()
+    finally:
+        refreshing.release()
+
+
+def load_calendar():
+    '''返回(交易日数组, 日历确定到的日期)，首次调用时读取本地缓存，没有缓存时从网络获取'''
+    if calendar['dates'] is None:
+        with lock:
+            if calendar['dates'] is None:
+                path = data_dir() / 'trade_calendar.json'
+                if path.exists():
+                    cache = json.loads(path.read_text(encoding='utf-8'))
+                    set_calendar(cache['dates'], to_date(cache['valid_until']))
+        if calendar['dates'] is None:
+            try:
+                refresh_calendar()
+            except Exception:
+                # 网络不可用时退化为按周一至周五估计
+                with lock:
+                    if calendar['dates'] is None:
+                        set_calendar([], None)
+                        calendar['checked'] = time.time()
+    if is_stale() and time.time() - calendar['checked'] > retry_interval and not refreshing.locked():
+        calendar['checked'] = time.time()
+        threading.Thread(target=background_refresh, daemon=True).start()
+    return calendar['dates'], calendar['valid_until']
+
+
+def trade_dates_until(date):
+    '''截至date（含）的全部交易日，日历之后的日期按周一至周五估计'''
+    dates, valid_until = load_calendar()
+    end = np.datetime64(date, 'D')
+    if valid_until is not None and date <= valid_until:
+        return dates[:np.searchsorted(dates, end, side='right')]
+    begin = np.datetime64(valid_until, 'D') + 1 if valid_until is not None else np.datetime64('1990-12-19')
+    guess = np.arange(begin, end + 1, dtype='datetime64[D]')
+    guess = guess[np.is_busday(guess)]
+    known = dates if valid_until is not None else dates[:0]
+    return np.concatenate([known, guess])
+
+
+def is_trade_date(date=None):
+    '''
+    date是否为交易日，默认今天
+    date:'20230101'或'2023-01-01'或datetime
+    '''
+    date = to_date(date)
+    dates = trade_dates_until(date)
+    return len(dates) > 0 and dates[-1] == np.datetime64(date, 'D')
+
+
+def is_trading_time(t=None):
+    '''
+    t时刻是否处于交易时段（9:30-11:30，13:00-15:00），默认当前北京时间，即是否正在交易
+    '''
+    t = china_now() if t is None else pd.Timestamp(t).to_pydatetime()
+    if not is_trade_date(t.date()):
+        return False
+    return any(begin <= t.time() <= end for begin, end in trade_sessions)
+
+
+def latest_date(after):
+    '''最近一个交易日，当天只有在after时刻之后才算'''
+    now = china_now()
+    date = now.date()
+    if now.time() < after:
+        date = date - timedelta(days=1)
+    dates = trade_dates_until(date)
+    return str(dates[-1])
+
+
+def latest_trade_date():
+    '''
+    最近交易日，如'2023-05-05'
+    当天为交易日且已开盘（9:30）时返回当天，否则返回上一个交易日
+    '''
+    return latest_date(trade_sessions[0][0])
+
+
+def latest_closed_trade_date():
+    '''最近一个已收盘（15:00）的交易日，如'2023-05-05' '''
+    return latest_date(trade_sessions[-1][-1])
+
+
+def trade_days_back(n, date=None):
+    '''
+    date（默认今天）往前数第n个交易日，n=0时为date当天或之前最近的交易日
+    返回'2023-05-05'格式的日期
+    '''
+    dates = trade_dates_until(to_date(date))
+    if n >= len(dates):
+        raise ValueError(f'交易日历中没有{n}个交易日之前的数据')
+    return str(dates[-1 - n])
+
+
+def trade_days_between(start, end=None):
+    '''
+    start到end（默认今天）之间（含两端）的全部交易日，返回DatetimeIndex
+    len(trade_days_between(start, end))即两者之间的交易日数
+    '''
+    dates = trade_dates_until(to_date(end))
+    dates = dates[dates >= np.datetime64(to_date(start), 'D')]
+    return pd.DatetimeIndex(dates, name='date')
@@ -4,12 +4,19 @@
 @Author  ：Jinyi Zhang 
 @Date    ：2022/9/29 20:28 
 '''
+import os
+import ast
 import time
+import signal
+import importlib
+import threading
 import requests
 import pandas as pd
+import multitasking
 
+from types import ModuleType
 from pathlib import Path
-from py_mini_racer import py_mini_racer
+from functools import lru_cache
 
 # 东方财富网网页请求头
 request_header = {
@@ -146,20 +153,25 @@ js_str = """
                 return output;  
             }  
 """
-random_time_str = str(int(time.time()))
-js_code = py_mini_racer.MiniRacer()
-js_code.eval(js_str)
-mcode = js_code.call("mcode", random_time_str)
+@lru_cache()
+def cn_mcode():
+    '''巨潮资讯请求头中的mcode，首次使用时计算'''
+    from py_mini_racer import py_mini_racer
+    js_code = py_mini_racer.MiniRacer()
+    js_code.eval(js_str)
+    return js_code.call("mcode", str(int(time.time())))
+
 
-#巨潮信息网站网页请求头
-cn_headers = {
+def cn_header():
+    '''巨潮信息网站网页请求头'''
+    return {
         "Accept": "*/*",
         "Accept-Encoding": "gzip, deflate",
         "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
         "Cache-Control": "no-cache",
         "Content-Length": "0",
         "Host": "webapi.cninfo.com.cn",
-        "mcode": mcode,
+        "mcode": cn_mcode(),
         "Origin": "http://webapi.cninfo.com.cn",
         "Pragma": "no-cache",
         "Proxy-Connection": "keep-alive",
@@ -168,6 +180,16 @@ cn_headers = {
         "X-Requested-With": "XMLHttpRequest",
     }
 
+
+def __getattr__(name):
+    # 兼容原来的模块变量，访问时才计算mcode
+    if name == 'cn_headers':
+        return cn_header()
+    if name == 'mcode':
+        return cn_mcode()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 ths_code_name = {
         "881101": "种植业与林业",
         "881102": "养殖业",
@@ -477,6 +499,10 @@ ths_code_name = {
         "884274": "IT服务",
     }
 
+# get_code_id查询时顺带得到的证券名称 {行情ID: 名称}，供不返回名称的接口使用
+quote_id_names = {}
+
+
 def get_code_id(code):
     """
     生成东方财富股票专用的行情ID
@@ -484,6 +510,10 @@ def get_code_id(code):
     """
     if code in code_id_dict.keys():
         return code_id_dict[code]
+    #已经是行情ID（如'1.600519'）时不再查询
+    market, _, symbol = code.partition('.')
+    if market.isdigit() and symbol:
+        return code
     url = 'https://searchapi.eastmoney.com/api/suggest/get'
     params = (
         ('input', f'{code}'),
@@ -493,10 +523,23 @@ def get_code_id(code):
     response = session.get(url, params=params).json()
     code_dict = response['QuotationCodeTable']['Data']
     if code_dict:
+        if code_dict[0].get('Name'):
+            quote_id_names[code_dict[0]['QuoteID']] = code_dict[0]['Name']
         return code_dict[0]['QuoteID']
     else:
         print('输入代码有误')
 
+def data_dir(*subdirs):
+    '''
+    返回qstock本地数据缓存目录（不存在则自动创建）
+    默认为用户目录下的.qstock，可通过环境变量QSTOCK_HOME修改
+    subdirs:子目录名称，如data_dir('ths_kline')
+    '''
+    root = os.environ.get('QSTOCK_HOME') or Path.home() / '.qstock'
+    path = Path(root).joinpath(*subdirs)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
 def trans_num(df, ignore_cols):
     '''df为需要转换数据类型的dataframe
     ignore_cols为dataframe中忽略要转换的列名的list
@@ -512,6 +555,7 @@ def ths_header():
     file= Path(__file__).parent/"ths.js"
     with open(file) as f:
         js_data = f.read()
+    from py_mini_racer import py_mini_racer
     js_code = py_mini_racer.MiniRacer()
     js_code.eval(js_data)
     v_code = js_code.call("v")
@@ -519,4 +563,139 @@ def ths_header():
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.90 Safari/537.36",
         "Cookie": f"v={v_code}",
     }
-    return headers
\ No newline at end of file
+    return headers
+
+sigint_installed = []
+
+
+def killall_on_sigint():
+    '''
+    按Ctrl+C时结束multitasking的全部下载任务
+    在多线程下载函数中调用，只在主线程安装一次，导入qstock时不修改信号处理
+    '''
+    if sigint_installed or threading.current_thread() is not threading.main_thread():
+        return
+    signal.signal(signal.SIGINT, multitasking.killall)
+    sigint_installed.append(True)
+
+
+def public_names(module):
+    '''
+    解析模块源码（不导入模块），返回from module import *会导出的名称
+    返回(定义的名称, [(导入的名称, 来源模块), ...])
+    '''
+    # 直接按路径找源码文件，find_spec会导入上级包，失去延迟导入的意义
+    path = Path(__file__).parent.parent.joinpath(*module.split('.')[1:])
+    is_package = path.is_dir()
+    path = path / '__init__.py' if is_package else path.with_suffix('.py')
+    tree = ast.parse(path.read_text(encoding='utf-8'))
+    package = module if is_package else module.rpartition('.')[0]
+    defined, imported = [], []
+
+    def visit(nodes):
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                defined.append(node.name)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for n in ast.walk(target):
+                        if isinstance(n, ast.Name):
+                            defined.append(n.id)
+            elif isinstance(node, ast.Import):
+                imported.extend((a.asname or a.name.split('.')[0], None) for a in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = package.rsplit('.', node.level - 1)[0] if node.level else ''
+                source = '.'.join(filter(None, [base, node.module]))
+                if node.names[0].name == '*':
+                    sub_defined, sub_imported = public_names(source)
+                    defined.extend(sub_defined)
+                    imported.extend(sub_imported)
+                    # 包的__init__中导入子模块后，子模块本身也成为包的属性
+                    if source.startswith(module + '.'):
+                        imported.append((source[len(module) + 1:].split('.')[0], None))
+                else:
+                    imported.extend((a.asname or a.name, source) for a in node.names)
+            elif isinstance(node, (ast.If, ast.Try)):
+                visit(node.body)
+                visit(node.orelse)
+                for handler in getattr(node, 'handlers', []):
+                    visit(handler.body)
+                visit(getattr(node, 'finalbody', []))
+
+    visit(tree.body)
+    return ([n for n in defined if not n.startswith('_')],
+            [(n, source) for n, source in imported if not n.startswith('_')])
+
+
+def lazy_exports(package, namespace, modules):
+    '''
+    PEP 562延迟导入，用于包的__init__.py，返回模块级的(__getattr__, __dir__)
+    package：包名；namespace：包的globals()
+    modules：原来依次导入的子模块，'模块名'表示from 模块 import *，
+             ('模块名', [名称, ...])表示from 模块 import 名称
+    访问某个名称时才导入定义它的子模块，同名时与原来一样以后导入的模块为准
+    '''
+    index = {}
+    lock = threading.RLock()
+
+    def build_index():
+        if not index:
+            names = {}
+            for module in modules:
+                if isinstance(module, tuple):
+                    module, defined = module
+                    names.update(dict.fromkeys(defined, module))
+                    continue
+                defined, imported = public_names(module)
+                for name, source in imported:
+                    # 从前面的子模块导入的同一对象，仍由前面的子模块提供，避免多余的导入
+                    if source is None or names.get(name) != source:
+                        names[name] = module
+                for name in defined:
+                    names[name] = module
+            index.update(names)
+        return index
+
+    def restore_shadowed():
+        # 第一次导入子模块时Python把包的同名属性改为该子模块（如函数member_index与模块member_index），
+        # 索引中由子模块提供的同名函数等需要重新写回
+        for name, module in index.items():
+            value = namespace.get(name)
+            if module != package and isinstance(value, ModuleType) and value.__name__ == f'{package}.{name}':
+                namespace[name] = getattr(importlib.import_module(module), name)
+
+    def load(name):
+        module = build_index().get(name)
+        if module == package:
+            value = importlib.import_module(f'{package}.{name}')
+        elif module is not None:
+            value = getattr(importlib.import_module(module), name)
+        elif Path(namespace['__file__']).parent.joinpath(name).is_dir() or \
+                Path(namespace['__file__']).parent.joinpath(f'{name}.py').exists():
+            value = importlib.import_module(f'{package}.{name}')
+        else:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        namespace[name] = value
+        restore_shadowed()
+        return value
+
+    def __getattr__(name):
+        if name.startswith('__'):
+            if name != '__all__':
+                raise AttributeError(f"module {package!r} has no attribute {name!r}")
+            # from package import *：导入全部子模块
+            with lock:
+                for name in build_index():
+                    if name not in namespace:
+                        load(name)
+            return [n for n in namespace if not n.startswith('_')]
+        with lock:
+            if name in namespace:
+                return namespace[name]
+            return load(name)
+
+    def __dir__():
+        return sorted(set(namespace) | set(build_index()))
+
+    return __getattr__, __dir__
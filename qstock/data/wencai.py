@@ -10,8 +10,13 @@ import requests
 import random
 import os
 import json
-import execjs
+import threading
+import warnings
 import datetime as dt
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from qstock.data.util import data_dir
 
 WENCAI_LOGIN_URL = {
     "scrape_transaction": 'http://www.iwencai.com/traceback/strategy/transaction',
@@ -30,7 +35,8 @@ WENCAI_CRAWLER_URL = {
     "history_pick": 'http://backtest.10jqka.com.cn/tradebacktest/historypick?query={query}&hold_num={hold_num}&trade_date={trade_date}',
     'eventbacktest': 'http://backtest.10jqka.com.cn/eventbacktest/backtest',
     'lastjs':'http://d.10jqka.com.cn/v2/time/{}/last.js',
-    'search': 'http://x.10jqka.com.cn/unifiedwap/unified-wap/v2/result/get-robot-data'
+    'search': 'http://x.10jqka.com.cn/unifiedwap/unified-wap/v2/result/get-robot-data',
+    'datalist': 'http://www.iwencai.com/gateway/urp/v7/landing/getDataList',
 
 }
 
@@ -50,16 +56,38 @@ WENCAI_HEADERS = {
 }
 
 
+hexin_js = Path(__file__).parent / 'hexin.js'
+js_lock = threading.Lock()
+
+
+@lru_cache()
+def hexin_context():
+    '''
+    编译hexin.js，整个进程只编译一次
+    优先使用进程内的py_mini_racer，未安装时使用execjs（execjs每次call会启动外部JS进程）
+    '''
+    js_code = hexin_js.read_text(encoding='utf-8')
+    try:
+        from py_mini_racer import py_mini_racer
+        context = py_mini_racer.MiniRacer()
+        context.eval(js_code)
+    except ImportError:
+        import execjs
+        context = execjs.compile(js_code)
+    return context
+
+
 class WencaiCookie:
+    # 内存中的hexin-v缓存：{source: (hexin-v, 生成时间)}，所有实例共用
+    tokens = {}
+    lock = threading.Lock()
 
     def __init__(self):
-        self.json_path = os.path.dirname(__file__) + '/cookies.json'
+        self.json_path = data_dir() / 'cookies.json'
 
     def getHeXinVByHttp(self):
-        with open(os.path.dirname(os.path.dirname(__file__)) + '\\data\\hexin.js', 'r') as f:
-            jscontent = f.read()
-        context = execjs.compile(jscontent)
-        return context.call("v")
+        with js_lock:
+            return hexin_context().call("v")
 
     def setHexinByJson(self, source, cookies=None):
         if cookies is None: cookies = dict()
@@ -68,6 +96,7 @@ class WencaiCookie:
         cookies['expire_time'] = dt.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
         with open(self.json_path, 'w') as f:
             json.dump(cookies, f)
+        WencaiCookie.tokens[source] = (henxin_v, cookies['expire_time'])
         return henxin_v
 
     def is_expire(self, expire_time, days=3):
@@ -78,20 +107,20 @@ class WencaiCookie:
             return False
 
     def getHexinVByJson(self, source):
-        json_path = os.path.dirname(__file__) + '/cookies.json'
-        if os.path.exists(json_path):
-            with open(json_path, 'r') as f:
-                cookies = json.load(f)
-
-            if source in cookies:
-                if not self.is_expire(cookies['expire_time']):
-                    return cookies[source]
-                else:
-                    return self.setHexinByJson(source=source, cookies=cookies)
-            else:
-                return self.setHexinByJson(source=source, cookies=cookies)
-        else:
-            self.setHexinByJson(source=source)
+        # 先查内存，再查cookies.json，都过期或没有时重新生成
+        with WencaiCookie.lock:
+            if source in WencaiCookie.tokens:
+                henxin_v, expire_time = WencaiCookie.tokens[source]
+                if not self.is_expire(expire_time):
+                    return henxin_v
+            cookies = dict()
+            if os.path.exists(self.json_path):
+                with open(self.json_path, 'r') as f:
+                    cookies = json.load(f)
+            if source in cookies and not self.is_expire(cookies['expire_time']):
+                WencaiCookie.tokens[source] = (cookies[source], cookies['expire_time'])
+                return cookies[source]
+            return self.setHexinByJson(source=source, cookies=cookies)
 
 
 class Session(requests.Session):
@@ -117,46 +146,103 @@ class Session(requests.Session):
         self.proxies = proxies
         self.verify = verify
 
-    def update_headers(self, source, add_headers, force_cookies=False):
+    def request_headers(self, source, add_headers, force_cookies=False):
+        '''
+        本次请求的hexin-v和附加请求头，作为headers参数随请求发送，
+        不写入共用的self.headers，多个线程并发请求时互不覆盖
+        '''
         if force_cookies:
-            self.headers['hexin-v'] = WencaiCookie().getHeXinVByHttp()
+            headers = {'hexin-v': WencaiCookie().getHeXinVByHttp()}
         else:
-            self.headers['hexin-v'] = WencaiCookie().getHexinVByJson(source=source)
+            headers = {'hexin-v': WencaiCookie().getHexinVByJson(source=source)}
         if add_headers is not None:
             if not isinstance(add_headers, dict):
                 raise TypeError('update_headers should be `dict` type.')
-            for k, v in add_headers.items():
-                self.headers[k] = v
+            headers.update(add_headers)
+        return headers
+
+    def update_headers(self, source, add_headers, force_cookies=False):
+        self.headers.update(self.request_headers(source, add_headers, force_cookies))
 
     def get_result(self, url, source=None, force_cookies=False, add_headers=None, **kwargs):
-        self.update_headers(add_headers=add_headers, source=source, force_cookies=force_cookies)
+        headers = {**self.request_headers(source, add_headers, force_cookies), **kwargs.pop('headers', {})}
         if self.proxies is None:
-            return super(Session, self).get(url=url, **kwargs)
+            return super(Session, self).get(url=url, headers=headers, **kwargs)
         else:
-            return super(Session, self).get(url=url, proxies=self.proxies, verify=self.verify, **kwargs)
+            return super(Session, self).get(url=url, headers=headers, proxies=self.proxies, verify=self.verify,
+                                            **kwargs)
 
     def post_result(self, url, source=None, data=None, json=None, add_headers=None, force_cookies=False, **kwargs):
-        self.update_headers(add_headers=add_headers, source=source, force_cookies=force_cookies)
+        headers = {**self.request_headers(source, add_headers, force_cookies), **kwargs.pop('headers', {})}
         if self.proxies is None:
-            return super(Session, self).post(url=url, data=data, json=json, **kwargs)
+            return super(Session, self).post(url=url, data=data, json=json, headers=headers, **kwargs)
         else:
-            return super(Session, self).post(url=url, data=data, json=json, proxies=self.proxies, verify=self.verify,
-                                             **kwargs)
+            return super(Session, self).post(url=url, data=data, json=json, headers=headers, proxies=self.proxies,
+                                             verify=self.verify, **kwargs)
 
-cookies = WencaiCookie()
-session = Session(proxies=None, verify=False)
-session.headers.update({'Host':'www.iwencai.com'})
+@lru_cache()
+def get_session():
+    '''问财请求使用的session，第一次调用时创建'''
+    session = Session(proxies=None, verify=False)
+    session.headers.update({'Host':'www.iwencai.com'})
+    return session
 
-def wencai(question):
+
+def __getattr__(name):
+    # 兼容原来的模块变量session和cookies，导入时不再创建
+    if name == 'session':
+        return get_session()
+    if name == 'cookies':
+        return WencaiCookie()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def wencai_page(question, component, page, perpage=100, retries=2):
+    '''
+    获取问财选股结果的第page页，component为第一页结果中的表格组件
+    返回结果不完整时重试（重试时重新生成hexin-v），retries次后仍失败返回None
+    '''
+    meta = component['data']['meta']
+    extra = meta.get('extra', {})
+    payload = {
+        'query': question,
+        'page': page,
+        'perpage': perpage,
+        'condition': json.dumps(extra.get('condition', []), ensure_ascii=False),
+        'comp_id': component.get('cid', ''),
+        'uuid': component.get('puuid', ''),
+        'uuids[0]': component.get('puuid', ''),
+        'logid': meta.get('logid', ''),
+        'ret': 'json_all',
+        'query_type': 'stock',
+        'source': 'Ths_iwencai_Xuangu',
+        'business_cat': 'soniu',
+        'urp_use_sort': 1,
+        'urp_sort_way': 'desc',
+        'urp_sort_index': '',
+    }
+    for attempt in range(retries + 1):
+        r = get_session().post_result(url=WENCAI_CRAWLER_URL['datalist'],
+                                      data=payload, source='wencai', force_cookies=attempt > 0)
+        try:
+            return r.json()['answer']['components'][0]['data']['datas']
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+    return None
+
+
+def wencai(question, max_page=None):
     '''
     question:输入你要问的条件，不同条件使用“，”或“；”或空格
     如'均线多头排列'
-    
+    max_page:最多获取的页数（每页100条），默认获取全部结果，
+    第一页之后的页面并发获取
     '''
+    perpage = 100
     payload = {
             "question": question,
             "page": 100,
-            "perpage": 100,
+            "perpage": perpage,
             "log_info": '{"input_type": "typewrite"}',
             "source": "Ths_iwencai_Xuangu",
             "version": 2.0,
@@ -166,14 +252,38 @@ def wencai(question):
             "add_info": '{"urp": {"scene": 1, "company": 1, "business": 1}, "contentType": "json", "searchInfo": true}'
         }
 
-    r = session.post_result(url=WENCAI_CRAWLER_URL['search'],
-                                     data=payload, force_cookies=True)
+    r = get_session().post_result(url=WENCAI_CRAWLER_URL['search'],
+                                  data=payload, source='wencai')
     try:
-        result = r.json()['data']['answer'][0]['txt'][0]['content']['components'][0]['data']['datas']
+        component = r.json()['data']['answer'][0]['txt'][0]['content']['components'][0]
+        result = component['data']['datas']
     except:
+        component = None
         result={}
         print('没有你要的结果')
 
+    # 结果超过一页时，并发获取剩余页面
+    if component is not None:
+        try:
+            row_count = int(component['data']['meta']['extra']['row_count'])
+        except:
+            row_count = len(result)
+        pages = -(-row_count // perpage)
+        if max_page is not None:
+            pages = min(pages, max_page)
+        failed = []
+        if pages > 1:
+            with ThreadPoolExecutor(max_workers=min(pages - 1, 8)) as executor:
+                rows = list(executor.map(lambda p: wencai_page(question, component, p, perpage),
+                                         range(2, pages + 1)))
+            failed = [p for p, page in zip(range(2, pages + 1), rows) if page is None]
+            result = list(result) + [row for page in rows if page for row in page]
+            if failed:
+                warnings.warn(f'问财结果第{failed}页获取失败，返回的结果不完整')
+        expected = min(row_count, pages * perpage)
+        if not failed and len(result) < expected:
+            warnings.warn(f'问财结果共{expected}条，只获取到{len(result)}条')
+
     def _re_str(x: str):
         _re = re.findall('(.*):前复权', x)
         if len(_re) >= 1:
@@ -4,6 +4,15 @@
 @Author  ：Jinyi Zhang 
 @Date    ：2022/9/29 20:25 
 '''
+from qstock.data.util import lazy_exports
 
-from .ths_em_pool import *
-from .stock_pool import *
\ No newline at end of file
+#第一次访问时才导入（PEP 562），stock_pool依赖matplotlib
+__getattr__, __dir__ = lazy_exports(__name__, globals(), [
+    'qstock.stock.ths_em_pool',
+    'qstock.stock.board_index',
+    'qstock.stock.money_rank',
+    'qstock.stock.screener',
+    'qstock.stock.ta_pool',
+    'qstock.stock.limit_history',
+    'qstock.stock.stock_pool',
+])
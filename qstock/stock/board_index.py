@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+由成份股K线本地计算板块指数（等权、流通市值加权）
+
+板块成份关系可以是member_index的索引，也可以是自定义的{板块名称: [股票代码, ...]}，
+几百个板块一次计算：成份矩阵（板块×股票，安装了scipy时为稀疏矩阵）乘以
+持仓市值矩阵（股票×时间），不逐个板块循环。
+调仓日之间持仓股数不变（指数随成份股价格漂移），调仓日收盘按权重重新配置。
+返回以时间为索引、板块名称为列的指数点位，可以直接用于ret_rank、ret_top：
+    close = board_index(bars, {'白酒': [...], '光伏': [...]}, weight='float_cap', rebalance='m')
+    ret_rank(close)
+"""
+import numpy as np
+import pandas as pd
+
+# 调仓频率，与resample的周期名称一致
+rebalance_freq = {'d': 'D', 'w': 'W-SUN', 'm': 'M', 'q': 'Q', 'y': 'Y'}
+
+
+def price_panel(bars, field='close'):
+    '''
+    把get_data/load_bars/adjusted_data返回的面板数据（以code列区分股票）转换为宽表：
+    时间×股票代码；已经是宽表时原样返回
+    '''
+    if 'code' not in bars.columns:
+        return bars.sort_index()
+    if field not in bars.columns:
+        field = {'close': '收盘', 'open': '开盘'}.get(field, field)
+    df = bars.pivot_table(index=bars.index, columns='code', values=field, aggfunc='last')
+    df.index = pd.DatetimeIndex(df.index, name='date')
+    return df.sort_index()
+
+
+def member_matrix(members, code_list):
+    '''
+    成份矩阵：行为板块，列为code_list中的股票，成份股为1
+    members:MemberIndex、{板块名称: [股票代码]}，或含'板块名称'（或'板块代码'）、'代码'列的长表
+    返回(板块名称列表, 矩阵)，安装了scipy时为稀疏矩阵，否则为numpy数组
+    '''
+    if hasattr(members, 'boards_stocks'):
+        members = members.boards_stocks()
+    if isinstance(members, pd.DataFrame):
+        board_col = '板块名称' if '板块名称' in members.columns else '板块代码'
+        members = members.groupby(board_col, sort=False)['代码'].apply(list).to_dict()
+    pos = {str(code): j for j, code in enumerate(code_list)}
+    names = list(members)
+    rows, cols = [], []
+    for i, name in enumerate(names):
+        stocks = [pos[c] for c in map(str, members[name]) if c in pos]
+        rows += [i] * len(stocks)
+        cols += stocks
+    shape = (len(names), len(code_list))
+    data = np.ones(len(rows))
+    try:
+        from scipy import sparse
+        return names, sparse.csr_matrix((data, (rows, cols)), shape=shape)
+    except ImportError:
+        m = np.zeros(shape)
+        m[rows, cols] = 1
+        return names, m
+
+
+def rebalance_points(index, rebalance=None):
+    '''
+    每根K线之后适用的调仓点位置：返回数组p，第t根K线的持仓在第p[t]根K线收盘时确定
+    rebalance:None每根K线都调仓；'d'、'w'、'm'、'q'、'y'每个周期最后一根K线调仓；
+    或调仓日期列表（在该日最后一根K线调仓）。第一根K线总是调仓点
+    '''
+    n = len(index)
+    if rebalance is None:
+        return np.arange(n)
+    index = pd.DatetimeIndex(index)
+    if isinstance(rebalance, str):
+        periods = index.to_period(rebalance_freq[rebalance.lower()]).asi8
+        is_point = np.r_[periods[1:] != periods[:-1], True]
+    else:
+        days = index.normalize().asi8
+        dates = pd.DatetimeIndex(pd.to_datetime(list(rebalance))).normalize().asi8
+        is_point = np.isin(days, dates) & np.r_[days[1:] != days[:-1], True]
+    is_point[0] = True
+    return np.maximum.accumulate(np.where(is_point, np.arange(n), 0))
+
+
+def board_index(bars, members, weight='equal', float_shares=None, rebalance=None, base=1000, field='close'):
+    '''
+    计算板块指数，返回时间×板块名称的指数点位（第一根K线为base）
+    bars:成份股K线，get_data/load_bars/adjusted_data返回的面板数据（日K线或分钟K线），
+         或时间×股票代码的价格宽表；建议使用复权价格
+    members:MemberIndex、{板块名称: [股票代码]}或板块成份长表，见member_matrix
+    weight:'equal'等权，'float_cap'流通市值加权
+    float_shares:流通股本，以股票代码为索引的Series，或时间×股票代码的宽表（按调仓时的值）；
+                 weight='float_cap'且未提供时用最新行情的流通市值/最新价估计（对历史为近似）
+    rebalance:调仓频率，None每根K线（等权时即成份股收益率的平均），
+              'd'、'w'、'm'、'q'、'y'或日期列表，见rebalance_points
+    停牌股票按最后价格计算，调仓时还没有价格（未上市）的股票不计入
+    '''
+    price = price_panel(bars, field).astype(float)
+    codes = list(price.columns)
+    names, m = member_matrix(members, codes)
+    # 停牌时沿用最后价格，上市前为nan
+    p = price.ffill().to_numpy().T
+    valid = ~np.isnan(p)
+    p = np.nan_to_num(p)
+    points = rebalance_points(price.index, rebalance)
+    if weight == 'equal':
+        unit = np.divide(1.0, p, out=np.zeros_like(p), where=valid & (p > 0))
+    elif weight == 'float_cap':
+        shares = float_shares if float_shares is not None else latest_float_shares()
+        if isinstance(shares, pd.DataFrame):
+            shares = shares.reindex(index=price.index, columns=codes).ffill().to_numpy().T
+        else:
+            shares = pd.Series(shares).reindex(codes).to_numpy(dtype=float)[:, None]
+        unit = np.where(valid, np.nan_to_num(shares) * np.ones_like(p), 0.0)
+    else:
+        raise ValueError("weight只能是'equal'或'float_cap'")
+    # 第t根K线的持仓股数：在调仓点确定，调仓点收盘时已经上市的股票
+    hold = unit[:, points] * valid[:, points]
+    # 第t根K线的收益 = 持仓(t-1)按t的价格计值 / 持仓(t-1)按t-1的价格计值
+    num = m @ (hold[:, :-1] * p[:, 1:])
+    den = m @ (hold[:, :-1] * p[:, :-1])
+    num, den = np.asarray(num), np.asarray(den)
+    ret = np.divide(num, den, out=np.ones_like(num), where=den > 0)
+    level = base * np.cumprod(np.c_[np.ones(len(names)), ret], axis=1)
+    # 第一次持有成份股之前为nan，之后的第一根K线为base
+    started = np.maximum.accumulate(np.asarray(m @ hold) > 0, axis=1)
+    level = np.where(started, level, np.nan)
+    return pd.DataFrame(level.T, index=price.index, columns=names)
+
+
+def latest_float_shares(market='沪深京A'):
+    '''最新流通股本（流通市值/最新价），以股票代码为索引'''
+    from qstock.data.trade import realtime_data
+    df = realtime_data(market)
+    shares = pd.to_numeric(df['流通市值'], errors='coerce') / pd.to_numeric(df['最新'], errors='coerce')
+    return pd.Series(shares.to_numpy(), index=df['代码'].astype(str)).dropna()
+
+
+def board_index_data(boards=None, source='em', start='20200101', end=None, weight='equal', rebalance=None,
+                     base=1000):
+    '''
+    用本地成份关系索引和本地复权日K线计算板块指数
+    boards:板块名称或代码列表，默认全部板块；source:'em'或'ths'，见member_index
+    成份股前复权日K线用adjusted_data获取（本地缓存，只下载新增部分）
+    '''
+    from qstock.data.member_index import member_index
+    from qstock.data.adjust import adjusted_data
+    members = member_index(source).boards_stocks(boards)
+    bars = adjusted_data(list(pd.unique(members['代码'])), start=start, end=end, fqt=1)
+    return board_index(bars, members, weight=weight, rebalance=rebalance, base=base)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+涨停、跌停、炸板股池的历史数据与连板统计
+
+limit_pool每次只获取一天，limit_history按交易日历并发获取一段时间的股池，
+每天保存为数据目录下的limit/{u,d,z}/YYYYMMDD.pkl，已收盘的交易日只获取一次
+（东方财富只提供近期的股池，本地存储可以保留更长的历史）。
+在此基础上对整个时间段向量化计算：每日涨停/跌停/炸板数、炸板率和回封率、
+各连板高度的晋级率、按连板高度分组的次日收益、涨停股的行业集中度。
+    zt = qs.limit_history('20230101', kind='u')
+    qs.limit_stats('20230101')
+    qs.board_promotion(zt)
+    qs.board_next_returns(zt, qs.get_data(list(zt['代码'].unique()), start='20230101'))
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from qstock.data.util import data_dir
+from qstock.data.trade_calendar import latest_trade_date, latest_closed_trade_date, trade_days_between
+from qstock.stock.ths_em_pool import stock_zt_pool, stock_dt_pool, stock_zb_pool
+
+# 股池类型：'u'涨停，'d'跌停，'z'炸板
+limit_fetchers = {'u': stock_zt_pool, 'd': stock_dt_pool, 'z': stock_zb_pool}
+limit_kinds = {'u': 'u', 'up': 'u', '涨停': 'u', 'd': 'd', 'down': 'd', '跌停': 'd',
+               'z': 'z', 'zb': 'z', '炸板': 'z'}
+# 最近几个交易日返回空股池（限流或当天尚未公布）时不保存，下次重新获取
+limit_retry_days = 5
+
+
+def limit_kind(kind):
+    if kind not in limit_kinds:
+        raise ValueError(f'kind只能是{list(limit_kinds)}之一')
+    return limit_kinds[kind]
+
+
+def limit_path(kind, date):
+    return data_dir('limit', kind) / f'{pd.Timestamp(date):%Y%m%d}.pkl'
+
+
+def load_limit_day(kind, date):
+    '''读取本地保存的一天股池，没有时返回None'''
+    path = limit_path(kind, date)
+    return pd.read_pickle(path) if path.exists() else None
+
+
+def update_limit_day(kind, date):
+    '''
+    获取并保存一天的股池（已收盘且已保存的交易日不重新获取），返回股票数
+    最近limit_retry_days个交易日的空结果不保存
+    '''
+    date = pd.Timestamp(date)
+    if limit_path(kind, date).exists() and date <= pd.Timestamp(latest_closed_trade_date()):
+        return len(load_limit_day(kind, date))
+    df = limit_fetchers[kind](f'{date:%Y%m%d}')
+    if df.empty and len(trade_days_between(date, latest_trade_date())) <= limit_retry_days:
+        return 0
+    df.insert(0, '日期', date)
+    df.to_pickle(limit_path(kind, date))
+    return len(df)
+
+
+def update_limit(start, end=None, kinds='udz', max_workers=8):
+    '''
+    并发获取start到end（默认最新交易日）之间每个交易日的股池并保存到本地
+    kinds:股池类型，'u'涨停，'d'跌停，'z'炸板，如'ud'
+    返回{(类型, 日期): 股票数}，获取失败的为None
+    '''
+    dates = trade_days_between(start, end or latest_trade_date())
+    tasks = [(limit_kind(k), d) for k in kinds for d in dates]
+
+    def run(task):
+        try:
+            return update_limit_day(*task)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = list(tqdm(executor.map(run, tasks), total=len(tasks), leave=False))
+    return {(k, f'{d:%Y-%m-%d}'): n for (k, d), n in zip(tasks, counts)}
+
+
+def limit_history(start, end=None, kind='u', update=True, max_workers=8):
+    '''
+    一段时间的涨停（跌停、炸板）股池，返回各交易日股池合并的长表，第一列为日期
+    kind:'u'涨停，'d'跌停，'z'炸板；update:是否先获取本地没有的交易日
+    '''
+    kind = limit_kind(kind)
+    end = end or latest_trade_date()
+    if update:
+        update_limit(start, end, kind, max_workers)
+    frames = [load_limit_day(kind, d) for d in trade_days_between(start, end)]
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df['代码'] = df['代码'].astype(str)
+    return df
+
+
+def limit_panel(hist, col='连板数'):
+    '''股池长表转换为日期×股票代码的宽表，不在股池中为nan'''
+    return hist.pivot_table(index='日期', columns='代码', values=col, aggfunc='last').sort_index()
+
+
+def board_promotion(zt, max_height=7):
+    '''
+    各连板高度的晋级率：zt为涨停股池历史（limit_history(kind='u')），
+    统计每个交易日n连板的股票下一交易日成为n+1连板的比例，max_height及以上合并为一组
+    返回以连板高度为索引的DataFrame：样本数、晋级数、晋级率%
+    '''
+    heights = limit_panel(zt).fillna(0).to_numpy(dtype=int)
+    prev, nxt = heights[:-1], heights[1:]
+    mask = prev > 0
+    h = np.minimum(prev[mask], max_height)
+    promoted = nxt[mask] > prev[mask]
+    total = np.bincount(h, minlength=max_height + 1)[1:]
+    up = np.bincount(h, promoted, minlength=max_height + 1)[1:]
+    index = [f'{i}板' for i in range(1, max_height)] + [f'{max_height}板及以上']
+    df = pd.DataFrame({'样本数': total, '晋级数': up.astype(int)}, index=pd.Index(index, name='连板高度'))
+    df['晋级率%'] = (df['晋级数'] / df['样本数'].replace(0, np.nan) * 100).round(2)
+    return df
+
+
+def board_next_returns(zt, bars, max_height=7):
+    '''
+    按连板高度分组的次日收益：zt为涨停股池历史，bars为相关股票的K线面板数据（get_data的结果）
+    次日开盘收益=次日开盘价/当日收盘价-1，次日收益=次日收盘价/当日收盘价-1（%）
+    返回以连板高度为索引的DataFrame：样本数、次日开盘收益和次日收益的均值、中位数、上涨比例
+    '''
+    from qstock.stock.board_index import price_panel
+    close = price_panel(bars, 'close')
+    fields = {'次日收益': close.shift(-1)}
+    if 'open' in bars.columns:
+        fields = {'次日开盘收益': price_panel(bars, 'open').reindex_like(close).shift(-1), **fields}
+    rows = close.index.get_indexer(pd.DatetimeIndex(zt['日期']))
+    cols = close.columns.get_indexer(zt['代码'].astype(str))
+    valid = (rows >= 0) & (cols >= 0)
+    rows, cols = rows[valid], cols[valid]
+    base = close.to_numpy(dtype=float)[rows, cols]
+    h = np.minimum(zt['连板数'].to_numpy(dtype=int)[valid], max_height)
+    index = [f'{i}板' for i in range(1, max_height)] + [f'{max_height}板及以上']
+    labels = pd.Categorical.from_codes(h - 1, index)
+    out = {}
+    for name, frame in fields.items():
+        ret = pd.Series((frame.to_numpy(dtype=float)[rows, cols] / base - 1) * 100)
+        grouped = ret.groupby(labels, observed=False)
+        out[name + '均值%'] = grouped.mean()
+        out[name + '中位数%'] = grouped.median()
+        out[name + '上涨比例%'] = (ret > 0).where(ret.notna()).groupby(labels, observed=False).mean() * 100
+    df = pd.DataFrame(out)
+    df.insert(0, '样本数', pd.Series(1, index=labels).groupby(labels, observed=False).sum())
+    df.index.name = '连板高度'
+    return df.round(2)
+
+
+def sector_concentration(zt, col='所属行业'):
+    '''
+    涨停股的行业集中度：返回(日期×行业的涨停数, 每日指标)，
+    每日指标为涨停数、行业数、第一行业及其占比%、赫芬达尔指数（各行业占比平方和，1为全部集中在一个行业）
+    '''
+    counts = pd.crosstab(zt['日期'], zt[col].fillna('其他'))
+    values = counts.to_numpy(dtype=float)
+    total = values.sum(axis=1)
+    share = values / np.where(total > 0, total, 1)[:, None]
+    top = share.argmax(axis=1)
+    daily = pd.DataFrame({
+        '涨停数': total.astype(int),
+        '行业数': (values > 0).sum(axis=1),
+        '第一行业': counts.columns[top],
+        '第一行业占比%': share.max(axis=1) * 100,
+        '赫芬达尔指数': (share ** 2).sum(axis=1),
+    }, index=counts.index)
+    return counts, daily.round(4)
+
+
+def limit_stats(start, end=None, update=True, max_workers=8):
+    '''
+    一段时间每个交易日的涨跌停统计，返回以日期为索引的DataFrame：
+    涨停数、跌停数、炸板数、炸板率%（炸板/(涨停+炸板)）、回封率%（盘中炸板后收盘封住的比例）、
+    连板数（2板及以上）、最高板、晋级率%（前一日涨停股今日连板的比例）
+    '''
+    end = end or latest_trade_date()
+    if update:
+        update_limit(start, end, 'udz', max_workers)
+    hist = {k: limit_history(start, end, k, update=False) for k in 'udz'}
+    dates = trade_days_between(start, end)
+
+    def daily_count(df, mask=None):
+        if df.empty:
+            return pd.Series(0, index=dates)
+        days = df['日期'] if mask is None else df.loc[mask, '日期']
+        return days.value_counts().reindex(dates, fill_value=0)
+
+    zt, dt, zb = hist['u'], hist['d'], hist['z']
+    stats = pd.DataFrame(index=dates)
+    stats['涨停数'] = daily_count(zt)
+    stats['跌停数'] = daily_count(dt)
+    stats['炸板数'] = daily_count(zb)
+    touched = stats['涨停数'] + stats['炸板数']
+    stats['炸板率%'] = stats['炸板数'] / touched.replace(0, np.nan) * 100
+    if not zt.empty:
+        resealed = daily_count(zt, zt['炸板次数'] > 0)
+        stats['回封率%'] = resealed / (resealed + stats['炸板数']).replace(0, np.nan) * 100
+        stats['连板数'] = daily_count(zt, zt['连板数'] >= 2)
+        stats['最高板'] = zt.groupby('日期')['连板数'].max().reindex(dates).fillna(0).astype(int)
+        stats['晋级率%'] = stats['连板数'] / stats['涨停数'].shift(1).replace(0, np.nan) * 100
+    return stats.round(2)
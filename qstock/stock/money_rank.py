@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+全市场资金流向的截面分析
+
+输入为时间×股票代码的资金流向矩阵（money_panel的结果），一次向量化计算全部股票的
+多周期累计净流入、净流入占成交额比例、截面排名和行业（板块）汇总，
+不再逐只股票调用stock_money。latest=True时只计算最后一个交易日（只用最后max(windows)行），
+数据载入内存后全市场排名在毫秒级完成。
+rolling_flow也适用于north_money等其他时间序列（列为不同的资金）。
+"""
+import numpy as np
+import pandas as pd
+
+from qstock.stock.board_index import member_matrix
+
+
+def window_sums(values, windows, latest=False):
+    '''
+    values:时间×股票的numpy数组，返回{w: w期累计值}，缺失值按0累加，
+    窗口内全部缺失或历史不足w期时为nan；latest=True时每个结果只有最后一行
+    '''
+    n = values.shape[0]
+    if latest:
+        values = values[-max(windows):]
+    filled = np.nan_to_num(values)
+    valid = ~np.isnan(values)
+    csum = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(filled, axis=0)])
+    ccount = np.vstack([np.zeros((1, values.shape[1]), dtype=int), np.cumsum(valid, axis=0)])
+    m = values.shape[0]
+    result = {}
+    for w in windows:
+        if latest:
+            if w > n:
+                result[w] = np.full((1, values.shape[1]), np.nan)
+                continue
+            s = csum[m:] - csum[m - w:m - w + 1]
+            c = ccount[m:] - ccount[m - w:m - w + 1]
+        else:
+            s = np.full(values.shape, np.nan)
+            c = np.zeros(values.shape, dtype=int)
+            s[w - 1:] = csum[w:] - csum[:-w]
+            c[w - 1:] = ccount[w:] - ccount[:-w]
+        result[w] = np.where(c > 0, s, np.nan)
+    return result
+
+
+def rolling_flow(flow, windows=(1, 3, 5, 10, 20), latest=False):
+    '''
+    多周期累计净流入：flow为时间×股票（或其他序列）的DataFrame，返回{w: 同样形状的DataFrame}
+    latest=True时每个结果只有最后一个交易日
+    '''
+    if isinstance(windows, int):
+        windows = [windows]
+    index = flow.index[-1:] if latest else flow.index
+    sums = window_sums(flow.to_numpy(dtype=float), windows, latest)
+    return {w: pd.DataFrame(s, index=index, columns=flow.columns) for w, s in sums.items()}
+
+
+def turnover_panel(panel):
+    '''
+    由money_panel的'主力净流入'和'主力净流入占比'（%）推算成交额矩阵
+    主力净流入为0时无法推算，为nan
+    '''
+    flow = panel['主力净流入']
+    ratio = panel['主力净流入占比'].reindex_like(flow)
+    turnover = flow / ratio * 100
+    return turnover.where(np.isfinite(turnover) & (turnover > 0))
+
+
+def cross_rank(df, ascending=False, pct=False):
+    '''截面排名：每个交易日在全部股票中的名次（1为最大），pct=True时为百分位'''
+    return df.rank(axis=1, ascending=ascending, pct=pct)
+
+
+def industry_flow(flow, members):
+    '''
+    板块资金流向：flow为时间×股票的资金流向，members为MemberIndex、{板块名称: [股票代码]}
+    或板块成份长表，返回时间×板块的成份股合计（稀疏矩阵乘法，一次计算全部板块）
+    '''
+    names, m = member_matrix(members, list(flow.columns))
+    values = np.nan_to_num(flow.to_numpy(dtype=float)).T
+    return pd.DataFrame(np.asarray(m @ values).T, index=flow.index, columns=names)
+
+
+def money_rank(panel=None, windows=(1, 3, 5, 10, 20), col='主力净流入', turnover=None, members=None,
+               latest=True, unit=10000):
+    '''
+    全市场资金流向排名
+    panel:money_panel的结果（{列名: 时间×股票}），默认读取本地保存的全部股票
+    windows:累计周期；col:排名的资金列，默认主力净流入
+    turnover:时间×股票的成交额，用于计算净流入占成交额的比例，默认由panel中的
+             '主力净流入占比'推算（panel中没有该列时不计算）
+    members:提供时同时计算板块汇总（见industry_flow）
+    latest:True只计算最后一个交易日，返回以股票代码为索引的DataFrame：
+           'n日净流入'（万元）、'n日净流入占比'（%）、'n日排名'；
+           False返回{'n日净流入': 时间×股票, ...}的完整时间序列
+    members不为None时返回(个股结果, 板块结果)
+    '''
+    if panel is None:
+        from qstock.data.money_store import money_panel
+        panel = money_panel(columns=[col, '主力净流入占比'] if col == '主力净流入' else [col])
+    flow = panel[col]
+    if turnover is None and col == '主力净流入' and '主力净流入占比' in panel:
+        turnover = turnover_panel(panel)
+    if isinstance(windows, int):
+        windows = [windows]
+    sums = rolling_flow(flow, windows, latest)
+    amounts = rolling_flow(turnover.reindex_like(flow), windows, latest) if turnover is not None else None
+    result = {}
+    for w in windows:
+        result[f'{w}日净流入'] = sums[w] / unit
+        if amounts is not None:
+            result[f'{w}日净流入占比'] = sums[w] / amounts[w] * 100
+        result[f'{w}日排名'] = cross_rank(sums[w])
+    if latest:
+        result = pd.DataFrame({k: v.iloc[-1] for k, v in result.items()})
+        result = result.sort_values(f'{windows[0]}日排名')
+        result.index.name = '代码'
+    if members is None:
+        return result
+    board = industry_flow(flow.iloc[-max(windows):] if latest else flow, members)
+    board_sums = rolling_flow(board, windows, latest)
+    board_result = {f'{w}日净流入': board_sums[w] / unit for w in windows}
+    if latest:
+        board_result = pd.DataFrame({k: v.iloc[-1] for k, v in board_result.items()})
+        board_result = board_result.sort_values(f'{windows[0]}日净流入', ascending=False)
+        board_result.index.name = '板块'
+    return result, board_result
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+本地表达式选股，作为问财（wencai）的离线替代
+
+把全市场最新行情（market_realtime）、财务指标（company_indicator）和由K线本地计算的
+技术因子合并为一张以股票代码为索引的列式表，用表达式筛选，如：
+    qs.screen('PE<20 & ROE>15 & close>ma20 & turnover_rate>3')
+表达式先解析为语法树（只允许列名、数字、字符串、比较、算术、& | ~和少量函数），
+编译后在整列numpy数组上向量化计算，安装了numexpr时用numexpr计算；
+数据表只构建一次（需要访问网络），之后每次筛选都在本地毫秒级完成，返回全部符合条件的股票。
+列名可以用中文原名（如市盈率、净资产收益率）或英文别名（见column_alias），
+and/or/not和连写比较（如10<PE<20）会自动转换。
+"""
+import ast
+import io
+import tokenize
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# 英文别名 -> 数据表列名
+column_alias = {
+    'code': '代码', 'name': '名称',
+    'close': '最新', 'price': '最新', 'pct_chg': '涨幅', 'high': '最高', 'low': '最低', 'open': '今开',
+    'pre_close': '昨收', 'volume': '成交量', 'amount': '成交额', 'turnover_rate': '换手率',
+    'volume_ratio': '量比', 'PE': '市盈率', 'pe': '市盈率', 'mcap': '总市值', 'float_mcap': '流通市值',
+    'revenue': '营收', 'revenue_yoy': '营收同比', 'revenue_qoq': '营收环比',
+    'profit': '净利润', 'profit_yoy': '净利润同比', 'profit_qoq': '净利润环比',
+    'EPS': '每股收益', 'eps': '每股收益', 'BPS': '每股净资产', 'bps': '每股净资产',
+    'ROE': '净资产收益率', 'roe': '净资产收益率', 'gross_margin': '销售毛利率',
+    'ocfps': '每股经营现金流',
+}
+
+# 表达式中可以使用的函数：名称 -> (numpy函数, numexpr中的名称)
+screen_funcs = {
+    'abs': (np.abs, 'abs'),
+    'log': (np.log, 'log'),
+    'sqrt': (np.sqrt, 'sqrt'),
+    'exp': (np.exp, 'exp'),
+    'where': (np.where, 'where'),
+}
+
+
+def tech_factors(bars, date=None):
+    '''
+    由K线面板数据（get_data/load_bars/adjusted_data的结果）计算截至date（默认最后一天）的技术因子，
+    返回以股票代码为索引的DataFrame：ma5、ma10、ma20、ma60、ma120、ma250，
+    ret5、ret20、ret60（%），vol_ma5（5日均量）、vol_ratio5（当日成交量/5日均量），
+    high20、high250、low20、low250（不含当日的最高、最低收盘价）
+    '''
+    from qstock.stock.board_index import price_panel
+    close = price_panel(bars, 'close')
+    volume = price_panel(bars, 'volume')
+    if date is not None:
+        close, volume = close.loc[:pd.Timestamp(date)], volume.loc[:pd.Timestamp(date)]
+    close = close.iloc[-251:]
+    volume = volume.iloc[-6:]
+    c = close.to_numpy(dtype=float)
+    last = c[-1]
+    out = {}
+    for n in (5, 10, 20, 60, 120, 250):
+        out[f'ma{n}'] = c[-n:].mean(axis=0) if len(c) >= n else np.full(c.shape[1], np.nan)
+    for n in (5, 20, 60):
+        out[f'ret{n}'] = (last / c[-n - 1] - 1) * 100 if len(c) > n else np.full(c.shape[1], np.nan)
+    v = volume.reindex(columns=close.columns).to_numpy(dtype=float)
+    out['vol_ma5'] = v[-6:-1].mean(axis=0) if len(v) >= 6 else np.full(c.shape[1], np.nan)
+    out['vol_ratio5'] = v[-1] / out['vol_ma5']
+    for n in (20, 250):
+        window = c[-n - 1:-1]
+        out[f'high{n}'] = np.nanmax(window, axis=0) if len(window) else np.full(c.shape[1], np.nan)
+        out[f'low{n}'] = np.nanmin(window, axis=0) if len(window) else np.full(c.shape[1], np.nan)
+    return pd.DataFrame(out, index=pd.Index(close.columns.astype(str), name='代码'))
+
+
+def screen_table(market='沪深A', fundamentals=True, bars=None, extra=None):
+    '''
+    构建选股数据表（以股票代码为索引）：
+    market_realtime(market)的最新行情 + company_indicator()最新一期财务指标（fundamentals=True时）
+    + tech_factors(bars)技术因子（提供bars时）+ extra（以代码为索引的DataFrame，自定义因子）
+    '''
+    from qstock.data.trade import market_realtime, company_indicator
+    table = market_realtime(market)
+    table['代码'] = table['代码'].astype(str)
+    table = table.set_index('代码')
+    parts = [table]
+    if fundamentals:
+        fin = company_indicator()
+        fin['代码'] = fin['代码'].astype(str)
+        fin = fin.drop_duplicates('代码').set_index('代码').drop(columns=['简称'], errors='ignore')
+        parts.append(fin)
+    if bars is not None:
+        parts.append(tech_factors(bars))
+    if extra is not None:
+        parts.append(extra)
+    table = parts[0]
+    for part in parts[1:]:
+        part = part[part.columns.difference(table.columns)]
+        table = table.join(part, how='left')
+    return table
+
+
+class ExprCompiler(ast.NodeTransformer):
+    '''把选股表达式的语法树转换为可向量化计算的形式，列名替换为c0、c1……'''
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.used = {}
+
+    def visit_Name(self, node):
+        name = column_alias.get(node.id, node.id)
+        if name not in self.columns and node.id in screen_funcs:
+            return node
+        if name not in self.columns:
+            raise KeyError(f'数据表中没有列：{node.id}')
+        var = self.used.setdefault(name, f'c{len(self.used)}')
+        return ast.copy_location(ast.Name(id=var, ctx=ast.Load()), node)
+
+    def visit_BoolOp(self, node):
+        # and/or -> & |
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return ast.copy_location(result, node)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.copy_location(ast.UnaryOp(op=ast.Invert(), operand=node.operand), node)
+        return node
+
+    def visit_Compare(self, node):
+        # 10<PE<20 -> (10<PE)&(PE<20)
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        left, parts = node.left, []
+        for op, right in zip(node.ops, node.comparators):
+            parts.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        result = parts[0]
+        for part in parts[1:]:
+            result = ast.BinOp(left=result, op=ast.BitAnd(), right=part)
+        return ast.copy_location(result, node)
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in screen_funcs or node.keywords:
+            raise ValueError(f'表达式中只能使用函数：{list(screen_funcs)}')
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    allowed = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Constant, ast.Load,
+               ast.operator, ast.unaryop, ast.cmpop, ast.boolop, ast.BoolOp, ast.Name, ast.Call)
+
+    def check(self, tree):
+        for node in ast.walk(tree):
+            if not isinstance(node, self.allowed):
+                raise ValueError(f'表达式中不支持：{type(node).__name__}')
+
+
+def replace_bool_ops(expr):
+    '''
+    把&、|、~替换为and、or、not：Python中&的优先级高于比较，
+    PE<20 & ROE>15会被解析为PE<(20&ROE)>15，替换后比较先于逻辑运算
+    '''
+    words = {'&': 'and', '|': 'or', '~': 'not'}
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(expr.replace('\n', ' ')).readline):
+        if tok.type == tokenize.OP and tok.string in words:
+            tokens.append((tokenize.NAME, words[tok.string]))
+        else:
+            tokens.append((tok.type, tok.string))
+    return tokenize.untokenize(tokens).strip()
+
+
+@lru_cache(maxsize=1024)
+def compile_expr(expr, columns):
+    '''
+    编译选股表达式，返回(Python代码对象, numexpr表达式, {列名: 变量名})
+    columns为数据表列名的tuple，结果按(表达式, 列名)缓存
+    '''
+    tree = ast.parse(replace_bool_ops(expr), mode='eval')
+    compiler = ExprCompiler(set(columns))
+    compiler.check(tree)
+    tree = ast.fix_missing_locations(compiler.visit(tree))
+    source = ast.unparse(tree)
+    return compile(tree, '<screen>', 'eval'), source, dict(compiler.used)
+
+
+class Screener:
+    '''
+    本地选股器：table为screen_table()的结果（或任意以股票代码为索引的DataFrame），
+    各列转换为numpy数组后反复筛选
+    '''
+
+    def __init__(self, table=None, **kwargs):
+        self.table = screen_table(**kwargs) if table is None else table
+        self.columns = tuple(self.table.columns)
+        self.arrays = {}
+        for col in self.columns:
+            values = self.table[col].to_numpy()
+            if values.dtype == object:
+                numeric = pd.to_numeric(self.table[col], errors='coerce')
+                if numeric.notna().sum() == self.table[col].notna().sum():
+                    values = numeric.to_numpy(dtype=float)
+            self.arrays[col] = np.ascontiguousarray(values)
+
+    def mask(self, expr):
+        '''表达式对应的布尔数组'''
+        code, source, used = compile_expr(expr, self.columns)
+        env = {var: self.arrays[col] for col, var in used.items()}
+        numeric = all(v.dtype.kind in 'biuf' for v in env.values())
+        ne = numexpr_module() if numeric else None
+        if ne is not None:
+            try:
+                result = ne.evaluate(source, local_dict=env)
+            except Exception:
+                ne = None
+        if ne is None:
+            env.update({name: func for name, (func, _) in screen_funcs.items()})
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = eval(code, {'__builtins__': {}}, env)
+        result = np.asarray(result)
+        if result.dtype != bool:
+            raise ValueError('选股表达式的结果必须是条件（比较）')
+        if result.ndim == 0:
+            result = np.full(len(self.table), bool(result))
+        return result
+
+    def screen(self, expr, columns=None, sort=None, ascending=False):
+        '''
+        返回满足表达式的全部股票
+        columns:返回的列，默认全部；sort:排序的列名（可以用别名）
+        '''
+        df = self.table[self.mask(expr)]
+        if sort is not None:
+            df = df.sort_values(column_alias.get(sort, sort), ascending=ascending)
+        if columns is not None:
+            df = df[[column_alias.get(c, c) for c in columns]]
+        return df
+
+
+@lru_cache()
+def numexpr_module():
+    try:
+        import numexpr
+        return numexpr
+    except ImportError:
+        return None
+
+
+screen_cache = {}
+
+
+def screen(expr, columns=None, sort=None, ascending=False, table=None, refresh=False):
+    '''
+    本地表达式选股，如screen('PE<20 & ROE>15 & turnover_rate>3')
+    第一次调用时构建数据表（最新行情+财务指标），之后复用；refresh=True时重新获取
+    table:自定义数据表（如screen_table(bars=bars)加入技术因子），提供时不使用缓存的数据表
+    '''
+    if table is not None:
+        return Screener(table).screen(expr, columns, sort, ascending)
+    if refresh or 'default' not in screen_cache:
+        screen_cache['default'] = Screener()
+    return screen_cache['default'].screen(expr, columns, sort, ascending)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+本地计算的技术形态股票池，与ths_pool的形态一致，不再逐页抓取同花顺网页
+
+由K线面板数据（get_data/load_bars/adjusted_data的结果，建议前复权）一次向量化计算全部股票：
+创n日新高/新低（滚动最高、最低价）、向上/向下突破n日均线、连续上涨/下跌、
+持续放量/缩量、量价齐升/齐跌（游程长度）。
+ta_signals返回时间×股票的布尔矩阵，可以直接用于回测；ta_pool返回任意历史日期的股票池。
+    bars = qs.adjusted_data(code_list, start='20200101')
+    qs.ta_pool(bars, '一年新高', date='2023-05-05')
+    qs.ta_pool(bars, 'u20')
+"""
+import numpy as np
+import pandas as pd
+
+# 创新高/新低的回看交易日数，None为上市以来
+high_low_days = {'历史': None, '一年': 250, '半年': 120, '创月': 20}
+# 形态别名，与ths_pool一致
+ta_alias = {'lxsz': '连续上涨', 'lxxd': '连续下跌', 'cxfl': '持续放量', 'cxsl': '持续缩量',
+            'ljqs': '量价齐升', 'ljqd': '量价齐跌'}
+
+
+def streak(cond):
+    '''
+    游程长度：cond为时间×股票的布尔数组，返回截至每个时间连续为True的次数（False处为0）
+    '''
+    cond = np.asarray(cond, dtype=bool)
+    count = np.cumsum(cond, axis=0)
+    reset = np.where(cond, 0, count)
+    return count - np.maximum.accumulate(reset, axis=0)
+
+
+def bar_panels(bars):
+    '''把面板数据转换为收盘价、成交量宽表（时间×股票代码）'''
+    from qstock.stock.board_index import price_panel
+    close = price_panel(bars, 'close')
+    volume = price_panel(bars, 'volume').reindex_like(close)
+    return close, volume
+
+
+def prior_extreme(close, n=None, high=True):
+    '''不含当日的前n个交易日（n=None为上市以来）的最高（最低）收盘价'''
+    prev = close.shift(1)
+    if n is None:
+        roll = prev.expanding(min_periods=1)
+    else:
+        roll = prev.rolling(n, min_periods=n)
+    return roll.max() if high else roll.min()
+
+
+def parse_ta(ta):
+    '''把形态名称解析为(类型, 参数)'''
+    ta = ta_alias.get(ta, ta)
+    if ta in ('连续上涨', '连续下跌', '持续放量', '持续缩量', '量价齐升', '量价齐跌'):
+        return ta, None
+    for word in ('新高', '新低'):
+        if ta.endswith(word) and ta[:-2] in high_low_days:
+            return word, high_low_days[ta[:-2]]
+    if ta[:1] in ('u', 'd') and ta[1:].isdigit():
+        return ('上穿均线' if ta[0] == 'u' else '下穿均线'), int(ta[1:])
+    raise ValueError(f'不支持的形态：{ta}，可选：{list(ta_alias.values())}、'
+                     f'{[k + "新高" for k in high_low_days]}、u20、d20等')
+
+
+def ta_frames(bars, ta, min_days=3):
+    '''
+    计算形态的信号矩阵和股票池的附加列，返回(信号, {列名: 时间×股票的DataFrame})
+    '''
+    close, volume = bar_panels(bars)
+    kind, n = parse_ta(ta)
+    c = close.to_numpy(dtype=float)
+    prev = np.vstack([np.full((1, c.shape[1]), np.nan), c[:-1]])
+    like = lambda a: pd.DataFrame(a, index=close.index, columns=close.columns)
+    extra = {'最新价': close, '涨跌幅': like((c / prev - 1) * 100)}
+    if kind in ('新高', '新低'):
+        point = prior_extreme(close, n, kind == '新高')
+        signal = close > point if kind == '新高' else close < point
+        extra['前期点位'] = point
+    elif kind in ('上穿均线', '下穿均线'):
+        ma = close.rolling(n, min_periods=n).mean()
+        above = close > ma
+        crossed = above & ~above.shift(1, fill_value=True) if kind == '上穿均线' \
+            else ~above & above.shift(1, fill_value=False)
+        signal = crossed & ma.notna() & ma.shift(1).notna()
+        extra[f'{n}日均线'] = ma
+    else:
+        v = volume.to_numpy(dtype=float)
+        prev_v = np.vstack([np.full((1, v.shape[1]), np.nan), v[:-1]])
+        with np.errstate(invalid='ignore'):
+            price_up, price_down = c > prev, c < prev
+            vol_up, vol_down = v > prev_v, v < prev_v
+        cond = {'连续上涨': price_up, '连续下跌': price_down, '持续放量': vol_up, '持续缩量': vol_down,
+                '量价齐升': price_up & vol_up, '量价齐跌': price_down & vol_down}[kind]
+        days = streak(cond)
+        signal = like(days >= min_days)
+        # 游程开始前一天的收盘价
+        t = np.arange(len(c))[:, None]
+        base = np.take_along_axis(c, np.maximum(t - days, 0), axis=0)
+        extra['天数'] = like(days)
+        extra['阶段涨跌幅'] = like((c / base - 1) * 100)
+        if kind in ('持续放量', '持续缩量'):
+            extra['成交量'] = volume
+    return signal.fillna(False).astype(bool), extra
+
+
+def ta_signals(bars, ta, min_days=3):
+    '''
+    形态信号矩阵：时间×股票代码的布尔DataFrame，True表示当日符合形态
+    ta:'创月新高'、'半年新高'、'一年新高'、'历史新高'（新低同理），
+       'u20'/'d20'（向上/向下突破n日均线，n可为5、10、20、30、60、90、250、500），
+       '连续上涨'、'连续下跌'、'持续放量'、'持续缩量'、'量价齐升'、'量价齐跌'（或ths_pool的拼音缩写）
+    min_days:连续形态至少持续的天数
+    '''
+    return ta_frames(bars, ta, min_days)[0]
+
+
+def ta_pool(bars, ta, date=None, min_days=3):
+    '''
+    本地计算的技术形态股票池（date日，默认最后一个交易日），参数见ta_signals
+    返回代码、最新价、涨跌幅和形态相关的列（前期点位、n日均线、天数、阶段涨跌幅等）
+    '''
+    signal, extra = ta_frames(bars, ta, min_days)
+    if date is not None:
+        signal = signal.loc[:pd.Timestamp(date)]
+    if signal.empty:
+        return pd.DataFrame(columns=['代码'] + list(extra))
+    day = signal.index[-1]
+    row = signal.loc[day]
+    codes = row.index[row.to_numpy()]
+    df = pd.DataFrame({name: frame.loc[day, codes] for name, frame in extra.items()})
+    df.index.name = '代码'
+    if '天数' in df.columns:
+        df = df.sort_values(['天数', '阶段涨跌幅'], ascending=False)
+    else:
+        df = df.sort_values('涨跌幅', ascending=False)
+    df = df.reset_index()
+    df.insert(0, '日期', day)
+    return df
@@ -62,7 +62,7 @@ def ths_pool(ta=None):
 #获取东方财富网涨停（跌停）板股票池
 def limit_pool(flag='u',date=None):
     '''date：日期如'20220916'
-    flag='u'代表涨停板，'d'代表跌停，'s'代表强势股
+    flag='u'代表涨停板，'d'代表跌停，'z'代表炸板，'s'代表强势股
     默认为最新交易日'''
     if date is None:
         date=latest_trade_date()
@@ -70,6 +70,8 @@ def limit_pool(flag='u',date=None):
         return stock_zt_pool(date)
     elif flag=='d' or flag=='down' or flag=='跌停':
         return stock_dt_pool(date)
+    elif flag=='z' or flag=='zb' or flag=='炸板':
+        return stock_zb_pool(date)
     else:
         return stock_strong_pool(date)
 
@@ -165,6 +167,44 @@ def stock_dt_pool(date = None):
         '流通市值(百万)','总市值(百万)','封板资金(百万)']]/1000000)
     return df.round(3)
 
+#炸板股池
+
+def stock_zb_pool(date=None):
+    """
+    获取东方财富网炸板股池（当日曾经涨停、收盘未封住）
+    http://quote.eastmoney.com/ztb/detail#type=zbgc
+    date: 交易日
+    """
+    if date is None:
+        date=latest_trade_date()
+    url = 'http://push2ex.eastmoney.com/getTopicZBPool'
+    params = {
+        'ut': '7eea3edcaed734bea9cbfc24409ed989',
+        'dpt': 'wz.ztzt',
+        'Pageindex': '0',
+        'pagesize': '10000',
+        'sort': 'fbt:asc',
+        'date': date,
+        '_': '1621590489736',
+    }
+    res = requests.get(url, params=params)
+    data_json = res.json()
+    if data_json['data'] is None:
+        return pd.DataFrame()
+    temp_df = pd.DataFrame(data_json['data']['pool'])
+    fields = {'c':'代码','n':'名称','zdp':'涨跌幅','p':'最新价','ztp':'涨停价','hs':'换手率',
+        'zs':'涨速','zf':'振幅','fbt':'首次封板时间','zbc':'炸板次数','zttj':'涨停统计',
+        'hybk':'所属行业','amount':'成交额(百万)','ltsz':'流通市值(百万)','tshare':'总市值(百万)'}
+    df = temp_df.reindex(columns=list(fields)).rename(columns=fields)
+    df['涨停统计'] = df['涨停统计'].apply(lambda x: f"{x['days']}/{x['ct']}" if isinstance(x,dict) else None)
+    df[['最新价','涨停价']] = df[['最新价','涨停价']] / 1000
+    df['首次封板时间'] = df['首次封板时间'].apply(lambda s:str(s).zfill(6)[:2]+':'+str(s).zfill(6)[2:4])
+    ignore_cols = ['代码','名称','最新价','涨停价','首次封板时间','涨停统计','所属行业',]
+    df = trans_num(df, ignore_cols)
+    df[['成交额(百万)','流通市值(百万)','总市值(百万)']]=(df[['成交额(百万)',
+        '流通市值(百万)','总市值(百万)']]/1000000)
+    return df.round(3)
+
 def stock_strong_pool(date= None) :
     """
     获取东方财富网强势股池
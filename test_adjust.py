@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from qstock.data.adjust import adj_factor, adjust_bars, merge_events
+
+DATES = pd.bdate_range('2024-01-01', periods=6)
+
+
+def sample_bars():
+    '''两只股票交错排列的不复权日K线'''
+    a = pd.DataFrame({'code': 'A', 'close': [10, 10, 10, 9, 9.5, 9.2], 'volume': 100.0}, index=DATES)
+    b = pd.DataFrame({'code': 'B', 'close': [5, 5.1, 5.2, 5.3, 5.4, 5.5], 'volume': 200.0}, index=DATES)
+    a['open'] = a['close']
+    b['open'] = b['close']
+    return pd.concat([a, b]).sort_index(kind='stable')
+
+
+def sample_events():
+    return pd.DataFrame({
+        'code': ['A', 'A', 'A', 'B'],
+        # A：第4天每股派息1元，第6天10送10，另有一个还没到除权日的事件；B的事件在K线之前
+        'ex_date': [DATES[3], DATES[5], DATES[5] + pd.Timedelta(days=30), DATES[0] - pd.Timedelta(days=10)],
+        'cash': [1.0, 0.0, 0.5, 0.2],
+        'shares': [0.0, 1.0, 0.0, 0.0],
+    })
+
+
+def test_backward_factor():
+    bars = sample_bars()
+    factor = adj_factor(bars, sample_events())
+    a = factor[(bars['code'] == 'A').to_numpy()].to_numpy()
+    # 比例：(10 - 1) / 10 = 0.9，9.5 / 2 / 9.5 = 0.5
+    np.testing.assert_allclose(a, [1, 1, 1, 1 / 0.9, 1 / 0.9, 1 / 0.9 / 0.5])
+    np.testing.assert_allclose(factor[(bars['code'] == 'B').to_numpy()], 1)
+
+
+def test_adjust_bars():
+    bars = sample_bars()
+    events = sample_events()
+    assert adjust_bars(bars, 0, events) is bars
+    back = adjust_bars(bars, 2, events)
+    forward = adjust_bars(bars, 1, events)
+    a = (bars['code'] == 'A').to_numpy()
+    expected = np.array([10, 10, 10, 9, 9.5, 9.2]) * [0.45, 0.45, 0.45, 0.5, 0.5, 1]
+    np.testing.assert_allclose(forward.loc[a, 'close'], expected)
+    np.testing.assert_allclose(forward.loc[a, 'open'], forward.loc[a, 'close'])
+    # 前复权最后一根K线不变，后复权第一根K线不变
+    assert forward.loc[a, 'close'].iloc[-1] == 9.2
+    assert back.loc[a, 'close'].iloc[0] == 10
+    # 成交量不复权，B没有K线区间内的事件
+    pd.testing.assert_series_equal(back['volume'], bars['volume'])
+    pd.testing.assert_frame_equal(forward[~a], bars[~a].astype({'close': float, 'open': float}))
+
+
+def test_merge_events_same_day():
+    df = pd.DataFrame({'code': ['A', 'A', 'B'], 'ex_date': [DATES[1]] * 3,
+                       'cash': [0.5, 0.0, 0.1], 'shares': [0.0, 0.3, 0.0]})
+    merged = merge_events(df)
+    assert list(merged.columns) == ['code', 'ex_date', 'cash', 'shares']
+    assert merged.set_index('code').loc['A', ['cash', 'shares']].tolist() == [0.5, 0.3]
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from qstock.stock.board_index import board_index, price_panel, rebalance_points
+
+MEMBERS = {'甲': ['A', 'B'], '乙': ['A', 'B', 'C'], '空': ['X']}
+
+
+def sample_prices(seed=0):
+    rnd = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-01', '2024-03-29')
+    price = pd.DataFrame(10 * np.cumprod(1 + rnd.normal(0, 0.02, (len(dates), 3)), axis=0),
+                         index=pd.DatetimeIndex(dates, name='date'), columns=['A', 'B', 'C'])
+    # C在2月上市，B在1月中停牌几天
+    price.loc[:'2024-02-05', 'C'] = np.nan
+    price.loc['2024-01-15':'2024-01-19', 'B'] = np.nan
+    return price
+
+
+def reference(price, members, points, shares=None):
+    '''逐根K线循环的参照实现：持仓在调仓点按权重确定，之后股数不变'''
+    p = price.ffill()
+    level = [1000.0]
+    for t in range(1, len(p)):
+        r = points[t - 1]
+        held = p.iloc[r][members].dropna()
+        units = 1 / held if shares is None else shares[held.index]
+        now, before = p.iloc[t][held.index], p.iloc[t - 1][held.index]
+        level.append(level[-1] * (units * now).sum() / (units * before).sum())
+    return np.array(level)
+
+
+def test_rebalance_points():
+    index = pd.to_datetime(['2024-01-30', '2024-01-31', '2024-02-01', '2024-02-29', '2024-03-01'])
+    assert list(rebalance_points(index)) == [0, 1, 2, 3, 4]
+    assert list(rebalance_points(index, 'm')) == [0, 1, 1, 3, 4]
+    assert list(rebalance_points(index, ['2024-02-01'])) == [0, 0, 2, 2, 2]
+
+
+def test_equal_weight_daily_is_mean_return():
+    price = sample_prices()
+    level = board_index(price, MEMBERS)
+    ret = price[['A', 'B']].ffill().pct_change().mean(axis=1).iloc[1:]
+    np.testing.assert_allclose(level['甲'].pct_change().iloc[1:], ret, rtol=1e-10)
+    assert level['甲'].iloc[0] == 1000
+    # 没有价格的板块
+    assert level['空'].isna().all()
+
+
+def test_equal_weight_monthly_rebalance_matches_reference():
+    price = sample_prices(1)
+    points = rebalance_points(price.index, 'm')
+    level = board_index(price, MEMBERS, rebalance='m')
+    for name in ('甲', '乙'):
+        np.testing.assert_allclose(level[name], reference(price, MEMBERS[name], points), rtol=1e-10)
+
+
+def test_float_cap_weight():
+    price = sample_prices(2)
+    shares = pd.Series({'A': 1e8, 'B': 3e8, 'C': 2e8})
+    level = board_index(price, MEMBERS, weight='float_cap', float_shares=shares, rebalance='w')
+    points = rebalance_points(price.index, 'w')
+    np.testing.assert_allclose(level['乙'], reference(price, MEMBERS['乙'], points, shares), rtol=1e-10)
+    # 每根K线调仓时等于成份股流通市值合计的变化
+    level = board_index(price, {'甲': ['A', 'B']}, weight='float_cap', float_shares=shares)
+    cap = (price[['A', 'B']].ffill() * shares[['A', 'B']]).sum(axis=1)
+    np.testing.assert_allclose(level['甲'], 1000 * cap / cap.iloc[0], rtol=1e-10)
+
+
+def test_long_panel_input():
+    price = sample_prices(3)
+    bars = price.stack().rename('close').reset_index(level=1).rename(columns={'level_1': 'code'})
+    pd.testing.assert_frame_equal(price_panel(bars).rename_axis(columns=None), price.dropna(how='all'),
+                                  check_freq=False)
+    pd.testing.assert_frame_equal(board_index(bars, MEMBERS), board_index(price, MEMBERS), check_freq=False)
@@ -0,0 +1,125 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.cb_monitor import cb_valuation, coupon_matrix, pure_bond_value
+
+cb_monitor = importlib.import_module('qstock.data.cb_monitor')
+
+TODAY = '2026-10-19'
+COUPONS = '第一年0.30%、第二年0.50%、第三年1.00%、第四年1.50%、第五年1.80%、第六年2.00%'
+
+
+def sample_terms():
+    return pd.DataFrame({
+        '债券代码': ['113001', '123002', '127003'],
+        '债券名称': ['甲转债', '乙转债', '丙转债'],
+        '正股代码': ['600001', '300002', '000003'],
+        '正股名称': ['甲股份', '乙科技', '丙集团'],
+        '转股价': [10.0, 20.0, 5.0],
+        '期限(年)': [6, 6, 6],
+        '到期日期': ['2028-04-19', '2030-04-19', '2029-04-19'],
+        '利率说明': [COUPONS] * 3,
+        '债券评级': ['AAA', 'AA', None],
+        '强赎触发价': [13.0, np.nan, 6.5],
+    })
+
+
+def sample_quotes():
+    bonds = pd.DataFrame({'代码': ['113001', '123002', '127003'], '名称': ['甲转债', '乙转债', '丙转债'],
+                          '最新': [120.0, 101.0, 0.0], '涨幅': [1.0, -0.5, 0.0], '成交额': [1e8, 2e7, 0.0]})
+    stocks = pd.DataFrame({'代码': ['600001', '300002', '000003'], '最新': [11.0, 15.0, 4.0],
+                           '涨幅': [2.0, -1.0, 0.0]})
+    return bonds, stocks
+
+
+def years_to(expire):
+    return (pd.Timestamp(expire) - pd.Timestamp(TODAY)).days / 365.25
+
+
+def discount(cash, t, rate):
+    return sum(c / (1 + rate) ** s for c, s in zip(cash, t))
+
+
+def test_coupon_matrix():
+    rates = coupon_matrix(np.array([COUPONS, '第一年0.2%']), np.array([6, 6]))
+    np.testing.assert_allclose(rates[0], [0.3, 0.5, 1.0, 1.5, 1.8, 2.0])
+    np.testing.assert_allclose(rates[1], [0.2, 0, 0, 0, 0, 0])
+
+
+def test_pure_bond_value_discounts_remaining_cash_flows():
+    coupons = coupon_matrix(np.array([COUPONS]), np.array([6]))
+    value = pure_bond_value(['2028-04-19'], [6], coupons, [102.0], 0.03, today=TODAY)
+    # 剩余第五年利息和到期赎回价（含第六年利息）
+    t = years_to('2028-04-19')
+    np.testing.assert_allclose(value, [discount([1.8, 102.0], [t - 1, t], 0.03)])
+    assert np.isnan(pure_bond_value([None], [6], coupons, [102.0], 0.03, today=TODAY)[0])
+
+
+def test_cb_valuation_table():
+    bonds, stocks = sample_quotes()
+    df = cb_valuation(sample_terms(), bonds, stocks, today=TODAY).set_index('债券代码')
+    assert list(df.columns) == cb_monitor.cb_columns[1:]
+    # 停牌（价格为0）的债券不在估值表中
+    assert list(df.index) == ['113001', '123002']
+    a = df.loc['113001']
+    assert a['转股价值'] == 110.0
+    assert a['转股溢价率'] == round((120 / 110 - 1) * 100, 3)
+    assert a['双低'] == round(120 + (120 / 110 - 1) * 100, 3)
+    t = years_to('2028-04-19')
+    assert a['纯债价值'] == round(discount([1.8, 102.0], [t - 1, t], 0.03), 3)
+    assert a['强赎触发比'] == round(11 / 13, 3)
+    b = df.loc['123002']
+    t = years_to('2030-04-19')
+    assert b['纯债价值'] == round(discount([1.0, 1.5, 1.8, 102.0], [t - 3, t - 2, t - 1, t], 0.04), 3)
+    # 没有强赎触发价时按转股价的130%
+    assert b['强赎触发比'] == round(15 / 26, 3)
+    # 指定到期赎回价
+    df = cb_valuation(sample_terms(), bonds, stocks, redemption={'113001': 110}, today=TODAY)
+    assert df.set_index('债券代码').loc['113001', '纯债价值'] > a['纯债价值']
+
+
+def test_monitor_refresh_uses_two_requests(monkeypatch):
+    trade = importlib.import_module('qstock.data.trade')
+    bonds, stocks = sample_quotes()
+    calls = []
+
+    def market_realtime(market):
+        calls.append(market)
+        return bonds
+
+    def stock_realtime(secids):
+        calls.append(sorted(secids))
+        return stocks
+
+    monkeypatch.setattr(trade, 'market_realtime', market_realtime)
+    monkeypatch.setattr(trade, 'stock_realtime', stock_realtime)
+    monitor = cb_monitor.CBMonitor(terms=sample_terms())
+    assert calls == ['可转债', ['0.000003', '0.300002', '1.600001']]
+    calls.clear()
+    table = monitor.refresh()
+    assert len(calls) == 2
+    assert set(table['债券代码']) == {'113001', '123002'}
+
+
+def test_cached_monitor_uses_new_redemption(monkeypatch):
+    trade = importlib.import_module('qstock.data.trade')
+    bonds, stocks = sample_quotes()
+    calls = []
+    monkeypatch.setattr(trade, 'market_realtime', lambda market: calls.append(market) or bonds)
+    monkeypatch.setattr(trade, 'stock_realtime', lambda secids: stocks)
+    monkeypatch.setattr(trade, 'bond_info_all', lambda fields: sample_terms())
+    monkeypatch.setattr(cb_monitor, 'cb_monitor_cache', {})
+
+    def bond_value(table):
+        return table.set_index('债券代码').loc['113001', '纯债价值']
+
+    default = bond_value(cb_monitor.cb_monitor())
+    higher = bond_value(cb_monitor.cb_monitor(refresh=False, redemption=110))
+    assert higher > default
+    # 只重新计算，不重新请求行情
+    assert len(calls) == 1
+    assert bond_value(cb_monitor.cb_monitor(refresh=False, redemption=110)) == higher
+    assert bond_value(cb_monitor.cb_monitor()) == default
+    assert len(calls) == 2
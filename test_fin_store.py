@@ -0,0 +1,85 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.fin_store import latest_reports, report_deadline, report_closed, fin_report_dates
+
+fin_store = importlib.import_module('qstock.data.fin_store')
+
+
+def sample_history():
+    '''两只股票三个报告期的长表，含旧报告期的更正公告'''
+    return pd.DataFrame([
+        ('2023-06-30', '000001', 1.0, '2023-08-20'),
+        ('2023-09-30', '000001', 2.0, '2023-10-25'),
+        # 半年报在三季报之后更正，不能覆盖三季报
+        ('2023-06-30', '000001', 1.5, '2023-11-10'),
+        ('2023-12-31', '000001', 3.0, '2024-03-15'),
+        ('2023-06-30', '600000', 10.0, '2023-08-30'),
+        ('2023-09-30', '600000', 20.0, None),
+    ], columns=['报告期', '代码', '净资产收益率', '公告日']).astype({'报告期': 'datetime64[ns]',
+                                                           '公告日': 'datetime64[ns]'})
+
+
+def test_latest_reports_ignores_older_corrections():
+    df = latest_reports(sample_history())
+    rows = list(zip(df['代码'], df['报告期'].dt.strftime('%Y%m%d'), df['净资产收益率']))
+    assert ('000001', '20230630', 1.5) not in rows
+    assert rows == [('000001', '20230630', 1.0), ('600000', '20230630', 10.0),
+                    ('000001', '20230930', 2.0), ('000001', '20231231', 3.0)]
+
+
+def test_report_deadlines():
+    assert report_deadline('2023-03-31') == pd.Timestamp('2023-04-30')
+    assert report_deadline('2023-06-30') == pd.Timestamp('2023-08-31')
+    assert report_deadline('2023-12-31') == pd.Timestamp('2024-04-30')
+    assert not report_closed('2023-09-30', refresh_days=30, today='2023-11-20')
+    assert report_closed('2023-09-30', refresh_days=30, today='2023-12-01')
+    assert list(fin_report_dates('20230101', '2023-12-31').strftime('%m%d')) == ['0331', '0630', '0930', '1231']
+
+
+def store_history(tmp_path, monkeypatch):
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    df = sample_history()
+    for date, part in df.groupby('报告期'):
+        part.to_pickle(fin_store.fin_path('cwzb', date))
+    return df
+
+
+def test_cross_section_as_of(tmp_path, monkeypatch):
+    store_history(tmp_path, monkeypatch)
+    # 2023-11-01时000001已公告三季报，600000的三季报没有公告日
+    df = fin_store.fin_cross_section('财务指标', as_of='2023-11-01')
+    assert df.loc['000001', '净资产收益率'] == 2.0
+    assert df.loc['600000', '净资产收益率'] == 10.0
+    df = fin_store.fin_cross_section('财务指标', date='2023-09-30', as_of='2023-10-01')
+    assert df.empty
+
+
+def test_pit_panel_has_no_look_ahead(tmp_path, monkeypatch):
+    store_history(tmp_path, monkeypatch)
+    dates = pd.bdate_range('2023-08-01', '2024-03-29')
+    panel = fin_store.fin_pit_panel('财务指标', '净资产收益率', dates, start='20230101')
+    s = panel['000001']
+    assert np.isnan(s.loc['2023-08-18'])
+    assert s.loc['2023-08-21'] == 1.0
+    assert s.loc['2023-10-25'] == 2.0
+    # 半年报的更正公告不回退到旧报告期
+    assert s.loc['2023-11-10'] == 2.0
+    assert s.loc['2024-03-15'] == 3.0
+    assert panel['600000'].loc['2024-03-29'] == 10.0
+
+
+def test_unpublished_quarter_is_not_mislabelled(tmp_path, monkeypatch):
+    trade = importlib.import_module('qstock.data.trade')
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    monkeypatch.setattr(trade, 'report_date', lambda: pd.DataFrame({'报告日期': ['2023-06-30']}))
+
+    def no_request(*args, **kwargs):
+        raise AssertionError('不应请求其他报告期的数据')
+
+    monkeypatch.setattr(trade.session, 'get', no_request)
+    # 三季报还没有数据，不能用半年报代替
+    assert fin_store.update_fin_date('cwzb', '2023-09-30')
+    assert fin_store.load_fin('cwzb', '2023-09-30').empty
@@ -0,0 +1,93 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.fund_holding import FundHoldingIndex, fund_holding_cols
+
+Q1, Q2 = pd.Timestamp('2024-03-31'), pd.Timestamp('2024-06-30')
+
+
+def sample_facts():
+    rows = [
+        ('F1', Q1, '600519', 9.0), ('F1', Q1, '000858', 5.0),
+        ('F2', Q1, '600519', 8.0),
+        ('F3', Q1, '600519', 4.0), ('F3', Q1, '300750', 6.0),
+        ('F1', Q2, '600519', 10.0), ('F1', Q2, '300750', 3.0),
+        # F2还没有公布Q2持仓；F3的Q2持仓中没有600519（退出）
+        ('F3', Q2, '300750', 7.0),
+        ('F4', Q2, '600519', 2.0),
+    ]
+    names = {'600519': '贵州茅台', '000858': '五粮液', '300750': '宁德时代'}
+    df = pd.DataFrame(rows, columns=['基金代码', '报告期', '股票代码', '持仓占比'])
+    df['股票简称'] = df['股票代码'].map(names)
+    df['较上期变化'] = np.nan
+    return df[fund_holding_cols]
+
+
+def sample_index():
+    return FundHoldingIndex(sample_facts(), {'F1': '基金一', 'F2': '基金二', 'F3': '基金三', 'F4': '基金四'})
+
+
+def test_lookups_match_facts():
+    index, facts = sample_index(), sample_facts()
+    assert len(index) == len(facts)
+    df = index.stock_funds('600519')
+    assert list(df['基金代码']) == ['F1', 'F4']
+    assert (df['报告期'] == Q2).all()
+    # 简称也可以查询，date指定报告期
+    assert list(index.stock_funds('贵州茅台', Q1)['基金代码']) == ['F1', 'F2', 'F3']
+    assert list(index.fund_stocks('F1')['股票代码']) == ['600519', '300750']
+    assert list(index.fund_stocks('基金三', Q1)['股票代码']) == ['300750', '600519']
+    assert index.stock_funds('999999').empty
+
+
+def test_changes_only_exit_funds_that_filed():
+    df = sample_index().stock_fund_changes('600519').set_index('基金代码')
+    assert df.loc['F1', '变动'] == '增持'
+    assert df.loc['F3', '变动'] == '退出'
+    assert df.loc['F4', '变动'] == '新进'
+    # 还没有本期持仓的基金不算退出
+    assert df.loc['F2', '变动'] == '未披露'
+
+
+def test_ownership_counts_comparable_funds():
+    table = sample_index().ownership('all')
+    q1 = table.xs(Q1, level='报告期')
+    assert q1.loc['600519', '持有基金数'] == 3
+    assert np.isnan(q1.loc['600519', '基金数变化'])
+    q2 = table.xs(Q2, level='报告期')
+    # F1保留、F4新进、F3退出，F2未披露不计入
+    assert q2.loc['600519', '持有基金数'] == 2
+    assert q2.loc['600519', '基金数变化'] == 0
+    assert q2.loc['600519', '持仓占比合计变化'] == (10 + 2) - (9 + 4)
+    assert q2.loc['300750', '基金数变化'] == 1
+    latest = sample_index().ownership()
+    assert sorted(latest.index) == ['300750', '600519']
+    assert latest.loc['300750', '持仓占比合计'] == 10
+
+
+def test_save_load(tmp_path):
+    index = sample_index()
+    index.save(tmp_path / 'index.pkl')
+    loaded = FundHoldingIndex.load(tmp_path / 'index.pkl')
+    pd.testing.assert_frame_equal(loaded.ownership('all'), index.ownership('all'))
+    assert loaded.fund_names == index.fund_names
+
+
+def test_subset_index_is_not_cached(tmp_path, monkeypatch):
+    fund_holding = importlib.import_module('qstock.data.fund_holding')
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    monkeypatch.setattr(fund_holding, 'fund_index_cache', {})
+    facts = sample_facts().replace({'基金代码': {'F1': '000001', 'F2': '000002', 'F3': '000003', 'F4': '000004'}})
+    for code, part in facts.groupby('基金代码'):
+        part.to_pickle(fund_holding.fund_holding_path(code))
+    subset = fund_holding.build_fund_index(['000001'], update=False)
+    assert set(subset.by_fund['基金代码']) == {'000001'}
+    # 部分基金的索引不能作为stock_funds等函数的默认索引
+    assert 'default' not in fund_holding.fund_index_cache
+    assert not (tmp_path / 'fund_holding' / 'index.pkl').exists()
+    full = fund_holding.build_fund_index(update=False)
+    assert len(full) == len(facts)
+    assert fund_holding.fund_holding_index() is full
+    assert list(fund_holding.stock_funds('600519')['基金代码']) == ['000001', '000004']
@@ -0,0 +1,72 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.fund_store import fund_corr, fund_drawdown, fund_period_returns, fund_nav_panel
+
+fund_store = importlib.import_module('qstock.data.fund_store')
+
+
+def sample_nav(seed=0):
+    rnd = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-01', periods=80)
+    ret = rnd.normal(0, 0.01, (len(dates), 5))
+    ret[:, 1] += ret[:, 0]
+    nav = pd.DataFrame(np.cumprod(1 + ret, axis=0), index=dates, columns=[f'00000{i}' for i in range(5)])
+    # 成立较晚、中间缺失净值的基金
+    nav.iloc[:30, 2] = np.nan
+    nav.iloc[rnd.random(len(dates)) < 0.2, 3] = np.nan
+    nav.iloc[:-15, 4] = np.nan
+    return nav
+
+
+def test_corr_matches_pairwise_pandas():
+    nav = sample_nav()
+    expected = (nav / nav.shift(1) - 1).corr(min_periods=20)
+    pd.testing.assert_frame_equal(fund_corr(nav), expected, atol=1e-9)
+    assert fund_corr(nav).loc['000000', '000001'] > 0.5
+    # 共同日期不足min_periods
+    assert np.isnan(fund_corr(nav).loc['000004', '000000'])
+    window = fund_corr(nav, window=40)
+    pd.testing.assert_frame_equal(window, fund_corr(nav.iloc[-41:]))
+
+
+def test_drawdown_and_period_returns():
+    nav = sample_nav(1)
+    dd, summary = fund_drawdown(nav)
+    filled = nav.ffill()
+    expected = (filled / filled.cummax() - 1) * 100
+    np.testing.assert_allclose(dd.to_numpy(), expected.to_numpy(), atol=1e-9)
+    assert (summary['最大回撤'] == expected.min()).all()
+    assert summary.loc['000000', '最大回撤日期'] == expected['000000'].idxmin()
+    returns = fund_period_returns(nav, windows=(5, 60))
+    np.testing.assert_allclose(returns['5日收益'], (filled.iloc[-1] / filled.iloc[-6] - 1) * 100)
+    assert np.isnan(returns.loc['000004', '60日收益'])
+
+
+def fake_nav(dates):
+    dates = pd.DatetimeIndex(dates)
+    nav = np.arange(1, len(dates) + 1, dtype=float)
+    return pd.DataFrame({'单位净值': nav, '累计净值': nav, '涨跌幅': 0.0}, index=dates)
+
+
+def test_update_refetches_when_gap(tmp_path, monkeypatch):
+    trade = importlib.import_module('qstock.data.trade')
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    history = pd.DatetimeIndex(['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05', '2024-01-08'])
+    fake_nav(history[:2]).to_pickle(fund_store.fund_nav_path('000001'))
+    monkeypatch.setattr(fund_store, 'latest_trade_date', lambda: '2024-01-08')
+    monkeypatch.setattr(fund_store, 'trade_days_between', lambda a, b: [0, 0])
+    calls = []
+
+    def fund_data_single(code, pz):
+        calls.append(pz)
+        # 按交易日数只取到最近的记录，覆盖不到已保存的最后一天
+        return fake_nav(history)[-pz:]
+
+    monkeypatch.setattr(trade, 'fund_data_single', fund_data_single)
+    assert fund_store.update_fund_nav('000001') == 3
+    assert calls == [2, 50000]
+    panel = fund_nav_panel('000001')
+    assert panel.index.equals(pd.DatetimeIndex(history, name='date'))
@@ -0,0 +1,71 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from qstock.data.fundamental import holder_concentration, holder_number
+
+fundamental = importlib.import_module('qstock.data.fundamental')
+
+
+def test_holder_number_scales_units():
+    s = pd.Series(['1.23亿', '4567.89万', '12.34%', ' 1,234.5万 ', '-', None, 3.5])
+    np.testing.assert_allclose(holder_number(s), [1.23, 0.456789, 12.34, 0.12345, 0, 0, 3.5])
+
+
+def holder_item(name, shares, ratio, change, rate):
+    return {'GuDongDaiMa': '1', 'GuDongMingCheng': name, 'ChiGuShu': shares, 'ChiGuBiLi': ratio,
+            'ZengJian': change, 'BianDongBiLi': rate, 'IsLink': False}
+
+
+# 两个报告期的前十大流通股东（只列两名）
+HOLDERS = {
+    '2023-06-30': [holder_item('甲基金', '1.2亿', '10.5%', '新进', '-'),
+                   holder_item('乙公司', '3000万', '2.5%', '不变', '-')],
+    '2023-09-30': [holder_item('甲基金', '1.5亿', '13.0%', '增加', '25.00%'),
+                   holder_item('丙社保', '2400万', '2.0%', '新进', '-')],
+}
+
+
+class Response:
+    encoding = None
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def post(self, url, json=None):
+        self.calls.append((url.rsplit('/', 1)[-1], json.get('BaoGaoQi')))
+        if 'BaoGaoQi' not in json:
+            dates = ['2023-09-30', '2023-06-30', '2023-03-31']
+            return Response({'Result': {'BaoGaoQiList': [{'BaoGaoQi': d} for d in dates]}})
+        return Response({'Result': {'ShiDaLiuTongGuDongList': HOLDERS.get(json['BaoGaoQi'], [])}})
+
+
+def test_top10_history_and_concentration(tmp_path, monkeypatch):
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    session = FakeSession()
+    monkeypatch.setattr(fundamental, 'session', session)
+    hist = fundamental.holder_top10_history(['600000'], n=3, max_workers=2)
+    assert sorted(hist['日期'].unique()) == ['2023-06-30', '2023-09-30']
+    row = hist[(hist['日期'] == '2023-09-30') & (hist['股东名称'] == '丙社保')].iloc[0]
+    assert row['代码'] == '600000'
+    np.testing.assert_allclose([row['持股数(亿)'], row['持股比例(%)']], [0.24, 2.0])
+    assert 'IsLink' not in hist.columns
+    panels = holder_concentration(hist)
+    share = panels['前十大流通股东持股比例']['600000']
+    assert share.tolist() == [13.0, 15.0]
+    assert panels['环比变化']['600000'].iloc[1] == 2.0
+    assert panels['新进股东数']['600000'].tolist() == [1, 1]
+    # 已结束披露的报告期使用本地缓存，只重新请求报告期列表和没有数据的报告期
+    session.calls.clear()
+    fundamental.holder_top10_history(['600000'], n=3, max_workers=2)
+    assert [name for name, _ in session.calls] == ['GetFirstRequest2Data', 'GetShiDaLiuTongGuDong']
+    assert session.calls[1][1] == '2023-03-31'
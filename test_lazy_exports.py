@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+# 子模块只在第一次导入时改写包的同名属性，每个用例在新的解释器中运行
+SHADOWED = [
+    ('qstock.data', 'stock_boards', 'member_index'),
+    ('qstock', 'stock_boards', 'member_index'),
+    ('qstock.stock', 'board_index_data', 'board_index'),
+    ('qstock', 'board_index_data', 'board_index'),
+    ('qstock.data', 'CBMonitor', 'cb_monitor'),
+    ('qstock.data', 'wencai_page', 'wencai'),
+    ('qstock.stock', 'ta_signals', 'ta_pool'),
+    ('qstock.stock', 'limit_stats', 'limit_history'),
+    ('qstock.stock', 'rolling_flow', 'money_rank'),
+]
+
+
+def run(code):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.split()
+
+
+def test_function_not_replaced_by_same_named_module():
+    for package, sibling, name in SHADOWED:
+        code = (f'import importlib, types; p = importlib.import_module({package!r}); p.{sibling}; '
+                f'print(callable(p.{name}) and not isinstance(p.{name}, types.ModuleType))')
+        assert run(code) == ['True'], (package, sibling, name)
+
+
+def test_same_named_function_after_direct_import():
+    code = ('import qstock.data, qstock.data.cb_monitor as m; qstock.data.CBMonitor; '
+            'print(qstock.data.cb_monitor is m.cb_monitor)')
+    assert run(code) == ['True']
+
+
+def test_module_exports_stay_modules():
+    code = 'import types, qstock.data as d; d.cb_monitor; print(isinstance(d.metrics, types.ModuleType))'
+    assert run(code) == ['True']
+
+
+def test_member_index_after_sibling():
+    code = ('import qstock.data.member_index as m, qstock.data as d; d.stock_boards; '
+            'print(d.member_index is m.member_index, callable(d.member_index))')
+    assert run(code) == ['True', 'True']
+
+
+def test_board_index_after_sibling():
+    code = ('import qstock.stock.board_index as m, qstock.stock as s; s.board_index_data; '
+            'print(s.board_index is m.board_index, callable(s.board_index))')
+    assert run(code) == ['True', 'True']
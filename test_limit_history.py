@@ -0,0 +1,106 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from qstock.stock.limit_history import board_promotion, board_next_returns, sector_concentration
+
+limit_history = importlib.import_module('qstock.stock.limit_history')
+DAYS = pd.bdate_range('2024-03-04', periods=4)
+
+
+def sample_zt():
+    '''A:1、2、3连板；B:1板后断板；C:2、3板后断板；D第4天首板'''
+    rows = [(DAYS[0], 'A', 1, 0, '银行'), (DAYS[0], 'B', 1, 1, '白酒'), (DAYS[0], 'C', 2, 0, '银行'),
+            (DAYS[1], 'A', 2, 2, '银行'), (DAYS[1], 'C', 3, 0, '银行'),
+            (DAYS[2], 'A', 3, 0, '银行'),
+            (DAYS[3], 'D', 1, 0, '光伏')]
+    return pd.DataFrame(rows, columns=['日期', '代码', '连板数', '炸板次数', '所属行业'])
+
+
+def test_board_promotion():
+    df = board_promotion(sample_zt(), max_height=3)
+    assert list(df.index) == ['1板', '2板', '3板及以上']
+    # 1板：A晋级、B断板；2板：C(第1天)、A(第2天)都晋级；3板：C断板、A(第3天)断板
+    assert df['样本数'].tolist() == [2, 2, 2]
+    assert df['晋级数'].tolist() == [1, 2, 0]
+    assert df['晋级率%'].tolist() == [50.0, 100.0, 0.0]
+
+
+def test_board_next_returns():
+    close = pd.DataFrame({'A': [10, 11, 12.1, 13.31], 'B': [20, 19, 18, 17], 'C': [5, 5.5, 6.05, 6.0],
+                          'D': [8, 8, 8, 8.8]}, index=DAYS)
+    bars = close.stack().rename('close').reset_index(level=1).rename(columns={'level_1': 'code'})
+    bars['open'] = bars['close']
+    df = board_next_returns(sample_zt(), bars, max_height=3)
+    # 1板：A次日+10%，B次日-5%；D是最后一天没有次日收益
+    assert df.loc['1板', '样本数'] == 3
+    assert df.loc['1板', '次日收益均值%'] == 2.5
+    assert df.loc['1板', '次日收益上涨比例%'] == 50.0
+    # 3板：C(第2天)、A(第3天)次日都+10%
+    np.testing.assert_allclose(df.loc['3板及以上', '次日收益均值%'], 10)
+    two = ((6.05 / 5.5 - 1) * 100 + 10) / 2
+    np.testing.assert_allclose(df.loc['2板', '次日收益均值%'], two, atol=0.01)
+    assert list(df.columns[:2]) == ['样本数', '次日开盘收益均值%']
+
+
+def test_sector_concentration():
+    counts, daily = sector_concentration(sample_zt())
+    assert counts.loc[DAYS[0]].to_dict() == {'光伏': 0, '白酒': 1, '银行': 2}
+    assert daily.loc[DAYS[0], '第一行业'] == '银行'
+    assert daily.loc[DAYS[0], '赫芬达尔指数'] == round((2 / 3) ** 2 + (1 / 3) ** 2, 4)
+    assert daily.loc[DAYS[1], '赫芬达尔指数'] == 1
+
+
+def patch_store(tmp_path, monkeypatch, pools):
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    monkeypatch.setattr(limit_history, 'trade_days_between',
+                        lambda start, end: DAYS[(DAYS >= pd.Timestamp(start)) & (DAYS <= pd.Timestamp(end))])
+    monkeypatch.setattr(limit_history, 'latest_trade_date', lambda: f'{DAYS[-1]:%Y-%m-%d}')
+    monkeypatch.setattr(limit_history, 'latest_closed_trade_date', lambda: f'{DAYS[-1]:%Y-%m-%d}')
+    calls = []
+
+    def fetcher(kind):
+        def fetch(date):
+            calls.append((kind, date))
+            df = pools[kind]
+            return df[df['日期'] == pd.Timestamp(date)].drop(columns='日期').reset_index(drop=True)
+        return fetch
+
+    for kind in 'udz':
+        monkeypatch.setitem(limit_history.limit_fetchers, kind, fetcher(kind))
+    return calls
+
+
+def test_limit_stats(tmp_path, monkeypatch):
+    zb = pd.DataFrame({'日期': [DAYS[0], DAYS[1], DAYS[1]], '代码': ['E', 'F', 'G']})
+    dt = pd.DataFrame({'日期': [DAYS[2]], '代码': ['H']})
+    calls = patch_store(tmp_path, monkeypatch, {'u': sample_zt(), 'd': dt, 'z': zb})
+    # 没有涨跌停的交易日也保存，便于检查不重复获取
+    monkeypatch.setattr(limit_history, 'limit_retry_days', 0)
+    stats = limit_history.limit_stats(DAYS[0], DAYS[-1])
+    assert stats['涨停数'].tolist() == [3, 2, 1, 1]
+    assert stats['跌停数'].tolist() == [0, 0, 1, 0]
+    assert stats['炸板率%'].tolist() == [25.0, 50.0, 0.0, 0.0]
+    assert stats['连板数'].tolist() == [1, 2, 1, 0]
+    assert stats['最高板'].tolist() == [2, 3, 3, 1]
+    assert stats['晋级率%'].iloc[1:].tolist() == [round(2 / 3 * 100, 2), 50.0, 0.0]
+    # 回封：B(第1天)、A(第2天)炸板后封住
+    assert stats['回封率%'].iloc[:2].tolist() == [50.0, round(1 / 3 * 100, 2)]
+    # 已保存的交易日不再获取
+    calls.clear()
+    limit_history.limit_stats(DAYS[0], DAYS[-1])
+    assert calls == []
+
+
+def test_recent_empty_pool_is_retried(tmp_path, monkeypatch):
+    calls = patch_store(tmp_path, monkeypatch, {k: sample_zt().iloc[:0] for k in 'udz'})
+    monkeypatch.setattr(limit_history, 'limit_retry_days', 2)
+    for day in DAYS:
+        assert limit_history.update_limit_day('u', day) == 0
+    # 最近2个交易日的空股池不保存
+    assert [limit_history.load_limit_day('u', d) is not None for d in DAYS] == [True, True, False, False]
+    calls.clear()
+    for day in DAYS:
+        limit_history.update_limit_day('u', day)
+    assert [d for _, d in calls] == [f'{d:%Y%m%d}' for d in DAYS[2:]]
@@ -0,0 +1,93 @@
+import importlib
+import numpy as np
+import pandas as pd
+
+from qstock.data.member_index import MemberIndex
+
+
+def sample_index():
+    boards = pd.DataFrame({'code': ['BK01', 'BK02', 'BK03', 'BK04'],
+                           'name': ['银行', '白酒', '沪深300', '空板块'],
+                           'type': ['行业', '概念', '概念', '概念'],
+                           'count': [2, 2, 3, 0]})
+    members = {
+        'BK01': {'600000': '浦发银行', '000001': '平安银行'},
+        'BK02': {'600519': '贵州茅台', '000858': '五粮液'},
+        'BK03': {'600000': '浦发银行', '600519': '贵州茅台', '000001': '平安银行'},
+    }
+    return MemberIndex.from_members(boards, members, '2024-01-02'), members
+
+
+def test_board_and_stock_lookups():
+    index, members = sample_index()
+    assert len(index) == 7
+    assert sorted(index.board_stocks('BK03')) == sorted(members['BK03'])
+    # 板块名称也可以查询
+    assert sorted(index.board_stocks('白酒')) == sorted(members['BK02'])
+    assert index.board_stocks('BK04') == []
+    assert sorted(index.stock_boards('600519')['code']) == ['BK02', 'BK03']
+    assert list(index.stock_boards('600519', kind='概念')['code']) == ['BK02', 'BK03']
+    assert index.stock_boards('999999').empty
+
+
+def test_members_round_trip():
+    index, members = sample_index()
+    result = index.members()
+    assert {k: v for k, v in result.items() if v} == members
+    assert result['BK04'] == {}
+
+
+def test_long_tables_match_members():
+    index, members = sample_index()
+    expected = {(s, b) for b, m in members.items() for s in m}
+    df = index.stocks_boards()
+    assert set(zip(df['代码'], df['板块代码'])) == expected
+    df = index.boards_stocks()
+    assert set(zip(df['代码'], df['板块代码'])) == expected
+    df = index.stocks_boards(['000001'], kind='行业')
+    assert list(df['板块代码']) == ['BK01']
+
+
+def test_matrix_matches_members():
+    index, members = sample_index()
+    m = index.matrix(dense=True)
+    assert m.shape == (4, len(index.stocks))
+    for i, code in enumerate(index.boards['code']):
+        assert set(index.stocks[m[i] == 1]) == set(members.get(code, {}))
+    np.testing.assert_array_equal(m.sum(axis=0), [len(index.stock_boards(s)) for s in index.stocks])
+
+
+def test_save_load(tmp_path):
+    index, members = sample_index()
+    index.save(tmp_path / 'em')
+    loaded = MemberIndex.load(tmp_path / 'em')
+    assert loaded.updated == '2024-01-02'
+    assert {k: v for k, v in loaded.members().items() if v} == members
+    assert list(loaded.boards['count']) == [2, 2, 3, 0]
+
+
+def test_failed_board_is_retried(tmp_path, monkeypatch):
+    member_index = importlib.import_module('qstock.data.member_index')
+    monkeypatch.setenv('QSTOCK_HOME', str(tmp_path))
+    boards = pd.DataFrame({'code': ['BK01', 'BK02'], 'name': ['银行', '白酒'], 'type': ['行业', '概念'],
+                           'count': [1, 1]})
+    failing, calls = {'BK02'}, []
+
+    def get_members(code, kind):
+        calls.append(code)
+        if code in failing:
+            raise IOError('rate limited')
+        return {'600000': '浦发银行'} if code == 'BK01' else {'600519': '贵州茅台'}
+
+    monkeypatch.setitem(member_index.member_fetchers, 'em', (lambda: boards.copy(), get_members))
+    member_index.build_member_index('em')
+    assert sorted(calls) == ['BK01', 'BK02']
+    # 获取失败的板块下次增量更新时重新获取，成功的不再获取
+    calls.clear()
+    failing.clear()
+    index = member_index.build_member_index('em')
+    assert calls == ['BK02']
+    assert index.board_stocks('BK02') == ['600519']
+    calls.clear()
+    member_index.build_member_index('em')
+    assert calls == []
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from qstock.stock.money_rank import window_sums, rolling_flow
+
+
+def sample_values(seed=0):
+    rnd = np.random.default_rng(seed)
+    values = rnd.normal(0, 1e6, (40, 6))
+    # 停牌（缺失）和上市前的数据
+    values[rnd.random(values.shape) < 0.2] = np.nan
+    values[:15, 0] = np.nan
+    return values
+
+
+def reference(values, w):
+    '''pandas rolling实现的参照：缺失按0累加，窗口内全部缺失时为nan'''
+    df = pd.DataFrame(values)
+    sums = df.fillna(0).rolling(w).sum()
+    counts = df.notna().astype(int).rolling(w).sum()
+    return sums.where(counts > 0).to_numpy()
+
+
+def test_window_sums_matches_rolling():
+    values = sample_values()
+    windows = (1, 3, 5, 20)
+    result = window_sums(values, windows)
+    for w in windows:
+        np.testing.assert_allclose(result[w], reference(values, w), rtol=1e-9, atol=1e-3)
+
+
+def test_window_sums_latest_is_last_row():
+    values = sample_values(1)
+    windows = (1, 5, 20, 60)
+    full = window_sums(values, windows)
+    latest = window_sums(values, windows, latest=True)
+    for w in windows:
+        assert latest[w].shape == (1, values.shape[1])
+        np.testing.assert_allclose(latest[w][0], full[w][-1], rtol=1e-9, atol=1e-3)
+    # 历史不足60期
+    assert np.isnan(latest[60]).all()
+
+
+def test_rolling_flow_frames():
+    values = sample_values(2)
+    flow = pd.DataFrame(values, index=pd.bdate_range('2024-01-01', periods=len(values)),
+                        columns=[f'{i:06d}' for i in range(values.shape[1])])
+    result = rolling_flow(flow, windows=5)
+    assert list(result) == [5]
+    assert result[5].index.equals(flow.index) and result[5].columns.equals(flow.columns)
+    latest = rolling_flow(flow, windows=(1, 5), latest=True)
+    assert list(latest[5].index) == [flow.index[-1]]
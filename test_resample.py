@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from qstock.data.resample import resample_bars, intraday_labels
+
+
+def minute_bars(codes=('000001', '600000'), days=('2023-09-04', '2023-09-05'), seed=0):
+    '''两个交易日的1分钟K线（含9:30集合竞价），多只证券按get_data的格式排列'''
+    rnd = np.random.default_rng(seed)
+    times = []
+    for day in days:
+        morning = pd.date_range(f'{day} 09:30', f'{day} 11:30', freq='min')
+        afternoon = pd.date_range(f'{day} 13:01', f'{day} 15:00', freq='min')
+        times.extend(morning.append(afternoon))
+    index = pd.DatetimeIndex(times, name='date')
+    frames = []
+    for code in codes:
+        close = 10 + rnd.normal(0, 0.01, len(index)).cumsum()
+        frames.append(pd.DataFrame({
+            'code': code,
+            'open': close + rnd.normal(0, 0.01, len(index)),
+            'high': close + 0.02,
+            'low': close - 0.02,
+            'close': close,
+            'volume': rnd.integers(100, 1000, len(index)),
+            'turnover': rnd.uniform(1e4, 1e5, len(index)),
+        }, index=index))
+    return pd.concat(frames)
+
+
+def reference(df, labels):
+    '''pandas groupby实现的参照结果'''
+    df = df.assign(label=pd.to_datetime(labels))
+    g = df.groupby(['code', 'label'], sort=True)
+    out = g.agg(open=('open', 'first'), high=('high', 'max'), low=('low', 'min'),
+                close=('close', 'last'), volume=('volume', 'sum'), turnover=('turnover', 'sum'))
+    return out.reset_index(level='code').rename_axis('date')
+
+
+def test_intraday_labels_session_boundaries():
+    index = pd.DatetimeIndex(['2023-09-04 09:30', '2023-09-04 09:31', '2023-09-04 10:30',
+                              '2023-09-04 10:31', '2023-09-04 11:30', '2023-09-04 13:01',
+                              '2023-09-04 15:00', '2023-09-04 15:01'])
+    labels = pd.to_datetime(intraday_labels(index, 60)[:-1])
+    assert list(labels.strftime('%H:%M')) == ['10:30', '10:30', '10:30', '11:30', '11:30', '14:00', '15:00']
+    # 交易时段外的K线
+    assert intraday_labels(index, 60)[-1] == -1
+
+
+def test_resample_minutes_matches_groupby():
+    df = minute_bars()
+    for freq in (5, 15, 30, 60, 120):
+        result = resample_bars(df, freq)
+        expected = reference(df, intraday_labels(df.index, freq))
+        assert len(result) == len(expected)
+        pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_resample_60min_bar_count():
+    result = resample_bars(minute_bars(codes=('000001',), days=('2023-09-04',)), 60)
+    assert list(result.index.strftime('%H:%M')) == ['10:30', '11:30', '14:00', '15:00']
+
+
+def test_resample_unsorted_input():
+    df = minute_bars()
+    shuffled = df.sample(frac=1, random_state=1)
+    pd.testing.assert_frame_equal(resample_bars(shuffled, 30), resample_bars(df, 30))
+
+
+def test_resample_weekly_and_monthly():
+    index = pd.bdate_range('2023-01-02', '2023-03-31', name='date')
+    rnd = np.random.default_rng(1)
+    close = 10 + rnd.normal(0, 0.1, len(index)).cumsum()
+    df = pd.DataFrame({'code': '000001', 'open': close, 'high': close + 0.1, 'low': close - 0.1,
+                       'close': close, 'volume': rnd.integers(100, 1000, len(index)),
+                       'turnover': rnd.uniform(1e4, 1e5, len(index))}, index=index)
+    for freq, period in (('w', 'W-SUN'), ('m', 'M')):
+        result = resample_bars(df, freq)
+        periods = df.index.to_period(period)
+        expected = df.groupby(periods).agg(open=('open', 'first'), high=('high', 'max'), low=('low', 'min'),
+                                           close=('close', 'last'), volume=('volume', 'sum'))
+        # 以周期内最后一个交易日标记
+        last_day = pd.Series(df.index, index=df.index).groupby(periods).last()
+        assert list(result.index) == list(last_day)
+        np.testing.assert_allclose(result[expected.columns].to_numpy(dtype=float),
+                                   expected.to_numpy(dtype=float))
+
+
+def test_resample_invalid_freq():
+    try:
+        resample_bars(minute_bars(), 7)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('7分钟不能整除120，应当报错')
@@ -0,0 +1,76 @@
+import ast
+
+import numpy as np
+import pandas as pd
+
+from qstock.stock.screener import Screener, compile_expr, replace_bool_ops
+
+
+def sample_table():
+    return pd.DataFrame({
+        '名称': ['甲', '乙', '丙', '丁', '戊'],
+        '市盈率': [8.0, 15.0, 25.0, np.nan, 12.0],
+        '净资产收益率': [18.0, 9.0, 20.0, 16.0, 16.5],
+        '换手率': [1.0, 4.0, 5.0, 3.5, 6.0],
+        '涨幅': [-2.0, 1.5, 3.0, 0.0, -0.5],
+    }, index=pd.Index(['600000', '000001', '300750', '600519', '000858'], name='代码'))
+
+
+def same_ast(a, b):
+    return ast.dump(ast.parse(a, mode='eval')) == ast.dump(ast.parse(b, mode='eval'))
+
+
+def test_replace_bool_ops_precedence():
+    assert same_ast(replace_bool_ops('PE<20 & ROE>15'), 'PE<20 and ROE>15')
+    assert same_ast(replace_bool_ops('~(PE<20) | ROE>15'), 'not (PE<20) or ROE>15')
+
+
+def test_compile_expr_aliases_and_cache():
+    columns = tuple(sample_table().columns)
+    code, source, used = compile_expr('PE<20 & ROE>15', columns)
+    assert used == {'市盈率': 'c0', '净资产收益率': 'c1'}
+    assert source == '(c0 < 20) & (c1 > 15)'
+    # 同一(表达式, 列名)只编译一次
+    assert compile_expr('PE<20 & ROE>15', columns) is compile_expr('PE<20 & ROE>15', columns)
+
+
+def test_compile_expr_chained_compare():
+    _, source, used = compile_expr('10 < PE < 20', tuple(sample_table().columns))
+    assert source == '(10 < c0) & (c0 < 20)'
+
+
+def test_compile_expr_rejects_unsafe_input():
+    columns = tuple(sample_table().columns)
+    for expr in ('__import__("os")', 'PE.real > 1', 'PE[0] > 1', 'open("x")', 'no_such_column > 1'):
+        try:
+            compile_expr(expr, columns)
+        except (ValueError, KeyError):
+            continue
+        raise AssertionError(f'{expr}应当报错')
+
+
+def test_screener_matches_pandas():
+    table = sample_table()
+    screener = Screener(table)
+    result = screener.screen('PE<20 & ROE>15 & turnover_rate>=1')
+    expected = table[(table['市盈率'] < 20) & (table['净资产收益率'] > 15) & (table['换手率'] >= 1)]
+    pd.testing.assert_frame_equal(result, expected)
+    # nan不满足任何比较
+    assert '600519' not in screener.screen('PE<100').index
+    assert list(screener.screen('abs(pct_chg) > 1 or not ROE > 10').index) == ['600000', '000001', '300750']
+
+
+def test_screener_sort_and_columns():
+    screener = Screener(sample_table())
+    df = screener.screen('ROE > 15', columns=['name', 'ROE'], sort='ROE')
+    assert list(df.columns) == ['名称', '净资产收益率']
+    assert list(df['净资产收益率']) == [20.0, 18.0, 16.5, 16.0]
+
+
+def test_screener_requires_condition():
+    try:
+        Screener(sample_table()).mask('PE + ROE')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('结果不是条件时应当报错')
@@ -0,0 +1,76 @@
+import importlib
+
+import numpy as np
+
+from qstock.data.snapshot import SnapshotPoller, book_dtype, parse_snapshot
+
+snapshot = importlib.import_module('qstock.data.snapshot')
+
+
+def sample_data(bid=10.0, stamp='09:30:03', limit_up=False, bid1_count=300):
+    five = {}
+    for i in range(1, 6):
+        five[f'buy{i}'] = f'{bid - 0.01 * (i - 1):.2f}'
+        five[f'buy{i}_count'] = str(bid1_count if i == 1 else 100)
+        # 涨停时卖盘没有挂单
+        five[f'sale{i}'] = '-' if limit_up else f'{bid + 0.01 * i:.2f}'
+        five[f'sale{i}_count'] = '-' if limit_up else '100'
+    quote = {'currentPrice': str(bid), 'yesClosePrice': '9.50', 'high': '10.2', 'low': '9.6',
+             'volume': '12345', 'amount': '1.2e7', 'time': stamp}
+    return {'name': '测试', 'fivequote': five, 'realtimequote': quote}
+
+
+def empty_row():
+    book = np.zeros(1, dtype=book_dtype)
+    book['bid_px'] = np.nan
+    return book[0]
+
+
+def test_parse_snapshot_detects_changes():
+    row = empty_row()
+    assert parse_snapshot(sample_data(), row)
+    np.testing.assert_allclose(row['bid_px'], [10.0, 9.99, 9.98, 9.97, 9.96])
+    assert row['time'] == '09:30:03' and row['pre_close'] == 9.5
+    # 同样的数据不算变化
+    assert not parse_snapshot(sample_data(), row)
+    assert parse_snapshot(sample_data(bid1_count=500), row)
+    assert parse_snapshot(sample_data(bid1_count=500, stamp='09:30:06'), row)
+
+
+def test_parse_snapshot_limit_up_is_not_always_changed():
+    row = empty_row()
+    assert parse_snapshot(sample_data(limit_up=True), row)
+    assert np.isnan(row['ask_px']).all()
+    # 卖盘一直为nan时不能每次都视为有变化
+    assert not parse_snapshot(sample_data(limit_up=True), row)
+
+
+def test_poller_updates_and_metrics(monkeypatch):
+    feed = {'600000': sample_data(), '000001': sample_data(limit_up=True), '300750': None}
+
+    def fetch_snapshot(code, session=None):
+        if code == '300750':
+            raise IOError('timeout')
+        return feed[code]
+
+    monkeypatch.setattr(snapshot, 'fetch_snapshot', fetch_snapshot)
+    with SnapshotPoller(list(feed), max_workers=2) as poller:
+        poller.poll()
+        first = poller.book['updated'].copy()
+        assert list(poller.errors) == ['300750']
+        assert np.isnan(first[2]) and not np.isnan(first[:2]).any()
+        feed['000001'] = sample_data(bid=10.5, stamp='09:30:06', limit_up=True)
+        poller.poll()
+        # 只有数据有变化的股票更新时间
+        assert poller.book['updated'][0] == first[0]
+        assert poller.book['updated'][1] > first[1]
+        df = poller.metrics()
+    a = df.loc['600000']
+    assert a['名称'] == '测试'
+    np.testing.assert_allclose([a['价差'], a['中间价']], [0.01, 10.005])
+    # 买一300、卖一100，微观价格靠近卖一
+    np.testing.assert_allclose(a['微观价格'], (10.01 * 300 + 10.0 * 100) / 400)
+    np.testing.assert_allclose(a['挂单不平衡度'], (700 - 500) / 1200)
+    b = df.loc['000001']
+    assert np.isnan(b['价差']) and np.isnan(b['中间价']) and b['挂单不平衡度'] == 1
+    assert list(poller.to_frame().columns[:2]) == ['名称', '时间']
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from qstock.stock.ta_pool import parse_ta, streak, ta_pool, ta_signals
+
+
+def sample_bars(seed=0):
+    rnd = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-01', periods=60)
+    close = pd.DataFrame(10 * np.cumprod(1 + rnd.normal(0, 0.03, (len(dates), 4)), axis=0),
+                         index=pd.DatetimeIndex(dates, name='date'), columns=['A', 'B', 'C', 'D'])
+    volume = pd.DataFrame(rnd.integers(1000, 2000, close.shape).astype(float), index=close.index,
+                          columns=close.columns)
+    # D较晚上市
+    close.iloc[:25, 3] = volume.iloc[:25, 3] = np.nan
+    frames = [pd.DataFrame({'code': code, 'close': close[code], 'volume': volume[code]}).dropna()
+              for code in close.columns]
+    return pd.concat(frames), close, volume
+
+
+def test_streak():
+    cond = np.array([[1, 0], [1, 1], [0, 1], [1, 1], [1, 0], [1, 1]], dtype=bool)
+    np.testing.assert_array_equal(streak(cond), [[1, 0], [2, 1], [0, 2], [1, 3], [2, 0], [3, 1]])
+
+
+def test_new_high_matches_loop():
+    bars, close, _ = sample_bars()
+    signal = ta_signals(bars, '创月新高')
+    for code in close.columns:
+        s = close[code].to_numpy()
+        expected = [i >= 20 and not np.isnan(s[i - 20:i]).any() and s[i] > s[i - 20:i].max()
+                    for i in range(len(s))]
+        assert list(signal[code]) == expected, code
+    # 历史新高从上市第二天开始比较
+    signal = ta_signals(bars, '历史新低')
+    d = close['D'].to_numpy()
+    assert list(signal['D'].iloc[26:]) == [d[i] < np.nanmin(d[25:i]) for i in range(26, len(d))]
+
+
+def test_ma_cross_matches_loop():
+    bars, close, _ = sample_bars(1)
+    up, down = ta_signals(bars, 'u5'), ta_signals(bars, 'd5')
+    ma = close.rolling(5).mean()
+    for code in close.columns:
+        c, m = close[code].to_numpy(), ma[code].to_numpy()
+        for i in range(1, len(c)):
+            valid = not np.isnan(m[i]) and not np.isnan(m[i - 1])
+            assert up[code].iloc[i] == (valid and c[i] > m[i] and not c[i - 1] > m[i - 1])
+            assert down[code].iloc[i] == (valid and not c[i] > m[i] and c[i - 1] > m[i - 1])
+    assert not up.iloc[0].any()
+
+
+def test_pool_on_date():
+    bars, close, volume = sample_bars(8)
+    date = close.index[32]
+    df = ta_pool(bars, 'lxsz', date=date, min_days=2)
+    assert len(df) == 2 and (df['日期'] == date).all()
+    for _, row in df.iterrows():
+        c = close[row['代码']].loc[:date].to_numpy()
+        days = int(row['天数'])
+        assert days >= 2 and (np.diff(c[-days - 1:]) > 0).all() and not c[-days - 1] > c[-days - 2]
+        np.testing.assert_allclose(row['阶段涨跌幅'], (c[-1] / c[-days - 1] - 1) * 100)
+    expected = [code for code in close.columns if (close[code].loc[:date].diff().iloc[-2:] > 0).all()]
+    assert sorted(df['代码']) == sorted(expected)
+    df = ta_pool(bars, '量价齐升', min_days=1)
+    assert len(df) == 2
+    last = close.index[-1]
+    up = (close.diff().loc[last] > 0) & (volume.diff().loc[last] > 0)
+    assert sorted(df['代码']) == sorted(up.index[up])
+
+
+def test_parse_ta():
+    assert parse_ta('一年新高') == ('新高', 250)
+    assert parse_ta('u20') == ('上穿均线', 20)
+    assert parse_ta('cxsl') == ('持续缩量', None)
+    try:
+        parse_ta('三年新高')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('不支持的形态应当报错')
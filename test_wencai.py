@@ -0,0 +1,47 @@
+import importlib
+import threading
+import warnings
+
+wencai_module = importlib.import_module('qstock.data.wencai')
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    '''第一页返回350条中的100条；第2页第一次返回不完整的结果，第4页一直失败'''
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def post_result(self, url, data=None, source=None, force_cookies=False):
+        if 'question' in data:
+            component = {'cid': 'c', 'puuid': 'p',
+                         'data': {'datas': [{'code': f'1-{i}'} for i in range(100)],
+                                  'meta': {'extra': {'row_count': 350}, 'logid': 'l'}}}
+            return Response({'data': {'answer': [{'txt': [{'content': {'components': [component]}}]}]}})
+        page = data['page']
+        with self.lock:
+            self.calls.append((page, force_cookies))
+        if page == 4 or (page == 2 and not force_cookies):
+            return Response({'answer': {}})
+        return Response({'answer': {'components': [{'data': {'datas': [{'code': f'{page}-{i}'}
+                                                                      for i in range(100)]}}]}})
+
+
+def test_failed_pages_are_retried_and_reported(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(wencai_module, 'get_session', lambda: session)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        df = wencai_module.wencai('均线多头排列')
+    # 第2页重试时重新生成hexin-v后成功，第4页重试后仍失败
+    assert sorted(session.calls) == [(2, False), (2, True), (3, False), (4, False), (4, True), (4, True)]
+    assert len(df) == 300
+    assert [str(w.message) for w in caught] == ['问财结果第[4]页获取失败，返回的结果不完整']